@@ -1,5 +1,5 @@
 const LotValidateConfig = require('../../../models/dejtnf/lotValidateConfig');
-const { checkQueryString, getItems } = require('../../../middleware/db');
+const { checkQueryString, getItems, setListValidators } = require('../../../middleware/db');
 const { handleError } = require('../../../middleware/utils');
 
 /**
@@ -10,6 +10,10 @@ const { handleError } = require('../../../middleware/utils');
 const getLotValidateConfigs = async (req, res) => {
     try {
         const query = await checkQueryString(req.query);
+        // unchanged since the client fetched it, documents are not loaded
+        if (await setListValidators(req, res, LotValidateConfig, query)) {
+            return res.status(304).end();
+        }
         res.status(200).json(await getItems(req, LotValidateConfig, query));
     } catch (error) {
         handleError(res, error);
@@ -1,5 +1,5 @@
 const SecsgemEquipment = require('../../../models/dejtnf/secsgemEquipment');
-const { checkQueryString, getItems } = require('../../../middleware/db');
+const { checkQueryString, getItems, setListValidators } = require('../../../middleware/db');
 const { handleError } = require('../../../middleware/utils');
 
 /**
@@ -11,6 +11,10 @@ const { handleError } = require('../../../middleware/utils');
 const getSecsgemEquipments = async (req, res) => {
     try {
         const query = await checkQueryString(req.query);
+        // unchanged since the client fetched it, documents are not loaded
+        if (await setListValidators(req, res, SecsgemEquipment, query)) {
+            return res.status(304).end();
+        }
         res.status(200).json(await getItems(req, SecsgemEquipment, query));
     } catch (error) {
         handleError(res, error);
@@ -6,6 +6,7 @@ const { deleteItem } = require('./deleteItem')
 const { getItem } = require('./getItem')
 const { getItems } = require('./getItems')
 const { listInitOptions } = require('./listInitOptions')
+const { setListValidators } = require('./setListValidators')
 const { updateItem } = require('./updateItem')
 
 module.exports = {
@@ -17,5 +18,6 @@ module.exports = {
   getItem,
   getItems,
   listInitOptions,
+  setListValidators,
   updateItem
 }
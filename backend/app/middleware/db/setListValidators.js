@@ -0,0 +1,36 @@
+const crypto = require('crypto')
+const { buildErrObject } = require('../../middleware/utils')
+
+/**
+ * Sets ETag and Last-Modified of a list query from the number of matching
+ * documents and their latest updatedAt, without loading the documents.
+ * Returns true when the client copy is still fresh and a 304 can be sent
+ * @param {Object} req - request object
+ * @param {Object} res - response object
+ * @param {Object} model - model with timestamps
+ * @param {Object} query - query object
+ */
+const setListValidators = async (req = {}, res = {}, model = {}, query = {}) => {
+  try {
+    const [count, latest] = await Promise.all([
+      model.countDocuments(query),
+      model.findOne(query, { updatedAt: 1 }).sort({ updatedAt: -1 }).lean()
+    ])
+    const lastModified =
+      latest && latest.updatedAt ? new Date(latest.updatedAt) : new Date(0)
+    const hash = crypto
+      .createHash('sha1')
+      .update(JSON.stringify(req.query || {}))
+      .update(`${count}-${lastModified.getTime()}`)
+      .digest('base64')
+    res.set('ETag', `W/"${hash}"`)
+    res.set('Last-Modified', lastModified.toUTCString())
+    // clients may keep the list but must revalidate it
+    res.set('Cache-Control', 'no-cache')
+    return req.fresh
+  } catch (error) {
+    throw buildErrObject(422, error.message)
+  }
+}
+
+module.exports = { setListValidators }
@@ -1,9 +1,212 @@
 # Mqtt
 MQTT_ENABLE = True
-MQTT_SUBSCRIBE_TOPIC = ["equipments/control/#", "equipments/config/#"]
+MQTT_SUBSCRIBE_TOPIC = ["equipments/control/#", "equipments/config/#", "dejtnf/control/#"]
+# SecsControl commands accepted on equipments/control/<equipment_name>/<command>,
+# the topics are not authenticated, add changing commands only on a protected broker
+MQTT_CONTROL_COMMANDS = (
+    "get_equipment_status", "get_control_state", "get_process_state", "get_process_program",
+    "get_state_changes", "get_transaction_stats", "get_event_stats", "select_equipment_status_request",
+    "status_variable_namelist_request", "data_variable_namelist_request",
+    "collection_event_namelist_request", "equipment_constant_request",
+    "equipment_constant_namelist_request", "alarms_list", "pp_list",
+)
+
+# SECS transactions
+# max number of open primary/secondary transactions per equipment,
+# can be overridden per equipment with "transaction_window"
+SECS_TRANSACTION_WINDOW = 4
+# priority class of primary messages waiting for a transaction slot, lower is sent first:
+# 0 critical (lot accept/reject, recipe select), 1 high (communication, reports, recipe transfer),
+# 2 normal (default), 3 bulk (status polls and namelists)
+SECS_SEND_PRIORITY = {
+    "S2F41": 0, "S2F49": 0,
+    "S1F13": 1, "S1F15": 1, "S1F17": 1, "S2F33": 1, "S2F35": 1, "S2F37": 1,
+    "S7F1": 1, "S7F3": 1, "S7F5": 1, "S7F17": 1,
+    "S1F3": 3, "S1F11": 3, "S1F21": 3, "S1F23": 3, "S2F13": 3, "S2F29": 3,
+    "S5F5": 3, "S5F7": 3, "S7F19": 3,
+}
+SECS_SEND_DEFAULT_PRIORITY = 2
+
+# SECS transaction statistics
+# seconds from which a transaction goes to the slow transaction log, 0 = only T3 timeouts
+TRANSACTION_SLOW_THRESHOLD = 2.0
+TRANSACTION_SLOW_LOG_PATH = "logs/transaction/slow.log"
+# slow transactions kept in memory per equipment
+TRANSACTION_SLOW_LOG_SIZE = 100
+# latest round trips kept per equipment and SxFy for the percentiles
+TRANSACTION_STATS_WINDOW = 200
+
+# Adaptive reply timeout
+# reply deadline per equipment and SxFy learned from its round trips:
+# ADAPTIVE_T3_FACTOR * (smoothed round trip + 4 * variation), within ADAPTIVE_T3_MIN and
+# ADAPTIVE_T3_MAX seconds, T3 until ADAPTIVE_T3_MIN_SAMPLES replies were received
+# off by default, with it a reply slower than the learned deadline is discarded
+ADAPTIVE_T3_ENABLE = False
+ADAPTIVE_T3_MIN = 3.0
+ADAPTIVE_T3_MAX = 45.0
+ADAPTIVE_T3_FACTOR = 3.0
+ADAPTIVE_T3_MIN_SAMPLES = 10
+# consecutive timeouts after which the link is degraded: requests fail at once except
+# one probe every ADAPTIVE_T3_PROBE_INTERVAL seconds until a reply arrives, 0 = never fail fast
+ADAPTIVE_T3_DEGRADED_AFTER = 3
+ADAPTIVE_T3_PROBE_INTERVAL = 10.0
+# commands the equipment may execute although the reply is late, always T3 and never failed fast
+ADAPTIVE_T3_EXEMPT = ("S2F15", "S2F41", "S2F49", "S7F3", "S7F17")
+
+# SECS message archive
+# raw HSMS frames of every equipment, read with src.archive.frame_archive.FrameArchiveReader
+SECS_ARCHIVE_ENABLE = True
+SECS_ARCHIVE_DIR = "logs/archive"
+# records between entries of the sparse time index
+SECS_ARCHIVE_INDEX_EVERY = 64
+# seconds buffered frames may wait before written to disk
+SECS_ARCHIVE_FLUSH_INTERVAL = 1.0
+# days of archive files kept per equipment, 0 = no limit
+SECS_ARCHIVE_MAX_DAYS = 30
+# bytes of archive files kept per equipment, oldest days are deleted first, 0 = no limit
+SECS_ARCHIVE_MAX_BYTES = 1024 ** 3
+# human readable communication log in logs/gem/<ip>, slow on busy equipments,
+# off while the archive keeps the traffic
+COMMUNICATION_TEXT_LOG = not SECS_ARCHIVE_ENABLE
+
+# Host process sharding
+# number of worker processes running equipment sessions, 1 = single process
+HOST_SHARDS = 1
+# seconds to wait before restarting a failed shard
+HOST_SHARD_RESTART_DELAY = 5
+# seconds a CLI or MQTT command waits for the reply of its shard, three default T3 (45 s)
+# as a command may run several transactions
+HOST_SHARD_REQUEST_TIMEOUT = 3 * 45
+
+# Host cluster
+# share the equipment list between host nodes, each equipment runs on the node holding its lease
+CLUSTER_ENABLE = False
+# lease store "mqtt" (retained topics on the broker) or "file" (CLUSTER_LEASE_FILE, nodes on one machine)
+CLUSTER_LEASE_STORE = "mqtt"
+CLUSTER_LEASE_FILE = "data/cluster_leases.json"
+# node id, empty = <hostname>-<pid>
+CLUSTER_NODE_ID = ""
+# seconds a lease or node heartbeat stays valid without renewal
+CLUSTER_LEASE_TTL = 15
+# seconds between heartbeat/rebalance rounds, must be well below CLUSTER_LEASE_TTL
+CLUSTER_INTERVAL = 5
+
+# Lot validation API cache
+# seconds a lot information response is reused, 0 = always fetch (lot status must be current)
+LOT_INFO_CACHE_TTL = 0
+# seconds an equipment validate config response is reused, 0 = always fetch
+EQUIPMENT_CONFIG_CACHE_TTL = 0
+
+# Lot validate configuration store
+# last known validate config of every equipment in SQLite (VALIDATE_CONFIG_DB_PATH), lot validation
+# reads it instead of the API and keeps working while the API is unreachable
+VALIDATE_CONFIG_STORE_ENABLE = True
+# seconds between syncs of the store with the API
+VALIDATE_CONFIG_SYNC_INTERVAL = 60
+# validate configs per page of /validate/configs
+VALIDATE_CONFIG_API_PAGE_SIZE = 100
+
+# Console output of hosts and managers when main.py runs without a terminal: quiet (headless services,
+# messages are logged anyway) or console. The interactive CLI always uses console, shard workers quiet
+OUTPUT_SINK = "quiet"
+
+# Equipment state
+# changes kept per equipment for "changes since version" queries
+EQUIPMENT_STATE_JOURNAL_SIZE = 256
+# seconds a status value served by get_equipment_status stays valid
+# without reading it again from the equipment, None = until the connection closes
+EQUIPMENT_STATUS_MAX_AGE = None
+
+# Warm start
+# last known state of each equipment saved to STATE_SNAPSHOT_DIR and restored at startup,
+# restored values are reported stale until the equipment confirms them
+# and retained status topics are kept when the host shuts down
+STATE_SNAPSHOT_ENABLE = True
+STATE_SNAPSHOT_INTERVAL = 10
+# seconds after which a snapshot is too old to restore, 0 = no limit
+STATE_SNAPSHOT_MAX_AGE = 86400
+
+# Fleet status, retained <topic>/snapshot/<node> and <topic>/delta/<node> in between
+FLEET_STATUS_ENABLE = True
+FLEET_STATUS_TOPIC = "equipments/fleet"
+FLEET_SNAPSHOT_INTERVAL = 30
+FLEET_DELTA_INTERVAL = 1.0
+
+# Event enablement on connect
+# "unchanged" = keep the equipment setting, "minimal" = enable only the CEIDs the host handles,
+# other events are then neither streamed by AsyncSecsGemHost.events() nor archived
+EVENT_ENABLE_POLICY = "unchanged"
+# CEIDs to keep enabled besides the handled ones by model, e.g. {"FCL": [3, 4]}
+EVENT_ENABLE_EXTRA = {}
+# disable an unhandled CEID on the equipment when it is received, while no event listener is registered
+EVENT_DISABLE_UNHANDLED = False
+
+# Reconnect
+# max seconds of random delay added to T5 before an equipment reconnects
+RECONNECT_JITTER = 10
+# equipments running initial synchronization at once, the others wait by sync_priority
+RECONNECT_SYNC_CONCURRENCY = 8
+RECONNECT_DEFAULT_PRIORITY = 100
+RECONNECT_PROGRESS_TOPIC = "equipments/fleet/reconnect"
+RECONNECT_PROGRESS_INTERVAL = 1.0
+
+# Equipment list reconciliation
+# seconds between conditional fetches of the equipment list from the API, added, removed and
+# changed equipments are applied without restart, 0 = only on dejtnf/control/equipments/reload
+EQUIPMENT_RECONCILE_INTERVAL = 60
+# equipments per page of /secsgem/equipments
+EQUIPMENT_API_PAGE_SIZE = 100
+
+# Shutdown
+# seconds to disable all equipments at once and flush MQTT publishes and log queues on exit,
+# equipments not closed by then are reported
+SHUTDOWN_TIMEOUT = 15
+# equipments disabled at the same time
+SHUTDOWN_CONCURRENCY = 64
+
+# Logging
+# records waiting for the log writer thread, further records are dropped
+LOG_QUEUE_SIZE = 10000
+# records per second per call site below ERROR, 0 = no limit
+LOG_RATE_LIMIT = 20
+LOG_RATE_BURST = 100
+# keep 1 of every N records of "<module>.<function>" below ERROR
+LOG_SAMPLING = {
+    "handler_message.on_message": 10,
+    "mqtt_client.publish": 10,
+}
+# seconds between checks that the log file was not deleted
+LOG_FILE_CHECK_INTERVAL = 5
+
+# Metrics
+# collect SECS, MQTT and HTTP API metrics, see src/metrics
+METRICS_ENABLE = True
+# GET /metrics (Prometheus text) and /metrics.json, 0 = no endpoint,
+# shard processes listen on METRICS_HTTP_PORT + shard index + 1
+METRICS_HTTP_ADDRESS = "0.0.0.0"
+METRICS_HTTP_PORT = 9100
+# json snapshot published to <METRICS_MQTT_TOPIC>/<node> every interval seconds, 0 = off
+METRICS_MQTT_TOPIC = "dejtnf/metrics"
+METRICS_MQTT_INTERVAL = 30
+
+# Runtime profiling
+# reports of the sampling profiler, thread dumps and tracemalloc snapshots
+PROFILE_DIR = "logs/profile"
+# seconds between stack samples of all threads
+PROFILE_SAMPLE_INTERVAL = 0.01
+# longest sampling run
+PROFILE_MAX_SECONDS = 300
+# stack frames stored per traced allocation
+TRACEMALLOC_FRAMES = 10
 
 # File paths
 EQUIPMENTS_CONFIG_PATH = "config/equipment_config.json"
 LOT_INFO_PATH = ""
 VALIDATE_EQUIPMENT_CONFIG_PATH = ""
 RECIPE_DIR = "recipes"
+# report definitions applied on each equipment, <dir>/<equipment_name>.json
+EVENT_REPORT_PLAN_DIR = "config/event_report_plans"
+# last known state of each equipment, <dir>/<equipment_name>.json
+STATE_SNAPSHOT_DIR = "data/state_snapshots"
+# last known lot validate configuration of every equipment
+VALIDATE_CONFIG_DB_PATH = "data/validate_config.db"
@@ -1,20 +1,146 @@
+import atexit
 import datetime
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
+import weakref
+
+from config.app_config import (LOG_FILE_CHECK_INTERVAL, LOG_QUEUE_SIZE, LOG_RATE_BURST,
+                               LOG_RATE_LIMIT, LOG_SAMPLING)
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    Non blocking handler, records are written by a listener thread.
+    Records are dropped and counted when the queue is full.
+    The message is merged with its args on the logging thread (QueueHandler.prepare),
+    arguments changed after the call are not seen by the listener.
+    """
+
+    def __init__(self, handlers: list[logging.Handler], maxsize: int = LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(
+            self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        _queue_handlers.add(self)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write the queued records and stop the listener thread"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Wait until the listener wrote every queued record, logging goes on
+        :return: False if records are still queued after timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        # the listener marks each record done after its handlers ran
+        while self.queue.unfinished_tasks and self.listener._thread is not None:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        for handler in self.listener.handlers:
+            handler.flush()
+        return True
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handlers: "weakref.WeakSet[QueueLogHandler]" = weakref.WeakSet()
+
+
+def drain_log_queues(timeout: float) -> bool:
+    """
+    Wait until every QueueLogHandler wrote its queued records
+    :param timeout: seconds for all queues together
+    :return: False if records are still queued
+    """
+    deadline = time.monotonic() + timeout
+    return all([handler.drain(max(0.0, deadline - time.monotonic())) for handler in list(_queue_handlers)])
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per call site (file and line) token bucket and 1 in N sampling.
+    Errors always pass, the next passing record of a call site reports how many were suppressed.
+    """
+
+    def __init__(self, rate: float = LOG_RATE_LIMIT, burst: int = LOG_RATE_BURST, sampling: dict = None):
+        """
+        :param rate: records per second per call site, 0 = no limit
+        :param burst: records a call site may log at once
+        :param sampling: "<module>.<function>" to keep 1 of every N records
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sampling = LOG_SAMPLING if sampling is None else sampling
+        self._lock = threading.Lock()
+        # call site: [tokens, last update, suppressed, seen]
+        self._sites: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        every = self.sampling.get(f"{record.module}.{record.funcName}")
+        if not self.rate and not every:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self._sites[(record.pathname, record.lineno)] = [
+                    self.burst, now, 0, 0]
+            site[3] += 1
+            if every and (site[3] - 1) % every:
+                site[2] += 1
+                return False
+            if self.rate:
+                site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+                site[1] = now
+                if site[0] < 1:
+                    site[2] += 1
+                    return False
+                site[0] -= 1
+            suppressed, site[2] = site[2], 0
+
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} suppressed]"
+        return True
 
 
 class AppLogger:
     # Custom file handler that recreates log files if deleted during runtime
     class CustomFileHandler(logging.FileHandler):
+        # seconds between checks that the log file still exists
+        check_interval = LOG_FILE_CHECK_INTERVAL
+        _next_check = 0.0
+
         def emit(self, record):
             try:
-                # Check if the log file still exists
-                if not os.path.exists(self.baseFilename):
-                    # Create the directory if it does not exist
-                    os.makedirs(os.path.dirname(
-                        self.baseFilename), exist_ok=True)
-                    # Reopen the log file
-                    self.stream = self._open()
+                # Check if the log file still exists, at most every check_interval
+                now = time.monotonic()
+                if now >= self._next_check:
+                    self._next_check = now + self.check_interval
+                    if not os.path.exists(self.baseFilename):
+                        # Create the directory if it does not exist
+                        os.makedirs(os.path.dirname(
+                            self.baseFilename), exist_ok=True)
+                        # Reopen the log file
+                        if self.stream:
+                            self.stream.close()
+                        self.stream = self._open()
 
                 # Write the log record
                 super().emit(record)
@@ -29,6 +155,7 @@ class AppLogger:
         self.date = datetime.datetime.now().strftime('%Y-%m-%d')
         self.log_dir = log_dir
         self.log_file = f"app-{self.date}.log"
+        self.queue_handler = None
         self.logger = self.setup_logger()
 
     def setup_logger(self):
@@ -58,8 +185,10 @@ class AppLogger:
         file_handler.setFormatter(formatter)
         # console_handler.setFormatter(formatter) #remove comment to enable console logging
 
-        # Add the handlers to the logger
-        logger.addHandler(file_handler)
+        # Add the handlers to the logger, the file is written by the queue listener thread
+        self.queue_handler = QueueLogHandler([file_handler])
+        self.queue_handler.addFilter(RateLimitFilter())
+        logger.addHandler(self.queue_handler)
         # logger.addHandler(console_handler) #remove comment to enable console logging
 
         # Log a startup message to confirm setup
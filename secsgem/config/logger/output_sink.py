@@ -0,0 +1,98 @@
+import abc
+import sys
+import threading
+from collections import deque
+
+
+class OutputSink(abc.ABC):
+    """
+    Destination of the console messages of hosts, MQTT client and manager.
+    Messages are also logged by the callers, the sink is for people watching the terminal.
+    """
+    # False skips formatting the message, output() arguments are only formatted when written
+    enabled = True
+
+    @abc.abstractmethod
+    def write(self, text: str):
+        """Write one message"""
+
+
+class QuietSink(OutputSink):
+    """Discard messages, for services running without terminal"""
+    enabled = False
+
+    def write(self, text: str):
+        pass
+
+
+class ConsoleSink(OutputSink):
+    """Write messages to stdout, for the interactive CLI"""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, text: str):
+        # messages of different threads are not interleaved
+        with self._lock:
+            stream = self.stream or sys.stdout
+            stream.write(text + "\n")
+            stream.flush()
+
+
+class BufferedSink(OutputSink):
+    """Keep the last messages in memory, for tests and benchmarks"""
+
+    def __init__(self, maxlen: int = 10000):
+        self._lines: deque[str] = deque(maxlen=maxlen)
+
+    def write(self, text: str):
+        self._lines.append(text)
+
+    def lines(self) -> list[str]:
+        """Messages written, oldest first"""
+        return list(self._lines)
+
+    def clear(self):
+        """Remove the kept messages"""
+        self._lines.clear()
+
+
+SINKS = {"quiet": QuietSink, "console": ConsoleSink, "buffered": BufferedSink}
+
+_sink: OutputSink = QuietSink()
+
+
+def create_sink(name: str) -> OutputSink:
+    """
+    Create a sink by name
+    :param name: quiet, console or buffered
+    """
+    if name not in SINKS:
+        raise ValueError(f"Unknown output sink: {name}, use one of {list(SINKS)}")
+    return SINKS[name]()
+
+
+def set_sink(sink: OutputSink) -> OutputSink:
+    """
+    Replace the process wide sink
+    :return: previous sink
+    """
+    global _sink  # pylint: disable=global-statement
+    previous, _sink = _sink, sink
+    return previous
+
+
+def get_sink() -> OutputSink:
+    """Process wide sink"""
+    return _sink
+
+
+def output(message, *args):
+    """
+    Write a message to the process wide sink, replacement of print()
+    :param message: text or object, %-formatted with args like logging, only if the sink is enabled
+    """
+    sink = _sink
+    if sink.enabled:
+        sink.write(str(message) % args if args else str(message))
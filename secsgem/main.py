@@ -1,18 +1,45 @@
 import logging
+import sys
 # from src.manager.host_manager import SecsGemHostManager
 from src.mqtt.mqtt_client import MqttClient
 from config.logger.all_logger import AppLogger
 from src.cli.main_cli import MainCli
+from src.manager.shard_manager import ShardSupervisor
+from src.manager.cluster import ClusterNode, FileLeaseStore, MqttLeaseStore
+from src.metrics.exporter import start_exporters
+from config.logger.output_sink import create_sink, set_sink
+from config.app_config import HOST_SHARDS, CLUSTER_ENABLE, CLUSTER_LEASE_STORE, CLUSTER_LEASE_FILE, CLUSTER_NODE_ID, METRICS_ENABLE, OUTPUT_SINK
 
 app_logger = AppLogger()
 logger = app_logger.get_logger()
 logger.setLevel(logging.INFO)
 
 if __name__ == "__main__":
+    if CLUSTER_ENABLE and HOST_SHARDS > 1:
+        # a cluster node runs its equipments in process, the shards would connect every equipment too
+        logger.error("CLUSTER_ENABLE and HOST_SHARDS > 1 cannot be combined")
+        raise SystemExit("CLUSTER_ENABLE and HOST_SHARDS > 1 cannot be combined, set HOST_SHARDS = 1")
+
+    # add/remove confirmations and validation errors of the CLI only reach the user through the sink
+    set_sink(create_sink("console" if sys.stdin.isatty() else OUTPUT_SINK))
     print("Applicaiton started")
     logger.info("Applicaiton started")
 
     mqtt_client = MqttClient()
 
-    cli = MainCli(mqtt_client)
+    if METRICS_ENABLE:
+        start_exporters(mqtt_client, CLUSTER_NODE_ID or None)
+
+    # share equipments with other host nodes
+    if CLUSTER_ENABLE:
+        lease_store = FileLeaseStore(CLUSTER_LEASE_FILE) if CLUSTER_LEASE_STORE == "file" else MqttLeaseStore(
+            mqtt_client)
+        secs_hosts = ClusterNode(mqtt_client, lease_store, CLUSTER_NODE_ID or None)
+    # run equipment sessions in worker processes
+    elif HOST_SHARDS > 1:
+        secs_hosts = ShardSupervisor(mqtt_client, HOST_SHARDS)
+    else:
+        secs_hosts = None
+
+    cli = MainCli(mqtt_client, secs_hosts)
     cli.cmdloop()
@@ -0,0 +1,375 @@
+import atexit
+import bisect
+import datetime
+import heapq
+import logging
+import os
+import struct
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+import secsgem.hsms
+
+from config.app_config import (SECS_ARCHIVE_DIR, SECS_ARCHIVE_FLUSH_INTERVAL,
+                               SECS_ARCHIVE_INDEX_EVERY, SECS_ARCHIVE_MAX_BYTES,
+                               SECS_ARCHIVE_MAX_DAYS)
+
+logger = logging.getLogger("app_logger")
+
+# <SECS_ARCHIVE_DIR>/<equipment_name>/<YYYY-MM-DD>.hsa, sparse index in <YYYY-MM-DD>.idx
+FILE_MAGIC = b"HSA\x01"
+FILE_SUFFIX = ".hsa"
+INDEX_SUFFIX = ".idx"
+# timestamp, frame length, direction, stream, function, equipment name length
+RECORD = struct.Struct("<dIBBBB")
+# timestamp and file offset of a record
+INDEX_ENTRY = struct.Struct("<dQ")
+
+DIRECTIONS = ("in", "out")
+
+
+@dataclass
+class ArchivedFrame:
+    """
+    One archived HSMS frame
+    """
+    timestamp: float
+    direction: str
+    equipment_name: str
+    stream: int
+    function: int
+    frame: bytes
+
+    @property
+    def name(self) -> str:
+        """SxFy, S0F0 for HSMS control messages (select, linktest, ...)"""
+        return f"S{self.stream}F{self.function}"
+
+    @property
+    def message(self) -> secsgem.hsms.HsmsMessage:
+        """Frame decoded to HsmsMessage"""
+        return secsgem.hsms.HsmsMessage.from_block(secsgem.hsms.HsmsBlock.decode(self.frame))
+
+
+class FrameArchiveWriter:
+    """
+    Append only archive of the raw HSMS frames of one equipment, a file per day.
+    Writes go to a buffered file, flushed every SECS_ARCHIVE_FLUSH_INTERVAL seconds.
+    Old days are deleted when a new day file is opened.
+    """
+
+    def __init__(self, equipment_name: str, directory: str = SECS_ARCHIVE_DIR,
+                 index_every: int = SECS_ARCHIVE_INDEX_EVERY, max_days: int = SECS_ARCHIVE_MAX_DAYS,
+                 max_bytes: int = SECS_ARCHIVE_MAX_BYTES):
+        """
+        :param index_every: records between index entries
+        :param max_days: days of files kept, 0 = no limit
+        :param max_bytes: bytes of files kept, oldest days deleted first, 0 = no limit
+        """
+        self.equipment_name = equipment_name
+        self.directory = os.path.join(directory, equipment_name)
+        self.index_every = max(1, index_every)
+        self.max_days = max_days
+        self.max_bytes = max_bytes
+        self._name = equipment_name.encode("utf-8")[:255]
+        self._lock = threading.Lock()
+        self._file = None
+        self._date: Optional[str] = None
+        self._offset = 0
+        self._unindexed = 0
+        self._index: list[bytes] = []
+        _writers.add(self)
+        _start_flusher()
+
+    def _open(self, date: str):
+        self._close_file()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, date + FILE_SUFFIX)
+        self._recover(path)
+        prune(self.directory, date, self.max_days, self.max_bytes)
+        self._file = open(path, "ab", buffering=64 * 1024)
+        self._offset = self._file.tell()
+        if self._offset == 0:
+            self._file.write(FILE_MAGIC)
+            self._offset = len(FILE_MAGIC)
+        self._date = date
+        # first record after (re)open is always indexed
+        self._unindexed = self.index_every
+
+    def _recover(self, path: str):
+        """
+        Truncate a partial record left by a crash at the end of an archive file and
+        the index entries past it, records appended after it would be unreadable
+        """
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        index_path = path[:-len(FILE_SUFFIX)] + INDEX_SUFFIX
+        with open(path, "r+b") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                if size:
+                    os.replace(path, path + ".corrupt")
+                    logger.error("Archive file %s is not an archive, moved to %s.corrupt", path, path)
+                return
+            # records before the last index entry were complete when it was written
+            f.seek(_last_indexed_offset(index_path, size))
+            end = f.tell()
+            while True:
+                record = f.read(RECORD.size)
+                if len(record) < RECORD.size:
+                    break
+                _, length, direction_index, _, _, name_length = RECORD.unpack(record)
+                # a frame is a 4 byte length and a 10 byte header at least
+                if (direction_index >= len(DIRECTIONS) or length < 14
+                        or end + RECORD.size + name_length + length > size):
+                    break
+                f.seek(name_length, os.SEEK_CUR)
+                if struct.unpack(">I", f.read(4))[0] != length - 4:
+                    break
+                f.seek(length - 4, os.SEEK_CUR)
+                end = f.tell()
+            if end < size:
+                logger.warning("Archive file %s ends with a partial record, truncated %s bytes",
+                               path, size - end)
+                f.truncate(end)
+        if os.path.exists(index_path):
+            with open(index_path, "r+b") as f:
+                data = f.read()
+                keep = 0
+                for position in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+                    if INDEX_ENTRY.unpack_from(data, position)[1] >= end:
+                        break
+                    keep = position + INDEX_ENTRY.size
+                if keep < len(data):
+                    f.truncate(keep)
+
+    def write(self, direction: str, message: secsgem.hsms.HsmsMessage, timestamp: float = None):
+        """
+        Append a frame
+        :param direction: "in" received from or "out" sent to equipment
+        """
+        frame = message.blocks[0].encode()
+        header = message.header
+        try:
+            with self._lock:
+                # taken under the lock, records are in time order
+                timestamp = time.time() if timestamp is None else timestamp
+                date = datetime.date.fromtimestamp(timestamp).isoformat()
+                if date != self._date:
+                    self._open(date)
+                if self._unindexed >= self.index_every:
+                    self._index.append(
+                        INDEX_ENTRY.pack(timestamp, self._offset))
+                    self._unindexed = 0
+                record = RECORD.pack(timestamp, len(frame), DIRECTIONS.index(direction),
+                                     header.stream, header.function, len(self._name))
+                self._file.write(record + self._name + frame)
+                self._offset += len(record) + len(self._name) + len(frame)
+                self._unindexed += 1
+        except OSError as e:
+            logger.error("Archive write failed: %s, %s",
+                         self.equipment_name, e)
+
+    def flush(self):
+        """Write buffered frames, then their index entries"""
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.flush()
+                if self._index:
+                    with open(os.path.join(self.directory, self._date + INDEX_SUFFIX), "ab") as f:
+                        f.write(b"".join(self._index))
+                    self._index.clear()
+            except OSError as e:
+                logger.error("Archive flush failed: %s, %s",
+                             self.equipment_name, e)
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._index:
+            with open(os.path.join(self.directory, self._date + INDEX_SUFFIX), "ab") as f:
+                f.write(b"".join(self._index))
+            self._index.clear()
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        """Flush and close the current file"""
+        with self._lock:
+            self._close_file()
+        _writers.discard(self)
+
+
+def prune(directory: str, today: str, max_days: int, max_bytes: int) -> list[str]:
+    """
+    Delete the archive files of one equipment older than max_days, then the oldest days
+    until all files fit in max_bytes, the files of today are kept
+    :param today: YYYY-MM-DD of the file being written
+    :return: days deleted
+    """
+    days: dict[str, list[str]] = {}
+    size = 0
+    for name in os.listdir(directory):
+        if not name.endswith((FILE_SUFFIX, INDEX_SUFFIX, ".corrupt")):
+            continue
+        path = os.path.join(directory, name)
+        size += os.path.getsize(path)
+        day = name.split(".", 1)[0]
+        if day != today:
+            days.setdefault(day, []).append(path)
+    first = (datetime.date.fromisoformat(today)
+             - datetime.timedelta(days=max_days - 1)).isoformat() if max_days else ""
+    deleted = []
+    for day in sorted(days):
+        if day >= first and (not max_bytes or size <= max_bytes):
+            break
+        for path in days[day]:
+            try:
+                size -= os.path.getsize(path)
+                os.remove(path)
+            except OSError as e:
+                logger.error("Archive prune failed: %s, %s", path, e)
+        deleted.append(day)
+    if deleted:
+        logger.info("Archive %s: deleted days %s", directory, deleted)
+    return deleted
+
+
+def _last_indexed_offset(index_path: str, size: int) -> int:
+    """Offset of the last index entry inside an archive file of size bytes, else the first record"""
+    offset = len(FILE_MAGIC)
+    try:
+        with open(index_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return offset
+    for position in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+        entry_offset = INDEX_ENTRY.unpack_from(data, position)[1]
+        if entry_offset >= size:
+            break
+        offset = max(offset, entry_offset)
+    return offset
+
+
+_writers: "weakref.WeakSet[FrameArchiveWriter]" = weakref.WeakSet()
+_flusher: Optional[threading.Thread] = None
+
+
+def _start_flusher():
+    global _flusher  # pylint: disable=global-statement
+    if _flusher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(SECS_ARCHIVE_FLUSH_INTERVAL)
+            for writer in list(_writers):
+                writer.flush()
+
+    _flusher = threading.Thread(target=run, name="archive-flusher", daemon=True)
+    _flusher.start()
+
+
+@atexit.register
+def close_all():
+    """Flush and close every open archive"""
+    for writer in list(_writers):
+        writer.close()
+
+
+class FrameArchiveReader:
+    """
+    Query archived frames by equipment, time window, SxFy and direction
+    """
+
+    def __init__(self, directory: str = SECS_ARCHIVE_DIR):
+        self.directory = directory
+
+    def equipments(self) -> list[str]:
+        """Archived equipment names"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def files(self, equipment_name: str, start: float = None, end: float = None) -> list[str]:
+        """Archive files of an equipment overlapping the time window, oldest first"""
+        directory = os.path.join(self.directory, equipment_name)
+        if not os.path.isdir(directory):
+            return []
+        first = datetime.date.fromtimestamp(start).isoformat() if start else ""
+        last = datetime.date.fromtimestamp(end).isoformat() if end else "9999"
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.endswith(FILE_SUFFIX) and first <= name[:-len(FILE_SUFFIX)] <= last]
+
+    @staticmethod
+    def _seek_offset(path: str, start: Optional[float]) -> int:
+        """Offset of the last indexed record before start, file start without index"""
+        offset = len(FILE_MAGIC)
+        index_path = path[:-len(FILE_SUFFIX)] + INDEX_SUFFIX
+        if start is None or not os.path.exists(index_path):
+            return offset
+        with open(index_path, "rb") as f:
+            data = f.read()
+        entries = [INDEX_ENTRY.unpack_from(data, position)
+                   for position in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+        position = bisect.bisect_right(
+            [timestamp for timestamp, _ in entries], start) - 1
+        return entries[position][1] if position >= 0 else offset
+
+    def read_file(self, path: str, start: float = None, end: float = None, names: set = None,
+                  direction: str = None) -> Iterator[ArchivedFrame]:
+        """
+        Frames of one archive file, records are in write order
+        :param names: SxFy names to return, None = all
+        """
+        with open(path, "rb") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                logger.error("Not an archive file: %s", path)
+                return
+            f.seek(self._seek_offset(path, start))
+            while True:
+                record = f.read(RECORD.size)
+                if len(record) < RECORD.size:
+                    return
+                timestamp, length, direction_index, stream, function, name_length = RECORD.unpack(
+                    record)
+                if end is not None and timestamp > end:
+                    return
+                if (start is not None and timestamp < start) \
+                        or (direction is not None and DIRECTIONS[direction_index] != direction) \
+                        or (names is not None and f"S{stream}F{function}" not in names):
+                    f.seek(name_length + length, os.SEEK_CUR)
+                    continue
+                name = f.read(name_length)
+                frame = f.read(length)
+                if len(frame) < length:
+                    # partially written last record
+                    return
+                yield ArchivedFrame(timestamp, DIRECTIONS[direction_index], name.decode("utf-8"),
+                                    stream, function, frame)
+
+    def read(self, equipment_names: Iterable[str] = None, start: float = None, end: float = None,
+             sf: Iterable[str] = None, direction: str = None) -> Iterator[ArchivedFrame]:
+        """
+        Frames of several equipments in time order
+        :param equipment_names: None = all archived equipments
+        :param start: epoch seconds, None = from the beginning
+        :param end: epoch seconds, None = to the end
+        :param sf: SxFy names e.g. ["S6F11", "S5F1"], None = all
+        :param direction: "in", "out" or None = both
+        """
+        names = {name.upper() for name in sf} if sf else None
+        streams = []
+        for equipment_name in equipment_names or self.equipments():
+            files = self.files(equipment_name, start, end)
+            streams.append(frame for path in files
+                           for frame in self.read_file(path, start, end, names, direction))
+        return heapq.merge(*streams, key=lambda frame: frame.timestamp)
@@ -0,0 +1,155 @@
+import argparse
+import datetime
+import json
+import logging
+import time
+from collections import Counter
+from typing import Iterable
+
+import secsgem.hsms
+
+from config.app_config import EQUIPMENTS_CONFIG_PATH, SECS_ARCHIVE_DIR
+from src.archive.frame_archive import ArchivedFrame, FrameArchiveReader
+from src.host.gemhost import SecsGemHost
+from src.metrics.collectors import stream_function_name
+from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+
+class ReplayHost(SecsGemHost):
+    """
+    SecsGemHost without equipment connection, receives archived events.
+    Messages the handlers send are counted and answered with no reply.
+    Starts from an empty state, never from the snapshot of the live equipment.
+    """
+    archive_frames = False
+    restore_state = False
+
+    def __init__(self, equipment_name: str, equipment_model: str, mqtt_client: MqttClient):
+        settings = secsgem.hsms.HsmsSettings(
+            address="127.0.0.1", port=0, session_id=0,
+            connect_mode=secsgem.hsms.HsmsConnectMode.PASSIVE)
+        super().__init__(equipment_name, equipment_model, False, mqtt_client, settings)
+        self.sent: Counter = Counter()
+
+    def send_and_waitfor_response(self, function, priority: int = None):
+        self.sent[stream_function_name(function)] += 1
+        return None
+
+    def send_response(self, function, system):
+        self.sent[stream_function_name(function)] += 1
+        return True
+
+    def send_stream_function(self, function):
+        self.sent[stream_function_name(function)] += 1
+        return True
+
+
+def equipment_models(path: str = EQUIPMENTS_CONFIG_PATH) -> dict[str, str]:
+    """Equipment model by name from the saved equipment list"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {equipment["equipment_name"]: equipment["equipment_model"]
+                    for equipment in json.load(f).get("equipments", [])}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def replay(frames: Iterable[ArchivedFrame], mqtt_client: MqttClient, default_model: str = "FCL",
+           speed: float = 0.0) -> dict:
+    """
+    Feed archived S6F11 event reports into HandlerEvent of a ReplayHost per equipment
+    :param speed: 0 = as fast as possible, 1 = recorded pace, 10 = ten times faster
+    :return: counts and per event processing time
+    """
+    models = equipment_models()
+    hosts: dict[str, ReplayHost] = {}
+    durations = []
+    first_timestamp = None
+    started = time.monotonic()
+
+    for frame in frames:
+        if frame.direction != "in" or frame.name != "S6F11":
+            continue
+        if speed > 0:
+            if first_timestamp is None:
+                first_timestamp = frame.timestamp
+            delay = (frame.timestamp - first_timestamp) / \
+                speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+        host = hosts.get(frame.equipment_name)
+        if host is None:
+            host = hosts[frame.equipment_name] = ReplayHost(
+                frame.equipment_name, models.get(frame.equipment_name, default_model), mqtt_client)
+        begin = time.monotonic()
+        host.handler_event.receive_event(host, frame.message)
+        durations.append(time.monotonic() - begin)
+
+    elapsed = time.monotonic() - started
+    durations.sort()
+
+    def percentile(q: float) -> float:
+        if not durations:
+            return 0.0
+        return round(durations[min(len(durations) - 1, int(q * len(durations)))] * 1000, 3)
+
+    sent = Counter()
+    for host in hosts.values():
+        sent.update(host.sent)
+    return {"events": len(durations), "equipments": sorted(hosts), "seconds": round(elapsed, 3),
+            "events_per_second": round(len(durations) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99),
+            "max_ms": round(durations[-1] * 1000, 3) if durations else 0.0,
+            "sent": dict(sent)}
+
+
+def _timestamp(value: str):
+    return datetime.datetime.fromisoformat(value).timestamp() if value else None
+
+
+if __name__ == "__main__":
+    # python -m src.archive.replay list --equipment TNF-61 --start "2025-03-01 08:00" --sf S6F11 --decode
+    # python -m src.archive.replay replay --equipment TNF-61 --speed 0
+    parser = argparse.ArgumentParser(
+        description="Query the SECS message archive and replay events into HandlerEvent")
+    parser.add_argument("command", choices=["list", "replay"])
+    parser.add_argument("--dir", default=SECS_ARCHIVE_DIR)
+    parser.add_argument("--equipment", action="append",
+                        help="equipment name, repeatable, default all")
+    parser.add_argument("--start", help="ISO local time e.g. 2025-03-01T08:00")
+    parser.add_argument("--end", help="ISO local time")
+    parser.add_argument("--sf", action="append",
+                        help="list: SxFy e.g. S6F11, repeatable, default all")
+    parser.add_argument("--direction", choices=["in", "out"])
+    parser.add_argument("--decode", action="store_true",
+                        help="list decoded messages")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="replay pace, 0 = as fast as possible, 1 = as recorded")
+    parser.add_argument("--model", default="FCL",
+                        help="model of equipments missing in the equipment list")
+    parser.add_argument("--publish", action="store_true",
+                        help="publish the status topics of replayed equipments to the broker")
+    args = parser.parse_args()
+
+    reader = FrameArchiveReader(args.dir)
+    if args.command == "list":
+        streams_functions = secsgem.hsms.HsmsSettings().streams_functions
+        for archived in reader.read(args.equipment, _timestamp(args.start), _timestamp(args.end),
+                                    args.sf, args.direction):
+            print(f"{datetime.datetime.fromtimestamp(archived.timestamp).isoformat(sep=' ')} "
+                  f"{archived.equipment_name} {archived.direction:<3} {archived.name}")
+            if args.decode and archived.stream:
+                try:
+                    print(streams_functions.decode(archived.message))
+                except Exception as e:
+                    print(f"  decode failed: {e}")
+    else:
+        # status topics of replayed equipments would overwrite the live ones
+        replay_mqtt = MqttClient(subscribe_topics=[], connect=args.publish)
+        events = reader.read(args.equipment, _timestamp(args.start), _timestamp(args.end),
+                             ["S6F11"], "in")
+        print(json.dumps(replay(events, replay_mqtt,
+              args.model, args.speed), indent=4))
@@ -65,11 +65,69 @@ class ControlCli(Cmd):
         """
         print(self.gem_host.secs_control.offline_request())
 
-    def do_status(self, _):
+    def do_status(self, arg: str):
         """
-        Get equipment status
+        Get equipment status, read from the equipment when older than max_age seconds
+        Usage: status [max_age]
+        Sample: status or status 0
         """
-        print(self.gem_host.secs_control.get_equipment_status())
+        if arg.strip():
+            print(self.gem_host.secs_control.get_equipment_status(float(arg)))
+        else:
+            print(self.gem_host.secs_control.get_equipment_status())
+
+    def do_state_changes(self, arg: str):
+        """
+        Equipment state changes since a version, without SECS traffic
+        Usage: state_changes [version] [epoch]
+        Sample: state_changes or state_changes 12 or state_changes 12 3f2a9c1b7d40
+        """
+        args = arg.split()
+        try:
+            version = int(args[0]) if args else -1
+        except ValueError:
+            print("Version must be an integer")
+            return
+        epoch = args[1] if len(args) > 1 else None
+        print(json.dumps(self.gem_host.secs_control.get_state_changes(version, epoch), indent=4))
+
+    def do_transaction_stats(self, arg: str):
+        """
+        SECS transaction round trip statistics by SxFy and slow transactions
+        Usage: transaction_stats [slow] [reset]
+        Sample: transaction_stats or transaction_stats slow reset
+        """
+        args = arg.split()
+        stats = self.gem_host.secs_control.get_transaction_stats(
+            "reset" in args)
+        if not isinstance(stats, dict):
+            print(stats)
+            return
+        print(f"{'SxFy':<8} {'count':>7} {'timeout':>8} {'failed':>7} {'slow':>6} "
+              f"{'avg ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, series in stats["transactions"].items():
+            print(f"{name:<8} {series['count']:>7} {series['timeouts']:>8} {series['failures']:>7} "
+                  f"{series['slow']:>6} {series['avg_ms']:>9} {series['p50_ms']:>9} "
+                  f"{series['p95_ms']:>9} {series['p99_ms']:>9} {series['max_ms']:>9}")
+        if "slow" in args:
+            print(f"Slow transactions (>= {stats['slow_threshold']} s):")
+            for entry in stats["slow_transactions"]:
+                print(json.dumps(entry))
+
+    def do_event_stats(self, arg: str):
+        """
+        Received and unhandled collection events
+        Usage: event_stats [reset]
+        """
+        print(json.dumps(self.gem_host.secs_control.get_event_stats(
+            arg.strip() == "reset"), indent=4))
+
+    def do_event_enable(self, _):
+        """
+        S2F37 Enable only the events the host handles
+        Usage: event_enable
+        """
+        print(self.gem_host.secs_control.apply_event_enable())
 
     def do_get_control_state(self, _):
         """
@@ -257,6 +315,13 @@ class ControlCli(Cmd):
         """
         self.gem_host.secs_control.subscribe_lot_control()
 
+    def do_sync_reports(self, arg: str):
+        """
+        Define only lot control reports missing or changed on the equipment
+        Usage: sync_reports [force]
+        """
+        print(self.gem_host.secs_control.sync_event_reports(arg.strip() == "force"))
+
     # lot management
     def do_accept_lot(self, arg: str):
         """
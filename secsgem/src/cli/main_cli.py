@@ -5,6 +5,7 @@ from src.manager.host_manager import SecsGemHostManager
 
 from src.cli.control.control_cli import ControlCli
 from src.cli.config.config_cli import ConfigCli
+from src.metrics.profiler import profiler
 
 
 class MainCli(Cmd):
@@ -12,13 +13,13 @@ class MainCli(Cmd):
     MainCli class
     """
 
-    def __init__(self, mqtt_client_instant: MqttClient):
+    def __init__(self, mqtt_client_instant: MqttClient, secs_hosts: SecsGemHostManager = None):
         super().__init__()
 
         self.prompt = "dejtnf> "
         # self.intro = "Welcome to the SECsGem CLI. Type help or ? to list commands."
         self.mqtt_client = mqtt_client_instant
-        self.secs_hosts = SecsGemHostManager(self.mqtt_client)
+        self.secs_hosts = secs_hosts or SecsGemHostManager(self.mqtt_client)
 
     def emptyline(self):
         pass
@@ -36,6 +37,15 @@ class MainCli(Cmd):
         """
         print(self.secs_hosts.list_equipments())
 
+    def do_reload(self, _):
+        """
+        Apply changes of the equipment list in the API without restart
+        """
+        if not hasattr(self.secs_hosts, "reload_equipments"):
+            print("Reload is not supported by this manager")
+            return
+        print(self.secs_hosts.reload_equipments())
+
     def do_control(self, equipment_name):
         """
         Control equipment
@@ -60,3 +70,27 @@ class MainCli(Cmd):
         Configure equipment
         """
         ConfigCli(self.secs_hosts).cmdloop()
+
+    def do_profile(self, arg: str):
+        """
+        Profile the running host, reports are written to logs/profile
+        Usage: profile sample <seconds> | stop | status | threads
+               profile tracemalloc start | snapshot [top] | stop
+        Sample: profile sample 30
+        """
+        args = arg.split()
+        if not args:
+            print("Usage: profile sample <seconds> | stop | status | threads | tracemalloc start|snapshot|stop")
+            return
+        if args[0] == "sample":
+            try:
+                seconds = float(args[1]) if len(args) > 1 else 10
+            except ValueError:
+                print("Invalid seconds")
+                return
+            # runs in the background, the prompt stays usable
+            print(profiler.start_sampling(seconds))
+        elif args[0] == "tracemalloc" and len(args) > 1:
+            print(profiler.execute(f"tracemalloc_{args[1]}", args[2:]))
+        else:
+            print(profiler.execute(args[0], args[1:]))
@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+
+from config.app_config import (ADAPTIVE_T3_DEGRADED_AFTER, ADAPTIVE_T3_ENABLE, ADAPTIVE_T3_EXEMPT,
+                               ADAPTIVE_T3_FACTOR, ADAPTIVE_T3_MAX, ADAPTIVE_T3_MIN, ADAPTIVE_T3_MIN_SAMPLES,
+                               ADAPTIVE_T3_PROBE_INTERVAL)
+
+logger = logging.getLogger("app_logger")
+
+# reasons a transaction ended without reply
+REASON_T3 = "t3"
+REASON_ADAPTIVE = "adaptive"
+REASON_LINK_DEGRADED = "link_degraded"
+REASON_SEND_FAILED = "send_failed"
+REASON_CONNECTION_CLOSED = "connection_closed"
+
+
+class _Profile:
+    """Smoothed round trip and its variation of one SxFy, estimator of RFC 6298"""
+
+    __slots__ = ("srtt", "rttvar", "samples", "backoff")
+
+    def __init__(self):
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.samples = 0
+        # doublings of the deadline after adaptive timeouts, cleared by a reply
+        self.backoff = 0
+
+    def observe(self, seconds: float):
+        if self.samples == 0:
+            self.srtt = seconds
+            self.rttvar = seconds / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+            self.srtt = 0.875 * self.srtt + 0.125 * seconds
+        self.samples += 1
+        self.backoff = 0
+
+
+class AdaptiveTimeout:
+    """
+    Reply deadlines of the primary messages of one equipment learned from observed
+    round trips by SxFy, and fail fast while the link is degraded
+    """
+
+    def __init__(self, equipment_name: str, enable: bool = ADAPTIVE_T3_ENABLE,
+                 minimum: float = ADAPTIVE_T3_MIN, maximum: float = ADAPTIVE_T3_MAX,
+                 factor: float = ADAPTIVE_T3_FACTOR, min_samples: int = ADAPTIVE_T3_MIN_SAMPLES,
+                 degraded_after: int = ADAPTIVE_T3_DEGRADED_AFTER,
+                 probe_interval: float = ADAPTIVE_T3_PROBE_INTERVAL, exempt: tuple = ADAPTIVE_T3_EXEMPT):
+        """
+        :param enable: False = T3 for every transaction and never fail fast
+        :param minimum: lower bound of a learned deadline in seconds
+        :param maximum: upper bound of a learned deadline in seconds
+        :param min_samples: replies of an SxFy before its deadline is learned
+        :param degraded_after: consecutive timeouts that mark the link degraded, 0 = never
+        :param probe_interval: seconds between requests let through while degraded
+        :param exempt: SxFy not safe to give up on early, always T3 and sent while degraded
+        """
+        self.equipment_name = equipment_name
+        self.enable = enable
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.min_samples = min_samples
+        self.degraded_after = degraded_after
+        self.probe_interval = probe_interval
+        self.exempt = frozenset(exempt)
+        self._lock = threading.Lock()
+        self._profiles: dict[str, _Profile] = {}
+        self.consecutive_timeouts = 0
+        self.degraded_since = None
+        self._next_probe = 0.0
+
+    @property
+    def degraded(self) -> bool:
+        """Link gave no reply to the last degraded_after transactions"""
+        return self.degraded_since is not None
+
+    def _deadline(self, profile: _Profile) -> float:
+        seconds = self.factor * (profile.srtt + 4 * profile.rttvar) * 2 ** profile.backoff
+        return min(self.maximum, max(self.minimum, seconds))
+
+    def timeout(self, name: str, t3: float) -> tuple[float, str]:
+        """
+        Reply timeout of a primary message
+        :param name: SxFy of the primary message
+        :param t3: configured T3 of the equipment
+        :return: (seconds, REASON_ADAPTIVE or REASON_T3 as reason if it expires)
+        """
+        with self._lock:
+            profile = self._profiles.get(name)
+            if (not self.enable or name in self.exempt
+                    or profile is None or profile.samples < self.min_samples):
+                return t3, REASON_T3
+            return self._deadline(profile), REASON_ADAPTIVE
+
+    def allow(self, name: str) -> bool:
+        """
+        Whether a primary message may be sent, False while the link is degraded
+        except for exempt SxFy and one probe every probe_interval seconds
+        :param name: SxFy of the primary message
+        """
+        with self._lock:
+            if not self.degraded or name in self.exempt:
+                return True
+            now = time.monotonic()
+            if now < self._next_probe:
+                return False
+            self._next_probe = now + self.probe_interval
+            return True
+
+    def observe(self, name: str, seconds: float):
+        """Reply received after seconds, the link is healthy"""
+        with self._lock:
+            profile = self._profiles.get(name)
+            if profile is None:
+                profile = self._profiles[name] = _Profile()
+            profile.observe(seconds)
+            self.consecutive_timeouts = 0
+            if self.degraded:
+                logger.info("Link of %s recovered after %.1f s degraded",
+                            self.equipment_name, time.monotonic() - self.degraded_since)
+                self.degraded_since = None
+
+    def timed_out(self, name: str, reason: str):
+        """No reply within the deadline of the transaction"""
+        with self._lock:
+            profile = self._profiles.get(name)
+            if reason == REASON_ADAPTIVE and profile is not None and self._deadline(profile) < self.maximum:
+                # slower than learned, allow more time next attempt
+                profile.backoff += 1
+            self.consecutive_timeouts += 1
+            if (self.enable and self.degraded_after and not self.degraded
+                    and self.consecutive_timeouts >= self.degraded_after):
+                now = time.monotonic()
+                self.degraded_since = now
+                self._next_probe = now + self.probe_interval
+                logger.warning("Link of %s degraded after %s consecutive timeouts, failing fast",
+                               self.equipment_name, self.consecutive_timeouts)
+
+    def reset_link(self):
+        """New connection, forget timeouts of the previous one but keep the learned round trips"""
+        with self._lock:
+            self.consecutive_timeouts = 0
+            self.degraded_since = None
+
+    def summary(self) -> dict:
+        """Link state and learned deadline by SxFy"""
+        with self._lock:
+            return {
+                "enable": self.enable,
+                "exempt": sorted(self.exempt),
+                "degraded": self.degraded,
+                "degraded_for": round(time.monotonic() - self.degraded_since, 1) if self.degraded else None,
+                "consecutive_timeouts": self.consecutive_timeouts,
+                "min": self.minimum,
+                "max": self.maximum,
+                "profiles": {
+                    name: {"srtt_ms": round(profile.srtt * 1000, 1),
+                           "rttvar_ms": round(profile.rttvar * 1000, 1),
+                           "samples": profile.samples, "backoff": profile.backoff,
+                           "deadline": round(self._deadline(profile), 2)
+                           if profile.samples >= self.min_samples and name not in self.exempt else None}
+                    for name, profile in sorted(self._profiles.items())}
+            }
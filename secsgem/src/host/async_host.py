@@ -0,0 +1,482 @@
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+import secsgem.common
+import secsgem.hsms
+import secsgem.secs
+
+from config.app_config import EQUIPMENT_STATUS_MAX_AGE
+from config.status_variable_define import CONTROL_STATE_VID, PROCESS_STATE_CHANG_EVENT, VID_PP_NAME
+
+if TYPE_CHECKING:
+    from src.host.gemhost import SecsGemHost
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+HCACK = {0: "OK", 1: "Invalid Command", 2: "Cannot Do Now", 3: "Parameter Error",
+         4: "Initiated for Asynchronous Completion", 5: "Rejected, Already in Desired Condition", 6: "Invalid Object"}
+DRACK = {0: "ok", 1: "out of space", 2: "invalid format",
+         3: "1 or more RPTID already defined", 4: "1 or more invalid VID"}
+LRACK = {0: "ok", 1: "out of space", 2: "invalid format",
+         3: "1 or more CEID links already defined", 4: "1 or more CEID invalid", 5: "1 or more RPTID invalid"}
+ERACK = {0: "ok", 1: "denied"}
+
+
+# queued by AsyncStream.close to end a pending __anext__
+_CLOSED = object()
+
+
+class AsyncStream:
+    """
+    Async iterator over items pushed from other threads by a listener callback.
+    When the queue is full the oldest item is dropped.
+    Usage: async with host.events() as events: async for event in events: ...
+    """
+
+    def __init__(self, register: Callable, unregister: Callable, maxsize: int = 1000):
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._unregister = unregister
+        self._closed = False
+        register(self._push)
+
+    def _push(self, item: Any):
+        self._loop.call_soon_threadsafe(self._put, item)
+
+    def _put(self, item: Any):
+        if self._queue.full():
+            self._queue.get_nowait()
+            if item is not _CLOSED:
+                logger.warning("Async stream is full, dropped oldest item")
+        self._queue.put_nowait(item)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Stop receiving items
+        """
+        if not self._closed:
+            self._closed = True
+            self._unregister(self._push)
+            try:
+                # wake a consumer waiting in __anext__, close may be called from any thread
+                self._loop.call_soon_threadsafe(self._put, _CLOSED)
+            except RuntimeError:
+                # event loop already closed, nobody is waiting
+                pass
+
+
+class AsyncSecsControl:
+    """
+    asyncio facade of SecsControl.
+    Requests go through the equipment transaction pool and are awaited without
+    blocking a thread. Operations without an async implementation run the
+    SecsControl method in the default executor.
+    """
+
+    def __init__(self, gem_host: 'SecsGemHost'):
+        self.gem_host = gem_host
+        self.secs_control = gem_host.secs_control
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.secs_control, name)
+        if not callable(attr):
+            return attr
+
+        async def run_in_executor(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(attr, *args, **kwargs))
+        return run_in_executor
+
+    def _not_online(self, request: str):
+        logger.warning("%s Equipment %s is not online",
+                       request, self.gem_host.equipment_name)
+        return "Equipment is not online"
+
+    async def request(self, function: secsgem.secs.SecsStreamFunction) -> Optional[secsgem.common.Message]:
+        """
+        Send a primary message and await the reply
+        :param function: stream function to send
+        :return: reply message or None on timeout
+        """
+        pool = self.gem_host.transactions
+        transaction = pool.submit(function, wait_slot=False)
+        if transaction is None:
+            # window is full, wait for a slot outside the event loop
+            transaction = await asyncio.get_running_loop().run_in_executor(
+                None, pool.submit, function)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(transaction)),
+                max(0.0, transaction.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            transaction.expire()
+            return transaction.result()
+
+    async def request_all(self, functions: List[secsgem.secs.SecsStreamFunction]) -> List[Optional[secsgem.common.Message]]:
+        """
+        Send several primary messages concurrently and await all replies
+        """
+        return list(await asyncio.gather(*(self.request(function) for function in functions)))
+
+    async def _request_ack(self, function: secsgem.secs.SecsStreamFunction, codes: dict):
+        return self.secs_control._decode_ack(await self.request(function), codes)
+
+    async def _request_hcack(self, function: secsgem.secs.SecsStreamFunction) -> Optional[str]:
+        response = await self.request(function)
+        if isinstance(response, secsgem.common.Message):
+            decode = self.gem_host.settings.streams_functions.decode(response)
+            return HCACK.get(decode.HCACK.get(), "Unknown code")
+        return None
+
+    # equipment status
+    async def select_equipment_status_request(self, vids: list[int] = None):
+        """
+        S1F3 Select Equipment Status Request
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("Select Equipment Status Request")
+
+        response = await self.request(self.gem_host.stream_function(1, 3)(vids or []))
+        if isinstance(response, secsgem.hsms.HsmsMessage):
+            return self.gem_host.settings.streams_functions.decode(response)
+        return "No response"
+
+    async def get_control_state(self):
+        """
+        Get control state
+        """
+        if not self.gem_host.is_communicating:
+            return self._not_online("Get Control State")
+
+        vid_model = CONTROL_STATE_VID.get(self.gem_host.equipment_model)
+        if vid_model is None:
+            return f"CONTROL_STATE_VID is not define for {self.gem_host.equipment_model}"
+
+        return self.secs_control._update_control_state(await self.request(
+            self.gem_host.stream_function(1, 3)([vid_model.get("VID")])))
+
+    async def get_process_state(self):
+        """
+        Get process state
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("Get Process State")
+
+        vid_model = PROCESS_STATE_CHANG_EVENT.get(
+            self.gem_host.equipment_model)
+        if vid_model is None:
+            return f"PROCESS_STATE_CHANG_EVENT is not define for {self.gem_host.equipment_model}"
+
+        return self.secs_control._update_process_state(await self.request(
+            self.gem_host.stream_function(1, 3)([vid_model.get("VID")])))
+
+    async def get_process_program(self):
+        """
+        Get process program
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("Get Process Program")
+
+        vid_model = VID_PP_NAME.get(self.gem_host.equipment_model)
+        if vid_model is None:
+            return f"VID_PP_NAME is not define for {self.gem_host.equipment_model}"
+
+        return self.secs_control._update_process_program(await self.request(
+            self.gem_host.stream_function(1, 3)([vid_model])))
+
+    async def get_equipment_status(self, max_age: Optional[float] = EQUIPMENT_STATUS_MAX_AGE):
+        """
+        Get equipment status from the equipment state like the sync host, when a value
+        is missing or older than max_age the status reads are sent concurrently
+        :param max_age: seconds, 0 = always read from the equipment, None = never expire
+        """
+        if not self.secs_control.status_expired(max_age):
+            return self.secs_control.equipment_status()
+
+        control_state = await self.get_control_state()
+        if not self.gem_host.is_online:
+            return self.secs_control.equipment_status(
+                control_state, "Equipment is not online", "Equipment is not online")
+        process_state, process_program = await asyncio.gather(
+            self.get_process_state(), self.get_process_program())
+        return self.secs_control.equipment_status(control_state, process_state, process_program)
+
+    # event and report
+    async def enable_disable_event(self, enable: bool, ceids: list[int] = None):
+        """
+        S2F37 Enable/Disable Event Report
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("Enable/Disable Event Report")
+        return await self._request_ack(
+            self.gem_host.stream_function(2, 37)([int(enable), ceids or []]), ERACK)
+
+    async def define_report(self, vids: list[int], report_id: int):
+        """
+        S2F33 Define Report
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("Define Report")
+        return await self._request_ack(self.gem_host.stream_function(2, 33)(
+            {"DATAID": 0, "DATA": [{"RPTID": report_id, "VID": vids}]}), DRACK)
+
+    async def link_event_report(self, ceid: int, report_id: int):
+        """
+        S2F35 Link Event Report
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("Link Event Report")
+        return await self._request_ack(self.gem_host.stream_function(2, 35)(
+            {"DATAID": 0, "DATA": [{"CEID": ceid, "RPTID": [report_id]}]}), LRACK)
+
+    async def subscribe_event_report(self, ceid: int, dvs: list[int], report_id: int):
+        """
+        Subscribe collection event report
+        """
+        drack = await self.define_report(dvs, report_id)
+        if drack != "ok":
+            return drack
+        lrack = await self.link_event_report(ceid, report_id)
+        if lrack != "ok":
+            return lrack
+        erack = await self.enable_disable_event(True, [ceid])
+        if erack != "ok":
+            return erack
+        return f"Subscribe CEID {ceid} VIDs {dvs} Report ID {report_id} success"
+
+    # lot management
+    async def accept_lot(self, lot_id: str):
+        """
+        Accept lot
+        """
+        return await self._lot_command({"RCMD": "LOT_ACCEPT", "PARAMS": [
+            {"CPNAME": "LotID", "CPVAL": lot_id}]}, lot_id, 41)
+
+    async def reject_lot(self, lot_id: str):
+        """
+        Reject lot
+        """
+        return await self._lot_command({"RCMD": "LOT_REJECT", "PARAMS": [
+            {"CPNAME": "LotID", "CPVAL": lot_id}]}, lot_id, 41)
+
+    async def add_lot_fclx(self, lot_id: str):
+        """
+        Open lot
+        """
+        return await self._lot_command({"DATAID": 0, "OBJSPEC": "OBJ", "RCMD": "ADD_LOT", "PARAMS": [
+            {"CPNAME": "LotID", "CEPVAL": lot_id}]}, lot_id, 49)
+
+    async def reject_lot_fclx(self, lot_id: str, reject_reason: str):
+        """
+        Close lot
+        """
+        return await self._lot_command({"DATAID": 101, "OBJSPEC": "LOTCONTROL", "RCMD": "REJECT_LOT",
+                                        "PARAMS": [
+                                            {"CPNAME": "LotID", "CEPVAL": lot_id},
+                                            {"CPNAME": "Reason", "CEPVAL": reject_reason}
+                                        ]}, lot_id, 49)
+
+    async def _lot_command(self, secs_cmd: dict, lot_id: str, function: int):
+        if not lot_id:
+            return "Lot ID is empty"
+        hcack = await self._request_hcack(self.gem_host.stream_function(2, function)(secs_cmd))
+        if hcack is None:
+            logger.warning("Lot command S2F%s No response from %s",
+                           function, self.gem_host.equipment_name)
+            return "No response"
+        return f"HCACK: {hcack}"
+
+    # recipe management
+    async def pp_select(self, ppid: str):
+        """
+        Process Program Select
+        """
+        if not self.gem_host.is_online:
+            return self._not_online("PP Select")
+
+        hcack = await self._request_hcack(self.gem_host.stream_function(2, 41)(
+            {"RCMD": "PP-SELECT", "PARAMS": [{"CPNAME": "PPName", "CPVAL": ppid}]}))
+        if hcack is None:
+            logger.warning("PP Select No response")
+            return "No response"
+        logger.info("PP Select PPID: %s on %s, HCACK: %s", ppid,
+                    self.gem_host.equipment_name, hcack)
+        return hcack
+
+    # remote command
+    async def send_remote_command(self, rcmd: str, params: list):
+        """
+        Send remote command S2F41
+        """
+        if not self.gem_host.is_online:
+            self._not_online("Remote Command")
+            return self.gem_host.equipment_name + " is not online"
+        if rcmd:
+            hcack = await self._request_hcack(self.gem_host.stream_function(2, 41)(
+                {"RCMD": rcmd, "PARAMS": params}))
+            if hcack is not None:
+                logger.info("Send RCMD: %s to %s, HCACK: %s", rcmd,
+                            self.gem_host.equipment_name, hcack)
+                return f"HCACK: {hcack}"
+        logger.warning("No response")
+        return "No response"
+
+    async def send_enhanched_remote_command(self, objspec: str, rcmd: str, params: list):
+        """
+        Send enhanced remote command S2F49
+        """
+        if not self.gem_host.is_online:
+            self._not_online("Remote Command")
+            return self.gem_host.equipment_name + " is not online"
+        if rcmd:
+            hcack = await self._request_hcack(self.gem_host.stream_function(2, 49)(
+                {"DATAID": 0, "OBJSPEC": objspec, "RCMD": rcmd, "PARAMS": params}))
+            if hcack is not None:
+                logger.info("Send RCMD: %s to %s, HCACK: %s", rcmd,
+                            self.gem_host.equipment_name, hcack)
+                return f"HCACK: {hcack}"
+        logger.warning("No response")
+        return "No response"
+
+
+class AsyncSecsGemHost:
+    """
+    asyncio facade of SecsGemHost
+    """
+
+    def __init__(self, gem_host: 'SecsGemHost'):
+        self.gem_host = gem_host
+        self.control = AsyncSecsControl(gem_host)
+
+    @property
+    def equipment_name(self):
+        """Equipment name"""
+        return self.gem_host.equipment_name
+
+    @property
+    def is_communicating(self):
+        """Check if equipment is communicating"""
+        return self.gem_host.is_communicating
+
+    @property
+    def is_online(self):
+        """Check if equipment is online"""
+        return self.gem_host.is_online
+
+    def events(self, maxsize: int = 1000) -> AsyncStream:
+        """
+        Async iterator of received collection events
+        item: {"equipment_name", "ceid", "reports": {rptid: values}}
+        """
+        return AsyncStream(self.gem_host.handler_event.add_listener,
+                           self.gem_host.handler_event.remove_listener, maxsize)
+
+    def alarms(self, maxsize: int = 1000) -> AsyncStream:
+        """
+        Async iterator of received alarms
+        item: {"equipment_name", "alid", "alcd", "altx"}
+        """
+        return AsyncStream(self.gem_host.handler_alarm.add_listener,
+                           self.gem_host.handler_alarm.remove_listener, maxsize)
+
+
+class AsyncMqttBridge:
+    """
+    asyncio bridge of MqttClient.
+    The paho network loop keeps running in its own thread,
+    publish results and received messages are handed to the event loop.
+    """
+
+    def __init__(self, mqtt_client: 'MqttClient'):
+        self.mqtt_client = mqtt_client
+        self._lock = threading.Lock()
+        # topic filter: push callbacks of the open streams
+        self._streams: Dict[str, List[Callable]] = {}
+        self._last_message = None
+
+    async def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False, timeout: float = 10):
+        """
+        Publish a message and await until it is sent (QoS 0) or acknowledged (QoS 1, 2)
+        :return: paho result code
+        """
+        info = self.mqtt_client.client.publish(
+            topic, payload, qos=qos, retain=retain)
+        deadline = time.monotonic() + timeout
+        while not info.is_published() and info.rc == 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return info.rc
+
+    def _dispatch(self, client, userdata, message):
+        """
+        Single paho callback of every stream topic filter. paho calls it once per matching
+        filter with the same message, it is handled on the first call only
+        """
+        if message is self._last_message:
+            return
+        self._last_message = message
+        item = (message.topic, message.payload.decode("utf-8"))
+        with self._lock:
+            pushes = [push for topic_filter, streams in self._streams.items()
+                      if mqtt.topic_matches_sub(topic_filter, message.topic) for push in streams]
+        for push in pushes:
+            push(item)
+        # paho skips on_message for filtered topics, the application still handles its own
+        if any(mqtt.topic_matches_sub(topic_filter, message.topic)
+               for topic_filter in self.mqtt_client.subscribe_topics):
+            self.mqtt_client.client.on_message(client, userdata, message)
+
+    def messages(self, topic: str, qos: int = 0, maxsize: int = 1000) -> AsyncStream:
+        """
+        Subscribe to a topic and iterate the received messages
+        item: (topic, payload)
+        Streams of the same topic share one subscription, it is removed when the last one closes
+        unless the MqttClient subscribes the topic itself.
+        """
+        client = self.mqtt_client.client
+
+        def register(push: Callable):
+            with self._lock:
+                streams = self._streams.setdefault(topic, [])
+                streams.append(push)
+                first = len(streams) == 1
+            if first:
+                client.message_callback_add(topic, self._dispatch)
+                client.subscribe(topic, qos=qos)
+
+        def unregister(push: Callable):
+            with self._lock:
+                streams = self._streams.get(topic, [])
+                if push in streams:
+                    streams.remove(push)
+                last = not streams and self._streams.pop(topic, None) is not None
+            if last:
+                client.message_callback_remove(topic)
+                if topic not in self.mqtt_client.subscribe_topics:
+                    client.unsubscribe(topic)
+
+        return AsyncStream(register, unregister, maxsize)
@@ -0,0 +1,168 @@
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Optional
+
+from config.app_config import EQUIPMENT_STATE_JOURNAL_SIZE
+
+# runtime state fields, each change increments the version
+FIELDS = ("is_enable", "communication_state", "control_state",
+          "process_state", "process_program", "active_lot")
+
+
+class EquipmentState:
+    """
+    Runtime state of one equipment with a version counter and a journal of changes.
+    Consumers keep the version they have seen and ask for the changes since,
+    a full snapshot is only needed when the journal no longer reaches back that far.
+    Versions count from 0 again in a new process, the epoch tells them apart.
+    """
+    __slots__ = ("equipment_name",) + FIELDS + \
+        ("alarms", "version", "epoch", "updated", "stale", "_journal", "_lock")
+
+    def __init__(self, equipment_name: str, is_enable: bool = False,
+                 journal_size: int = EQUIPMENT_STATE_JOURNAL_SIZE):
+        self.equipment_name = equipment_name
+        self.is_enable = is_enable
+        self.communication_state = None
+        self.control_state = None
+        self.process_state = None
+        self.process_program = None
+        self.active_lot = None
+        # ALID: alarm text of alarms set on the equipment
+        self.alarms: dict[int, str] = {}
+        self.version = 0
+        # id of this state instance, versions of another epoch are not comparable
+        self.epoch = uuid.uuid4().hex[:12]
+        # field: epoch seconds the value was last set or confirmed
+        self.updated: dict[str, float] = {}
+        # fields restored from a snapshot, not yet confirmed by the equipment
+        self.stale: set[str] = set()
+        # (version, timestamp, field, alid or None, value)
+        self._journal: deque = deque(maxlen=journal_size)
+        self._lock = threading.Lock()
+
+    def _record(self, field: str, key: Optional[int], value: Any, now: float):
+        self.version += 1
+        self._journal.append((self.version, now, field, key, value))
+
+    def set(self, field: str, value: Any) -> bool:
+        """
+        Set a field, the freshness timestamp is updated even when the value is unchanged
+        :return: True if the value changed
+        """
+        if field not in FIELDS:
+            raise AttributeError(f"Unknown equipment state field: {field}")
+        now = time.time()
+        with self._lock:
+            self.updated[field] = now
+            self.stale.discard(field)
+            if getattr(self, field) == value:
+                return False
+            setattr(self, field, value)
+            self._record(field, None, value, now)
+            return True
+
+    def set_alarm(self, alid: int, text: Optional[str]) -> bool:
+        """
+        Set or clear an alarm
+        :param text: alarm text, None clears the alarm
+        :return: True if the alarms changed
+        """
+        now = time.time()
+        with self._lock:
+            self.updated["alarms"] = now
+            if self.alarms.get(alid) == text:
+                return False
+            if text is None:
+                del self.alarms[alid]
+            else:
+                self.alarms[alid] = text
+            self._record("alarms", alid, text, now)
+            return True
+
+    def confirm(self, field: str):
+        """Value of a field (or "alarms") was confirmed by the equipment without changing"""
+        with self._lock:
+            self.updated[field] = time.time()
+            self.stale.discard(field)
+
+    def invalidate(self, fields: tuple[str, ...]):
+        """
+        Forget fields whose value is no longer known, e.g. after the connection closed.
+        Unlike set(field, None) they have no timestamp, so they are read again
+        """
+        now = time.time()
+        with self._lock:
+            for field in fields:
+                if field not in FIELDS:
+                    raise AttributeError(f"Unknown equipment state field: {field}")
+                self.updated.pop(field, None)
+                self.stale.discard(field)
+                if getattr(self, field) is not None:
+                    setattr(self, field, None)
+                    self._record(field, None, None, now)
+
+    def restore(self, values: dict, updated: dict[str, float]):
+        """
+        Set fields and alarms from a saved snapshot, marked stale until set or confirmed
+        :param values: field or "alarms": value, alarms as {ALID: text}
+        :param updated: field: epoch seconds the value was last confirmed before the snapshot
+        """
+        now = time.time()
+        with self._lock:
+            for field, value in values.items():
+                if field == "alarms":
+                    for alid, text in value.items():
+                        self.alarms[alid] = text
+                        self._record("alarms", alid, text, now)
+                elif field in FIELDS:
+                    setattr(self, field, value)
+                    self._record(field, None, value, now)
+                else:
+                    continue
+                if field in updated:
+                    self.updated[field] = updated[field]
+                self.stale.add(field)
+
+    def age(self, field: str) -> Optional[float]:
+        """Seconds since the field was last set or confirmed, None if never"""
+        updated = self.updated.get(field)
+        return None if updated is None else time.time() - updated
+
+    def snapshot(self) -> dict:
+        """Every field, the active alarms and the version they belong to"""
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        snapshot = {field: getattr(self, field) for field in FIELDS}
+        snapshot.update(equipment_name=self.equipment_name, alarms=dict(self.alarms),
+                        version=self.version, epoch=self.epoch, updated=dict(self.updated), stale=sorted(self.stale))
+        return snapshot
+
+    def changes_since(self, version: int, epoch: Optional[str] = None) -> dict:
+        """
+        Fields changed after version, the latest value of each
+        :param epoch: epoch the version was received with, None = this one
+        :return: {"version", "epoch", "full", "changes"}, full is True when version is of another
+            epoch or ahead of this one (e.g. after a restart) or the journal does not reach back
+            to version, changes is a complete snapshot then
+        """
+        with self._lock:
+            result = {"equipment_name": self.equipment_name, "version": self.version, "epoch": self.epoch}
+            if (version < 0 or version > self.version or (epoch is not None and epoch != self.epoch)
+                    or (version < self.version and (not self._journal or self._journal[0][0] > version + 1))):
+                result.update(full=True, changes=self._snapshot())
+                return result
+            changes: dict = {}
+            for entry_version, _, field, key, value in self._journal:
+                if entry_version <= version:
+                    continue
+                if field == "alarms":
+                    changes.setdefault("alarms", {})[key] = value
+                else:
+                    changes[field] = value
+            result.update(full=False, changes=changes)
+            return result
@@ -13,6 +13,17 @@ from secsgem.secs.data_items import ACKC6, ACKC5, ACKC7
 from src.host.handler.alarm import HandlerAlarm
 from src.host.handler.event import HandlerEvent
 from src.host.handler.control import SecsControl
+from src.host import secsgem_compat
+from src.host.transaction import SecsTransactionPool
+from src.host.transaction_stats import TransactionStats
+from src.host.equipment_state import EquipmentState
+from src.host.reconnect import reconnect_supervisor
+from src.host.state_snapshot import state_snapshots
+from src.archive.frame_archive import FrameArchiveWriter
+from config.logger.all_logger import QueueLogHandler
+from config.logger.output_sink import output
+from src.metrics import collectors
+from config.app_config import SECS_TRANSACTION_WINDOW, SECS_ARCHIVE_ENABLE, COMMUNICATION_TEXT_LOG, RECONNECT_DEFAULT_PRIORITY, STATE_SNAPSHOT_ENABLE
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from mqtt.mqtt_client import MqttClient
@@ -42,8 +53,13 @@ class CommunicationLogFileHandler(logging.Handler):
 
 commLogFileHandler = CommunicationLogFileHandler("logs/gem")
 commLogFileHandler.setFormatter(logging.Formatter("%(asctime)s: %(message)s"))
-logging.getLogger("communication").addHandler(commLogFileHandler)
+# files are opened per record, keep that off the HSMS receiver threads
+logging.getLogger("communication").addHandler(
+    QueueLogHandler([commLogFileHandler]))
 logging.getLogger("communication").propagate = False
+if not COMMUNICATION_TEXT_LOG:
+    # records are not even formatted, the frame archive keeps the traffic
+    logging.getLogger("communication").setLevel(logging.WARNING)
 
 logging.basicConfig(
     format='%(asctime)s %(name)s.%(funcName)s: %(message)s', level=logging.INFO)
@@ -53,17 +69,28 @@ class SecsGemHost(secsgem.gem.GemHostHandler):
     """
     SECS/GEM equipment class
     """
+    # write sent and received frames to the SECS message archive
+    archive_frames = SECS_ARCHIVE_ENABLE
+    # start from the last saved state of the equipment, see src.host.state_snapshot
+    restore_state = STATE_SNAPSHOT_ENABLE
 
-    def __init__(self, equipment_name: str, equipment_model: str, enable: bool, mqtt_client: 'MqttClient', settings: secsgem.common.Settings):
+    def __init__(self, equipment_name: str, equipment_model: str, enable: bool, mqtt_client: 'MqttClient', settings: secsgem.common.Settings, transaction_window: int = SECS_TRANSACTION_WINDOW,
+                 sync_priority: int = RECONNECT_DEFAULT_PRIORITY):
         super().__init__(settings)
         self.mqtt_client = mqtt_client
         self.equipment_name = equipment_name
         self.equipment_model = equipment_model
-        self.control_state = None
-        self.process_state = None
-        self.process_program = None
-        self.active_lot = None
-        self.is_enable = enable
+        # control/process state, program, lot and alarms with a change journal
+        self.state = EquipmentState(equipment_name, enable)
+        if self.restore_state:
+            # last known values, stale until confirmed after connect
+            state_snapshots.restore(self.state)
+        # set on host shutdown, values and retained topics are kept for the warm start
+        self.keep_state_on_close = False
+        # initial synchronization order after reconnect, lower first
+        self.sync_priority = sync_priority
+        self._connect_separation = settings.timeouts.t5
+        reconnect_supervisor.jitter_reconnect(self, self._connect_separation)
         self.MDLN = "DEJTNF-HOST"
         self.SOFTREV = "1.0.0"
 
@@ -83,14 +110,75 @@ class SecsGemHost(secsgem.gem.GemHostHandler):
         # self.register_stream_function(6, 11, self.handler_event.receive_event)
         # # self.register_stream_function(6, 11, HandlerEvent(self).receive_event)
 
+        self.transactions = SecsTransactionPool(self, transaction_window)
+        self.transaction_stats = TransactionStats(equipment_name, mqtt_client)
         self.secs_control = SecsControl(self)
         self.register_stream_function(7, 3, self.secs_control.pp_recive)
 
         self._protocol.events.disconnected += self.on_connection_closed
 
+        self.archive = FrameArchiveWriter(
+            equipment_name) if self.archive_frames else None
+        if self.archive:
+            self._archive_protocol()
+
         if self.is_enable:
             self.enable()
 
+    def _archive_protocol(self):
+        """
+        Record every frame sent and received by the protocol, HSMS control messages included
+        """
+        secsgem_compat.hook_frames(
+            self._protocol,
+            lambda message: self.archive.write("out", message),
+            lambda message: self.archive.write("in", message))
+
+    @property
+    def control_state(self):
+        """Control state name, e.g. On-Line/Remote"""
+        return self.state.control_state
+
+    @control_state.setter
+    def control_state(self, value):
+        self.state.set("control_state", value)
+
+    @property
+    def process_state(self):
+        """Process state name"""
+        return self.state.process_state
+
+    @process_state.setter
+    def process_state(self, value):
+        self.state.set("process_state", value)
+
+    @property
+    def process_program(self):
+        """Selected process program"""
+        return self.state.process_program
+
+    @process_program.setter
+    def process_program(self, value):
+        self.state.set("process_program", value)
+
+    @property
+    def active_lot(self):
+        """Lot in process"""
+        return self.state.active_lot
+
+    @active_lot.setter
+    def active_lot(self, value):
+        self.state.set("active_lot", value)
+
+    @property
+    def is_enable(self):
+        """HSMS connection enabled"""
+        return self.state.is_enable
+
+    @is_enable.setter
+    def is_enable(self, value):
+        self.state.set("is_enable", value)
+
     @property
     def is_communicating(self):
         """Check if equipment is communicating"""
@@ -103,9 +191,39 @@ class SecsGemHost(secsgem.gem.GemHostHandler):
             return True
         return False
 
+    def send_and_waitfor_response(self, function, priority: int = None):
+        """
+        Send primary message and wait for the reply. The message waits for a slot of the
+        transaction pool by priority class, round trip metrics are recorded by the pool
+        :param priority: priority class, default by SxFy (SECS_SEND_PRIORITY)
+        """
+        return self.transactions.submit(function, priority=priority).wait()
+
+    def record_transaction(self, function, seconds: float, response, timed_out: bool, reason: str = None):
+        """
+        Record round trip of a primary message, its timeout or send failure
+        :param reason: why there is no reply, see src.host.adaptive_timeout
+        """
+        collectors.record_transaction(
+            self.equipment_name, function, seconds, response, timed_out, reason)
+        outcome = "ok" if response is not None else "timeout" if timed_out else "failed"
+        self.transaction_stats.record(
+            collectors.stream_function_name(function), seconds, outcome, reason)
+
+    def send_response(self, function, system):
+        """Send secondary message"""
+        collectors.record_message(self.equipment_name, "out", function)
+        return super().send_response(function, system)
+
+    def send_stream_function(self, function):
+        """Send message without waiting for a reply"""
+        collectors.record_message(self.equipment_name, "out", function)
+        return super().send_stream_function(function)
+
     def _on_message_received(self, data):
         """Handle received message from equipment passes to MQTT"""
         message = data["message"]
+        collectors.record_message(self.equipment_name, "in", message)
         self.mqtt_client.client.publish(
             f"equipments/status/secs_message/{self.equipment_name}", str(self.settings.streams_functions.decode(message)))
         return super()._on_message_received(data)
@@ -113,32 +231,47 @@ class SecsGemHost(secsgem.gem.GemHostHandler):
     def _on_state_wait_cra(self, _):
         super()._on_state_wait_cra(_)
         state = self.communication_state.current.name
-        print("On wait cra - Communication state: ",
-              self.communication_state.current.name)
+        self.state.set("communication_state", state)
+        output("On wait cra - Communication state: %s",
+               self.communication_state.current.name)
         self.mqtt_client.client.publish(
             f"equipments/status/communication_state/{self.equipment_name}", state, qos=2, retain=True)
 
     def _on_state_communicating(self, _):
         super()._on_state_communicating(_)
         state = self.communication_state.current.name
-        print("On communicating - Communication state: ",
-              state)
+        self.state.set("communication_state", state)
+        output("On communicating - Communication state: %s",
+               state)
 
         self.mqtt_client.client.publish(
             f"equipments/status/communication_state/{self.equipment_name}", state, qos=2, retain=True)
         if state == "COMMUNICATING":
-            # initial subscribe lot control
-            threading.Timer(
-                0.1, self.secs_control.initial_equipment).start()
+            # initial subscribe lot control, limited number of equipments at once
+            reconnect_supervisor.submit(self)
 
     def on_connection_closed(self, _):
         super().on_connection_closed(_)
         state = self.communication_state.current.name
-        print("On closed - Communication state: ",
-              self.communication_state.current.name)
+        self.state.set("communication_state", state)
+        output("On closed - Communication state: %s",
+               self.communication_state.current.name)
         self.mqtt_client.client.publish(
             f"equipments/status/communication_state/{self.equipment_name}", state, qos=2, retain=True)
 
+        # release callers waiting on open transactions
+        self.transactions.cancel_all()
+        self.transactions.timeouts.reset_link()
+
+        # equipments disconnected by the same outage do not retry at the same moment
+        reconnect_supervisor.jitter_reconnect(self, self._connect_separation)
+
+        if self.keep_state_on_close:
+            return
+
+        # states are unknown until read again after reconnect
+        self.state.invalidate(("control_state", "process_state", "process_program"))
+
         # remove mqtt retained message
         self.secs_control.remove_mqtt_retain_message()
 
@@ -146,9 +279,14 @@ class SecsGemHost(secsgem.gem.GemHostHandler):
         handler.send_response(self.stream_function(
             6, 12)(ACKC6.ACCEPTED), message.header.system)
 
-        threading.Timer(0.1, self.handler_event.receive_event,
+        collectors.worker_queue_depth.inc(queue="event")
+        threading.Timer(0.1, self._receive_event,
                         args=(handler, message)).start()
 
+    def _receive_event(self, handler, message):
+        collectors.worker_queue_depth.dec(queue="event")
+        self.handler_event.receive_event(handler, message)
+
     def on_s01f14(self, handle, message):
         logger.info("received s01f14: %s", self.equipment_name)
 
@@ -156,40 +294,40 @@ class SecsGemHost(secsgem.gem.GemHostHandler):
         """Unrecognized Device ID"""
         logger.warning("s09f1:Unrecognized Device ID (UDN): %s",
                        self.equipment_name)
-        print("s09f1:Unrecognized Device ID (UDN): ",
-              self.equipment_name)
+        output("s09f1:Unrecognized Device ID (UDN): %s",
+               self.equipment_name)
 
     def s09f3(self, handle, message):
         """Unrecognized Stream Function"""
         logger.warning("s09f3:Unrecognized Stream Function (SFCD): %s",
                        self.equipment_name)
-        print("s09f3:Unrecognized Stream Function (SFCD): ",
-              self.equipment_name)
+        output("s09f3:Unrecognized Stream Function (SFCD): %s",
+               self.equipment_name)
 
     def s09f5(self, handle, message):
         """Unrecognized Function Type"""
         logger.warning("s09f5:Unrecognized Function Type (UFN): %s",
                        self.equipment_name)
-        print("s09f5:Unrecognized Function Type (UFN): ",
-              self.equipment_name)
+        output("s09f5:Unrecognized Function Type (UFN): %s",
+               self.equipment_name)
 
     def s09f7(self, handle, message):
         """Illegal Data (IDN)"""
         logger.warning("s09f7:Illegal Data (IDN): %s",
                        self.equipment_name)
-        print("s09f7:Illegal Data (IDN): ",
-              self.equipment_name)
+        output("s09f7:Illegal Data (IDN): %s",
+               self.equipment_name)
 
     def s09f9(self, handle, message):
         """Transaction Timer Timeout (TTN)"""
         logger.warning("s09f9:Transaction Timer Timeout (TTN): %s",
                        self.equipment_name)
-        print("s09f9:Transaction Timer Timeout (TTN): ",
-              self.equipment_name)
+        output("s09f9:Transaction Timer Timeout (TTN): %s",
+               self.equipment_name)
 
     def s09f11(self, handle, message):
         """Data Too Long (DLN)"""
         logger.warning("s09f11:Data Too Long (DLN): %s",
                        self.equipment_name)
-        print("s09f11:Data Too Long (DLN): ",
-              self.equipment_name)
+        output("s09f11:Data Too Long (DLN): %s",
+               self.equipment_name)
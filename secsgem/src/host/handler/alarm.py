@@ -1,11 +1,13 @@
 import logging
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
 
 import secsgem.common
 import secsgem.secs
 from secsgem.secs.data_items import ACKC5
 
+from src.metrics import collectors
+
 if TYPE_CHECKING:
     from host.gemhost import SecsGemHost
     from mqtt.mqtt_client import MqttClient
@@ -20,8 +22,22 @@ class HandlerAlarm:
 
     def __init__(self, gemhost: "SecsGemHost"):
         self.gemhost = gemhost
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
         # self.pending_alarms = set()
 
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """
+        Register a callback called with every received alarm
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """
+        Unregister an alarm callback
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
     def alarms_list(self):
         """
         Get alarms list
@@ -43,6 +59,9 @@ class HandlerAlarm:
         alid = decode.ALID.get()
         alcd = decode.ALCD.get()
         altx = decode.ALTX.get().strip()
+        collectors.alarms_received.inc(equipment=self.gemhost.equipment_name,
+                                       state="clear" if alcd == 0 else "set")
+        self.gemhost.state.set_alarm(alid, None if alcd == 0 else altx)
 
         topic = f"equipments/status/alarm_state/{self.gemhost.equipment_name}/{alid}"
         if alcd == 0:
@@ -54,6 +73,14 @@ class HandlerAlarm:
                 topic, altx, qos=2, retain=True)
             # self.pending_alarms.add(alid)
 
+        alarm = {"equipment_name": self.gemhost.equipment_name,
+                 "alid": alid, "alcd": alcd, "altx": altx}
+        for listener in list(self.listeners):
+            try:
+                listener(alarm)
+            except Exception as e:
+                logger.error("Error in alarm listener: %s", e, exc_info=True)
+
     # def clear_pending_alarms(self):
     #     """
     #     Clear pending alarms
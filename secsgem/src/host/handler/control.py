@@ -8,14 +8,18 @@ import secsgem.gem
 import secsgem.hsms
 import secsgem.secs
 from secsgem.secs.data_items import ACKC7
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
-from config.status_variable_define import CONTROL_STATE_VID, PROCESS_STATE_CHANG_EVENT, SUBSCRIBE_LOT_CONTROL, VID_ALARM_SET, VID_PP_NAME
-from config.app_config import MQTT_ENABLE, RECIPE_DIR
+from config.status_variable_define import CONTROL_STATE_EVENT, CONTROL_STATE_VID, PROCESS_STATE_CHANG_EVENT, SUBSCRIBE_LOT_CONTROL, VID_ALARM_SET, VID_PP_NAME
+from config.app_config import (EQUIPMENT_STATUS_MAX_AGE, EVENT_ENABLE_EXTRA, EVENT_ENABLE_POLICY, MQTT_CONTROL_COMMANDS,
+                               MQTT_ENABLE, RECIPE_DIR)
+from src.host.report_plan import plan_diff, plan_entries, plan_hash, report_plans
+from config.logger.output_sink import output
 
 if TYPE_CHECKING:
     # from src.mqtt.mqtt_client import MqttClient
     from src.host.gemhost import SecsGemHost
+    from src.host.transaction import SecsTransaction
 
 logger = logging.getLogger("app_logger")
 
@@ -24,11 +28,43 @@ class SecsControl(Cmd):
     """
     Class for control SECS/GEM equipment with command line interface
     """
+    # commands of the operator CLI, executed by name in shard processes
+    COMMANDS = frozenset({
+        "accept_lot", "add_lot_fclx", "alarms_enable_list", "alarms_list", "apply_event_enable",
+        "collection_event_namelist_request", "communication_request", "data_variable_namelist_request",
+        "define_report", "disable_equipment", "enable_disable_event", "enable_equipment",
+        "equipment_constant_namelist_request", "equipment_constant_request", "get_control_state",
+        "get_equipment_status", "get_event_stats", "get_process_program", "get_process_state",
+        "get_state_changes", "get_transaction_stats", "link_event_report", "offline_request",
+        "online_request", "pp_delete", "pp_list", "pp_load_inquire", "pp_request", "pp_select",
+        "pp_send", "refresh_equipment_status", "reject_lot", "reject_lot_fclx",
+        "select_equipment_status_request", "send_enhanched_remote_command", "send_remote_command",
+        "status_variable_namelist_request", "subscribe_event_report", "subscribe_lot_control",
+        "sync_event_reports", "unsubscribe_event_report",
+    })
 
     def __init__(self, gem_host: 'SecsGemHost'):
         super().__init__()
         self.prompt = f"{gem_host.equipment_name}> "
         self.gem_host = gem_host
+        # (model, CEIDs) of minimal_event_ceids
+        self._event_ceids: Optional[tuple] = None
+
+    def execute(self, command: str, args: list = None, commands=MQTT_CONTROL_COMMANDS):
+        """
+        Execute a SecsControl command by name, used for MQTT and shard commands
+        :param command: SecsControl method name e.g. "pp_select"
+        :param args: list of positional arguments
+        :param commands: allowed command names, default MQTT_CONTROL_COMMANDS, COMMANDS for the operator CLI
+        """
+        if command not in commands or command not in self.COMMANDS:
+            return f"Unknown command: {command}"
+        try:
+            return getattr(self, command)(*(args or []))
+        except Exception as e:
+            logger.error("Error executing %s on %s: %s", command,
+                         self.gem_host.equipment_name, e, exc_info=True)
+            return f"Error executing {command}: {e}"
 
     def initial_equipment(self):
         """
@@ -38,17 +74,19 @@ class SecsControl(Cmd):
         """
         logger.info(
             "Initial equipment Subscribe lot control and Get equipment status")
-        print("Initial equipment Subscribe lot control and Get equipment status")
+        output("Initial equipment Subscribe lot control and Get equipment status")
 
         self.get_control_state()
 
-        self.unsubscribe_event_report()
-        self.subscribe_lot_control()
+        # only reports missing or changed since the last connect are sent
+        self.sync_event_reports()
+        self.apply_event_enable()
 
         self.get_process_state()
         self.get_process_program()
 
         self._sync_alarms_on_mqtt()
+        self._confirm_restored_alarms()
 
     # check alarm status on mqtt
     def _sync_alarms_on_mqtt(self):
@@ -78,6 +116,27 @@ class SecsControl(Cmd):
                 self.gem_host.mqtt_client.client.publish(
                     topic, None, qos=2, retain=True)
 
+    def _confirm_restored_alarms(self):
+        """
+        Clear alarms restored from the state snapshot that are no longer set on the equipment
+        """
+        state = self.gem_host.state
+        if "alarms" not in state.stale:
+            return
+        if state.alarms:
+            response = self.select_equipment_status_request(
+                [VID_ALARM_SET.get(self.gem_host.equipment_model)])
+            if isinstance(response, str):
+                # no reply, confirmed on the next connect
+                return
+            equipment_alids = response.get()[0]
+            if not isinstance(equipment_alids, list):
+                return
+            for alid in list(state.alarms):
+                if alid not in equipment_alids:
+                    state.set_alarm(alid, None)
+        state.confirm("alarms")
+
     def remove_mqtt_retain_message(self):
         """
         Remove alarm on mqtt
@@ -141,7 +200,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_communicating:
             logger.warning("Request Communication Equipment %s is not communicating",
                            self.gem_host.equipment_name)
-            print("Equipment is not communicating")
+            output("Equipment is not communicating")
             return "Equipment is not communicating"
 
         return self.gem_host.settings.streams_functions.decode(
@@ -156,7 +215,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_communicating:
             logger.warning("Request Online Equipment %s is not communicating",
                            self.gem_host.equipment_name)
-            print("Equipment is not communicating")
+            output("Equipment is not communicating")
             return "Equipment is not communicating"
 
         onlack = {0: "ok", 1: "refused", 2: "already online"}
@@ -185,7 +244,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_communicating:
             logger.warning("Request Offline Equipment %s is not communicating",
                            self.gem_host.equipment_name)
-            print("Equipment is not communicating")
+            output("Equipment is not communicating")
             return "Equipment is not communicating"
 
         offlack = {0: "ok"}
@@ -209,7 +268,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Get Process State Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         vid_model = PROCESS_STATE_CHANG_EVENT.get(
@@ -217,18 +276,10 @@ class SecsControl(Cmd):
         if vid_model is None:
             return f"PROCESS_STATE_CHANG_EVENT is not define for {self.gem_host.equipment_model}"
 
-        vid = vid_model.get("VID")
-        state = vid_model.get("STATE")
-        response = self.select_equipment_status_request([vid]).get()
-
-        if isinstance(response, list):
-            state_name = next(state_dict[response[0]]
-                              for state_dict in state if response[0] in state_dict)
-            self.gem_host.process_state = state_name
-            self.gem_host.mqtt_client.client.publish(
-                f"equipments/status/process_state/{self.gem_host.equipment_name}", self.gem_host.process_state, qos=2, retain=True)
-            return state_name
-        return "Failed to get process state"
+        s1f4 = self.gem_host.send_and_waitfor_response(
+            self.gem_host.stream_function(1, 3)([vid_model.get("VID")])
+        )
+        return self._update_process_state(s1f4)
 
     def get_control_state(self):
         """
@@ -237,18 +288,41 @@ class SecsControl(Cmd):
         if not self.gem_host.is_communicating:
             logger.warning("Get Control State Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         vid_model = CONTROL_STATE_VID.get(self.gem_host.equipment_model)
         if vid_model is None:
             return f"CONTROL_STATE_VID is not define for {self.gem_host.equipment_model}"
-        vid = vid_model.get("VID")
-        state = vid_model.get("STATE")
 
         s1f4 = self.gem_host.send_and_waitfor_response(
-            self.gem_host.stream_function(1, 3)([vid])
+            self.gem_host.stream_function(1, 3)([vid_model.get("VID")])
+        )
+        return self._update_control_state(s1f4)
+
+    def get_process_program(self):
+        """
+        Get process program
+        """
+        if not self.gem_host.is_online:
+            logger.warning("Get Process Program Equipment %s is not online",
+                           self.gem_host.equipment_name)
+            output("Equipment is not online")
+            return "Equipment is not online"
+        vid_model = VID_PP_NAME.get(self.gem_host.equipment_model)
+
+        if vid_model is None:
+            return f"VID_PP_NAME is not define for {self.gem_host.equipment_model}"
+
+        s1f4 = self.gem_host.send_and_waitfor_response(
+            self.gem_host.stream_function(1, 3)([vid_model])
         )
+        return self._update_process_program(s1f4)
+
+    def _update_control_state(self, s1f4):
+        """
+        Update control state from S1F4 reply and publish to mqtt
+        """
         if not isinstance(s1f4, secsgem.hsms.HsmsMessage):
             return "Failed to get control state"
 
@@ -256,42 +330,137 @@ class SecsControl(Cmd):
             s1f4)
 
         if not isinstance(response, str):
+            state = CONTROL_STATE_VID.get(
+                self.gem_host.equipment_model).get("STATE")
             response = response.get()
             state_name = state.get(response[0], "Unknown")
-            self.gem_host.control_state = state_name
-            self.gem_host.mqtt_client.client.publish(
-                f"equipments/status/control_state/{self.gem_host.equipment_name}", self.gem_host.control_state, qos=2, retain=True)
+            self._set_status("control_state", state_name)
             return state_name
 
         return response
 
-    def get_process_program(self):
+    def _update_process_state(self, s1f4):
         """
-        Get process program
+        Update process state from S1F4 reply and publish to mqtt
         """
-        if not self.gem_host.is_online:
-            logger.warning("Get Process Program Equipment %s is not online",
-                           self.gem_host.equipment_name)
-            print("Equipment is not online")
-            return "Equipment is not online"
-        vid_model = VID_PP_NAME.get(self.gem_host.equipment_model)
+        if not isinstance(s1f4, secsgem.hsms.HsmsMessage):
+            return "Failed to get process state"
 
-        if vid_model is None:
-            return f"VID_PP_NAME is not define for {self.gem_host.equipment_model}"
+        state = PROCESS_STATE_CHANG_EVENT.get(
+            self.gem_host.equipment_model).get("STATE")
+        response = self.gem_host.settings.streams_functions.decode(
+            s1f4).get()
 
-        response = self.select_equipment_status_request([vid_model])
-        if not isinstance(response, str):
-            response = response.get()
-            self.gem_host.process_program = response[0]
+        if isinstance(response, list):
+            state_name = next(state_dict[response[0]]
+                              for state_dict in state if response[0] in state_dict)
+            self._set_status("process_state", state_name)
+            return state_name
+        return "Failed to get process state"
+
+    def _update_process_program(self, s1f4):
+        """
+        Update process program from S1F4 reply and publish to mqtt
+        """
+        if not isinstance(s1f4, secsgem.hsms.HsmsMessage):
+            return "No response"
+        if (s1f4.header.stream, s1f4.header.function) != (1, 4):
+            logger.warning("Process program of %s: unexpected reply S%sF%s",
+                           self.gem_host.equipment_name, s1f4.header.stream, s1f4.header.function)
+            return "Failed to get process program"
+
+        response = self.gem_host.settings.streams_functions.decode(
+            s1f4).get()
+        # an unknown SVID is answered with an empty item, the known program is kept
+        if not isinstance(response, list) or not response or isinstance(response[0], list):
+            logger.warning("Process program of %s: invalid S1F4 %s",
+                           self.gem_host.equipment_name, response)
+            return "Failed to get process program"
+        self._set_status("process_program", response[0])
+        return response[0]
+
+    def _set_status(self, field: str, value):
+        """
+        Store a status read from the equipment, the retained topic is only republished on change
+        """
+        if self.gem_host.state.set(field, value):
             self.gem_host.mqtt_client.client.publish(
-                f"equipments/status/process_program/{self.gem_host.equipment_name}", self.gem_host.process_program, qos=2, retain=True)
-            return response[0]
-        return response
+                f"equipments/status/{field}/{self.gem_host.equipment_name}", value, qos=2, retain=True)
+
+    def refresh_equipment_status(self):
+        """
+        Read control state, process state and process program
+        with the three S1F3 transactions in flight at once
+        :return: (control_state, process_state, process_program)
+        """
+        if not self.gem_host.is_communicating:
+            logger.warning("Refresh Status Equipment %s is not communicating",
+                           self.gem_host.equipment_name)
+            output("Equipment is not communicating")
+            return ("Equipment is not communicating",) * 3
+
+        control_vid = CONTROL_STATE_VID.get(self.gem_host.equipment_model)
+        process_vid = PROCESS_STATE_CHANG_EVENT.get(
+            self.gem_host.equipment_model)
+        pp_vid = VID_PP_NAME.get(self.gem_host.equipment_model)
+        if control_vid is None or process_vid is None or pp_vid is None:
+            return (f"Status VIDs are not define for {self.gem_host.equipment_model}",) * 3
+
+        s1f4_control, s1f4_process, s1f4_pp = self.send_requests([
+            self.gem_host.stream_function(1, 3)([control_vid.get("VID")]),
+            self.gem_host.stream_function(1, 3)([process_vid.get("VID")]),
+            self.gem_host.stream_function(1, 3)([pp_vid])
+        ])
+
+        control_state = self._update_control_state(s1f4_control)
+        if not self.gem_host.is_online:
+            return control_state, "Equipment is not online", "Equipment is not online"
+
+        return (control_state,
+                self._update_process_state(s1f4_process),
+                self._update_process_program(s1f4_pp))
+
+    def status_expired(self, max_age: Optional[float] = EQUIPMENT_STATUS_MAX_AGE) -> bool:
+        """
+        Check if the equipment must be asked for its status, a value is missing,
+        not confirmed after restore or older than max_age
+        :param max_age: seconds, 0 = always read from the equipment, None = never expire
+        """
+        state = self.gem_host.state
+
+        def expired(field: str) -> bool:
+            age = state.age(field)
+            return age is None or field in state.stale or (max_age is not None and age > float(max_age))
+
+        # an offline equipment does not answer process state and program,
+        # they are only read while the known control state is online
+        return self.gem_host.is_communicating and (
+            expired("control_state") or
+            (self.gem_host.is_online and (expired("process_state") or expired("process_program"))))
+
+    def get_equipment_status(self, max_age: Optional[float] = EQUIPMENT_STATUS_MAX_AGE):
+        """
+        Get equipment status from the state kept up to date by events and replies,
+        the equipment is only asked when a value is missing or older than max_age
+        :param max_age: seconds, 0 = always read from the equipment, None = never expire
+        """
+        if self.status_expired(max_age):
+            return self.equipment_status(*self.refresh_equipment_status())
+        return self.equipment_status()
 
-    def get_equipment_status(self):
+    def equipment_status(self, control_state=None, process_state=None, process_program=None):
         """
-        Get equipment status
+        Equipment status JSON, values not given are taken from the equipment state
         """
+        state = self.gem_host.state
+        if control_state is None:
+            control_state = state.control_state
+            if self.gem_host.is_communicating and not self.gem_host.is_online:
+                process_state = process_program = "Equipment is not online"
+            else:
+                process_state, process_program = state.process_state, state.process_program
+        ages = {field: state.age(field)
+                for field in ("control_state", "process_state", "process_program")}
         # print(getattr(self.gem_host.settings, "connect_mode", None).name)
         status = {
             "equipment_name": self.gem_host.equipment_name,
@@ -302,13 +471,65 @@ class SecsControl(Cmd):
             "connect_mode": getattr(self.gem_host.settings, "connect_mode", None).name,
             "is_enable": self.gem_host.is_enable,
             "is_communication": self.gem_host.is_communicating,
-            "control_state": self.get_control_state(),
-            "process_state": self.get_process_state(),
-            "process_program": self.get_process_program(),
-            "active_lot": self.gem_host.active_lot
+            "control_state": control_state,
+            "process_state": process_state,
+            "process_program": process_program,
+            "active_lot": self.gem_host.active_lot,
+            "version": state.version,
+            "epoch": state.epoch,
+            # seconds since each value was read or reported, null if never
+            "age": {field: None if age is None else round(age, 1) for field, age in ages.items()},
+            # restored at startup, not yet confirmed by the equipment
+            "stale": sorted(state.stale)
         }
         return json.dumps(status, indent=4)
 
+    def get_state_changes(self, version: int = 0, epoch: str = None):
+        """
+        Equipment state changed after version, without SECS traffic
+        :param version: last version seen, -1 = full snapshot
+        :param epoch: epoch received with that version, a full snapshot when it is another
+        """
+        return self.gem_host.state.changes_since(int(version), epoch)
+
+    def get_transaction_stats(self, reset: bool = False):
+        """
+        Round trip statistics by SxFy, the latest slow or timed out transactions
+        and the learned reply deadlines
+        :param reset: clear the statistics after reading, deadlines are kept
+        """
+        stats = {
+            "equipment_name": self.gem_host.equipment_name,
+            "slow_threshold": self.gem_host.transaction_stats.threshold,
+            "window": self.gem_host.transactions.window,
+            "in_flight": self.gem_host.transactions.in_flight,
+            "waiting": self.gem_host.transactions.waiting,
+            "timeouts": self.gem_host.transactions.timeouts.summary(),
+            "transactions": self.gem_host.transaction_stats.summary(),
+            "slow_transactions": self.gem_host.transaction_stats.slow_transactions()
+        }
+        if reset:
+            self.gem_host.transaction_stats.reset()
+        return stats
+
+    # pipelined requests
+    def send_request(self, function: secsgem.secs.SecsStreamFunction) -> 'SecsTransaction':
+        """
+        Send a primary message without blocking
+        :param function: stream function to send
+        :return: SecsTransaction future, wait() returns the reply or None on timeout
+        """
+        return self.gem_host.transactions.submit(function)
+
+    def send_requests(self, functions: list[secsgem.secs.SecsStreamFunction]) -> list[Optional[secsgem.common.Message]]:
+        """
+        Send several primary messages with distinct system bytes and
+        wait for all replies, up to the equipment transaction window in flight
+        :param functions: stream functions to send
+        :return: list of replies (None on timeout) in the same order
+        """
+        return self.gem_host.transactions.request_all(functions)
+
     # get equipment status and variable
     def select_equipment_status_request(self, vids: list[int] = None):
         """
@@ -317,7 +538,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Select Equipment Status Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if vids is None:
@@ -338,7 +559,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Status Variable Namelist Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if svids is None:
@@ -359,7 +580,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Data Variable Namelist Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if vids is None:
@@ -380,7 +601,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Collection Event Namelist Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if ceids is None:
@@ -401,7 +622,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Equipment Constant Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if ecids is None:
@@ -422,7 +643,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Equipment Constant Namelist Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if ecids is None:
@@ -444,7 +665,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Enable/Disable Event Report Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         if ceids is None:
@@ -467,7 +688,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Define Report Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         response = self.gem_host.send_and_waitfor_response(
@@ -479,9 +700,78 @@ class SecsControl(Cmd):
                      3: "1 or more RPTID already defined", 4: "1 or more invalid VID"}
             drack_code = self.gem_host.settings.streams_functions.decode(
                 response).get()
+            if drack_code == 0:
+                report_plans.clear(self.gem_host.equipment_name)
             return drack.get(drack_code, f"unknown code: {drack_code}")
         return "No response"
 
+    def sync_event_reports(self, force: bool = False):
+        """
+        Bring the lot control reports of the equipment to SUBSCRIBE_LOT_CONTROL,
+        reports recorded as applied and unchanged are not sent again, only read back (S6F19)
+        :param force: delete all reports and define them again
+        """
+        subscribe = SUBSCRIBE_LOT_CONTROL.get(self.gem_host.equipment_model)
+        if subscribe is None:
+            return f"SUBSCRIBE_LOT_CONTROL is not define for {self.gem_host.equipment_model}"
+        if not self.gem_host.is_online:
+            logger.warning("Sync Event Reports Equipment %s is not online",
+                           self.gem_host.equipment_name)
+            output("Equipment is not online")
+            return "Equipment is not online"
+
+        record = None if force in (True, "true", "force") else report_plans.load(
+            self.gem_host.equipment_name)
+        desired = plan_entries(subscribe)
+        if record is not None and record["hash"] == plan_hash(desired):
+            if not self._reports_lost(record["reports"]):
+                logger.info("Event reports of %s are up to date",
+                            self.gem_host.equipment_name)
+                return "Event reports up to date"
+            # the equipment lost its reports, e.g. reset or reboot
+            logger.warning("Event reports recorded for %s are not defined on the equipment, defining them again",
+                           self.gem_host.equipment_name)
+            record = None
+        if record is None:
+            # reports on the equipment are unknown, start from none
+            self.unsubscribe_event_report()
+            return self.subscribe_lot_control()
+
+        remove, add = plan_diff(record["reports"], desired)
+        logger.info("Event reports of %s changed, delete %s define %s",
+                    self.gem_host.equipment_name, remove, add)
+        applied = dict(record["reports"])
+        if remove:
+            # a report deleted with an empty VID list also loses its event links
+            responses = self.send_requests([self.gem_host.stream_function(2, 33)(
+                {"DATAID": 0, "DATA": [{"RPTID": int(rptid), "VID": []}]}) for rptid in remove])
+            for rptid, response in zip(remove, responses):
+                if self._decode_ack(response, {0: "ok"}) == "ok":
+                    applied.pop(rptid, None)
+        subs = [dict(desired[rptid], REPORT_ID=int(rptid))
+                for rptid in add if rptid not in applied]
+        results = self._define_link_enable(subs)
+        applied.update({str(sub["REPORT_ID"]): desired[str(sub["REPORT_ID"])]
+                        for sub in subs if results[sub["CEID"]] == "ok"})
+        report_plans.save(self.gem_host.equipment_name, applied)
+        return results
+
+    def _reports_lost(self, reports: dict[str, dict]) -> bool:
+        """
+        Read recorded reports back with S6F19 Individual Report Request, read only.
+        An equipment answers an empty list for a report it does not have.
+        :return: True if a report is known to be missing, False if all are defined
+            or the equipment does not support S6F19 (the record is trusted then)
+        """
+        responses = self.send_requests([self.gem_host.stream_function(6, 19)(int(rptid))
+                                        for rptid in reports])
+        for response in responses:
+            if (isinstance(response, secsgem.hsms.HsmsMessage)
+                    and (response.header.stream, response.header.function) == (6, 20)
+                    and len(self.gem_host.settings.streams_functions.decode(response).get()) == 0):
+                return True
+        return False
+
     def link_event_report(self, ceid: int, report_id: int):
         """
         2F35 Link Event Report
@@ -489,7 +779,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Link Event Report Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         response = self.gem_host.send_and_waitfor_response(
@@ -527,10 +817,10 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("Undefine Report Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
-        print("Unsubscribe event report : ", self.gem_host.equipment_name)
+        output("Unsubscribe event report : %s", self.gem_host.equipment_name)
         response = self.gem_host.send_and_waitfor_response(
             self.gem_host.stream_function(2, 33)(
                 {"DATAID": 0, "DATA": []})
@@ -546,20 +836,134 @@ class SecsControl(Cmd):
     def subscribe_lot_control(self):
         """
         Subscribe lot control
+        Define reports, link events and enable events, every phase is pipelined
+        :return: "ok" or the failure by CEID
         """
 
         subscribe = SUBSCRIBE_LOT_CONTROL.get(self.gem_host.equipment_model)
         if subscribe is None:
             return f"SUBSCRIBE_LOT_CONTROL is not define for {self.gem_host.equipment_model}"
 
-        print("Subscribe lot control : ", self.gem_host.equipment_name)
         for sub in subscribe:
-            ceid = sub.get("CEID")
-            dvs = sub.get("DVS")
-            report_id = sub.get("REPORT_ID")
-            if ceid is None or dvs is None or report_id is None:
+            if sub.get("CEID") is None or sub.get("DVS") is None or sub.get("REPORT_ID") is None:
                 return "CEID or DVS or Report ID is not define"
-            print(self.subscribe_event_report(ceid, dvs, report_id))
+
+        if not self.gem_host.is_online:
+            logger.warning("Subscribe Lot Control Equipment %s is not online",
+                           self.gem_host.equipment_name)
+            output("Equipment is not online")
+            return "Equipment is not online"
+
+        output("Subscribe lot control : %s", self.gem_host.equipment_name)
+        results = self._define_link_enable(subscribe)
+
+        for sub in subscribe:
+            ceid = sub.get("CEID")
+            if results[ceid] == "ok":
+                output("Subscribe CEID %s VIDs %s Report ID %s success",
+                       ceid, sub.get('DVS'), sub.get('REPORT_ID'))
+            else:
+                output(results[ceid])
+
+        # record what is now defined on the equipment for the next connect
+        desired = plan_entries(subscribe)
+        report_plans.save(self.gem_host.equipment_name, {
+            str(sub["REPORT_ID"]): desired[str(sub["REPORT_ID"])] for sub in subscribe if results[sub["CEID"]] == "ok"})
+        return results
+
+    def minimal_event_ceids(self) -> frozenset:
+        """
+        CEIDs the host handles for the equipment model: lot control reports,
+        control state events and EVENT_ENABLE_EXTRA
+        """
+        model = self.gem_host.equipment_model
+        if self._event_ceids is None or self._event_ceids[0] != model:
+            ceids = {sub["CEID"] for sub in SUBSCRIBE_LOT_CONTROL.get(model, [])}
+            ceids.update(CONTROL_STATE_EVENT.get(model, {}))
+            ceids.update(EVENT_ENABLE_EXTRA.get(model, []))
+            self._event_ceids = (model, frozenset(ceids))
+        return self._event_ceids[1]
+
+    def apply_event_enable(self):
+        """
+        S2F37 Disable every event, then enable only the CEIDs the host handles.
+        Both are sent at once so the equipment applies them back to back.
+        """
+        if EVENT_ENABLE_POLICY != "minimal":
+            return f"Event enable policy is {EVENT_ENABLE_POLICY}"
+        if not self.gem_host.is_online:
+            logger.warning("Event Enable Equipment %s is not online",
+                           self.gem_host.equipment_name)
+            output("Equipment is not online")
+            return "Equipment is not online"
+
+        ceids = sorted(self.minimal_event_ceids())
+        erack = {0: "ok", 1: "denied"}
+        disable_all, enable = self.send_requests([
+            self.gem_host.stream_function(2, 37)([0, []]),
+            self.gem_host.stream_function(2, 37)([1, ceids])
+        ])
+        self.gem_host.handler_event.disabled_ceids.clear()
+        result = {"disable_all": self._decode_ack(disable_all, erack),
+                  "enable": self._decode_ack(enable, erack), "ceids": ceids}
+        if result["enable"] != "ok":
+            # the whole list is denied when one CEID is unknown to the equipment
+            responses = self.send_requests([self.gem_host.stream_function(2, 37)([1, [ceid]])
+                                            for ceid in ceids])
+            result["enable"] = {ceid: self._decode_ack(response, erack)
+                                for ceid, response in zip(ceids, responses)}
+        logger.info("Event enable on %s: %s",
+                    self.gem_host.equipment_name, result)
+        return result
+
+    def get_event_stats(self, reset: bool = False):
+        """
+        Received and unhandled events of the equipment
+        :param reset: start counting again
+        """
+        return self.gem_host.handler_event.stats(reset in (True, "true", "reset"))
+
+    def _define_link_enable(self, subscribe: list[dict]) -> dict:
+        """
+        Define reports, link events and enable events, every phase is pipelined
+        :return: "ok" or the failure by CEID
+        """
+        drack = {0: "ok", 1: "out of space", 2: "invalid format",
+                 3: "1 or more RPTID already defined", 4: "1 or more invalid VID"}
+        lrack = {0: "ok", 1: "out of space", 2: "invalid format",
+                 3: "1 or more CEID links already defined", 4: "1 or more CEID invalid", 5: "1 or more RPTID invalid"}
+        erack = {0: "ok", 1: "denied"}
+
+        results = {sub.get("CEID"): "ok" for sub in subscribe}
+
+        def run_phase(subs: list[dict], build, codes: dict):
+            responses = self.send_requests([build(sub) for sub in subs])
+            passed = []
+            for sub, response in zip(subs, responses):
+                result = self._decode_ack(response, codes)
+                if result == "ok":
+                    passed.append(sub)
+                else:
+                    results[sub.get("CEID")] = result
+            return passed
+
+        defined = run_phase(subscribe, lambda sub: self.gem_host.stream_function(2, 33)(
+            {"DATAID": 0, "DATA": [{"RPTID": sub.get("REPORT_ID"), "VID": sub.get("DVS")}]}), drack)
+        linked = run_phase(defined, lambda sub: self.gem_host.stream_function(2, 35)(
+            {"DATAID": 0, "DATA": [{"CEID": sub.get("CEID"), "RPTID": [sub.get("REPORT_ID")]}]}), lrack)
+        run_phase(linked, lambda sub: self.gem_host.stream_function(2, 37)(
+            [1, [sub.get("CEID")]]), erack)
+        return results
+
+    def _decode_ack(self, response, codes: dict):
+        """
+        Decode single ack code reply
+        """
+        if not isinstance(response, secsgem.hsms.HsmsMessage):
+            return "No response"
+        code = self.gem_host.settings.streams_functions.decode(
+            response).get()
+        return codes.get(code, f"unknown code: {code}")
 
     # lot management
     def accept_lot(self, lot_id: str):
@@ -663,10 +1067,10 @@ class SecsControl(Cmd):
             # Write recipe data to file
             with open(full_path, "wb") as f:
                 f.write(recipe_data)
-                print(f"Recipe {recipe_name} stored successfully")
+                output("Recipe %s stored successfully", recipe_name)
                 return True
         except Exception as e:
-            print(f"Error storing recipe {recipe_name}: {e}")
+            output("Error storing recipe %s: %s", recipe_name, e)
             return False
 
     def _get_recipe(self, recipe_name: str):
@@ -686,10 +1090,10 @@ class SecsControl(Cmd):
             # Read recipe data from file
             with open(full_path, "rb") as f:
                 recipe_data = f.read()
-                print(f"Recipe {recipe_name} read successfully")
+                output("Recipe %s read successfully", recipe_name)
                 return recipe_data
         except Exception as e:
-            print(f"Error reading recipe {recipe_name}: {e}")
+            output("Error reading recipe %s: %s", recipe_name, e)
             return None
 
     def pp_list(self):
@@ -699,7 +1103,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("PP Directory Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         response = self.gem_host.send_and_waitfor_response(
@@ -717,7 +1121,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("PP Load Inquire Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         pp_body = self._get_recipe(ppid)
@@ -757,8 +1161,8 @@ class SecsControl(Cmd):
             7, 2)(ACKC7.ACCEPTED), message.header.system)
 
         decode = self.gem_host.settings.streams_functions.decode(message)
-        print(decode)
-        print(decode.get())
+        output(decode)
+        output(decode.get())
 
     def pp_request(self, ppid: str):
         """
@@ -767,7 +1171,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("PP Request Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         response = self.gem_host.send_and_waitfor_response(
@@ -779,7 +1183,7 @@ class SecsControl(Cmd):
             ppid_ = decode_response.PPID.get()
             ppbody = decode_response.PPBODY.get()
             if not ppid or not ppbody:
-                print("PPID or PPBODY is empty")
+                output("PPID or PPBODY is empty")
                 return "PPID or PPBODY is empty"
 
             self._store_recipe(ppid_, ppbody)
@@ -812,7 +1216,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("PP Delete Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         response = self.gem_host.send_and_waitfor_response(
@@ -825,9 +1229,7 @@ class SecsControl(Cmd):
 
             response_code = self.gem_host.settings.streams_functions.decode(
                 response).get()
-            logger.info("PP Delete PPID: %s on %s", ppids,
-                        self.gem_host.equipment_name)
-            logger.info("PP Delete HCACK: %s",
+            logger.info("PP Delete PPID: %s on %s, ACKC7: %s", ppids, self.gem_host.equipment_name,
                         ackc7.get(response_code, f"Unknown code: {response_code}"))
             return ackc7.get(response_code, f"Unknown code: {response_code}")
         logger.warning("PP Delete No response")
@@ -840,7 +1242,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("PP Send Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         pp_body = self._get_recipe(ppid)
@@ -857,9 +1259,7 @@ class SecsControl(Cmd):
                      6: "Initiated for asynchronous completion", 7: "Storage limit error"}
             response_code = self.gem_host.settings.streams_functions.decode(
                 response).get()
-            logger.info("PP Send PPID: %s to %s", ppid,
-                        self.gem_host.equipment_name)
-            logger.info("PP Send HCACK: %s",
+            logger.info("PP Send PPID: %s to %s, ACKC7: %s", ppid, self.gem_host.equipment_name,
                         ackc7.get(response_code, f"Unknown code: {response_code}"))
             return ackc7.get(response_code, f"Unknown code: {response_code}")
         logger.warning("PP Send No response")
@@ -886,10 +1286,8 @@ class SecsControl(Cmd):
                 response)
             hcack = {0: "OK", 1: "Invalid Command", 2: "Cannot Do Now", 3: "Parameter Error",
                      4: "Initiated for Asynchronous Completion", 5: "Rejected, Already in Desired Condition", 6: "Invalid Object"}
-            logger.info("PP Select PPID: %s on %s", ppid,
-                        self.gem_host.equipment_name)
-            logger.info("PP Select HCACK: %s", hcack.get(
-                s2f42_decode.HCACK.get(), "Unknown code"))
+            logger.info("PP Select PPID: %s on %s, HCACK: %s", ppid, self.gem_host.equipment_name,
+                        hcack.get(s2f42_decode.HCACK.get(), "Unknown code"))
             return hcack.get(s2f42_decode.HCACK.get(), 'Unknown code')
         logger.warning("PP Select No response")
         return "No response"
@@ -964,7 +1362,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("List Alarm Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
         # secsgem.secs.variables.U4(0)
         alid_U4 = [secsgem.secs.variables.U8(i) for i in alid]
@@ -985,7 +1383,7 @@ class SecsControl(Cmd):
         if not self.gem_host.is_online:
             logger.warning("List Enable Alarm Equipment %s is not online",
                            self.gem_host.equipment_name)
-            print("Equipment is not online")
+            output("Equipment is not online")
             return "Equipment is not online"
 
         response = self.gem_host.send_and_waitfor_response(
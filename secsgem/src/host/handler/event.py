@@ -1,14 +1,19 @@
 import logging
+import threading
 import time
-from typing import TYPE_CHECKING, Optional, Tuple, List, Dict, Any
+from collections import Counter
+from typing import TYPE_CHECKING, Callable, Optional, Tuple, List, Dict, Any
 import secsgem.common
 import secsgem.gem
 import secsgem.hsms
 import secsgem.secs
 from secsgem.secs.data_items import ACKC6
 
+from config.app_config import EVENT_DISABLE_UNHANDLED
 from config.status_variable_define import CONTROL_STATE_EVENT, PROCESS_STATE_NAME
 from src.host.handler.lot_management.validate import ValidateLot
+from src.host.transaction import PRIORITY_CRITICAL
+from src.metrics import collectors
 
 if TYPE_CHECKING:
     from src.host.gemhost import SecsGemHost
@@ -30,6 +35,27 @@ class HandlerEvent:
 
     def __init__(self, gem_host: 'SecsGemHost'):
         self.gem_host = gem_host
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        # events without handler by CEID since started
+        self.received = 0
+        self.unhandled: Counter = Counter()
+        self.since = time.monotonic()
+        # unhandled CEIDs disabled on the equipment during this connection
+        self.disabled_ceids: set[int] = set()
+        self._stats_lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """
+        Register a callback called with every received event
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """
+        Unregister an event callback
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
 
     def receive_event(self, _, message: secsgem.common.Message):
         """
@@ -37,15 +63,79 @@ class HandlerEvent:
         """
         try:
             decode = self.gem_host.settings.streams_functions.decode(message)
+            reports = {}
             for rpt in decode.RPT:
                 if rpt:
+                    reports[rpt.RPTID.get()] = rpt.V.get()
                     self._process_report(rpt.RPTID.get(), rpt.V.get())
 
             ceid = decode.CEID.get()
+            collectors.events_received.inc(
+                equipment=self.gem_host.equipment_name)
+            with self._stats_lock:
+                self.received += 1
+            if ceid not in self.gem_host.secs_control.minimal_event_ceids():
+                self._unhandled_event(ceid)
             self._control_state(ceid)
+            self._notify_listeners(
+                {"equipment_name": self.gem_host.equipment_name, "ceid": ceid, "reports": reports})
         except Exception as e:
             logger.error("Error processing event: %s", e, exc_info=True)
 
+    def _unhandled_event(self, ceid: int):
+        """
+        Count an event the host has no handler for, and disable it on the equipment
+        once per connection with EVENT_DISABLE_UNHANDLED, unless a listener may want it
+        """
+        collectors.events_unhandled.inc(
+            equipment=self.gem_host.equipment_name, ceid=str(ceid))
+        with self._stats_lock:
+            self.unhandled[ceid] += 1
+            if not EVENT_DISABLE_UNHANDLED or self.listeners or ceid in self.disabled_ceids \
+                    or not self.gem_host.is_communicating:
+                return
+            self.disabled_ceids.add(ceid)
+        logger.info("Disable unhandled CEID %s on %s",
+                    ceid, self.gem_host.equipment_name)
+        # neither the reply nor a slot is waited for, the event thread continues
+        if self.gem_host.transactions.submit(
+                self.gem_host.stream_function(2, 37)([0, [ceid]]), wait_slot=False) is None:
+            # window is full, tried again on the next event of this CEID
+            with self._stats_lock:
+                self.disabled_ceids.discard(ceid)
+
+    def stats(self, reset: bool = False) -> Dict[str, Any]:
+        """
+        Received and unhandled event counts and unhandled events per minute by CEID
+        :param reset: start counting again
+        """
+        with self._stats_lock:
+            minutes = max(time.monotonic() - self.since, 1e-6) / 60
+            stats = {
+                "equipment_name": self.gem_host.equipment_name,
+                "seconds": round(minutes * 60, 1),
+                "received": self.received,
+                "unhandled": sum(self.unhandled.values()),
+                "unhandled_per_minute": {ceid: round(count / minutes, 2)
+                                         for ceid, count in self.unhandled.most_common()},
+                "disabled_ceids": sorted(self.disabled_ceids),
+            }
+            if reset:
+                self.received = 0
+                self.unhandled.clear()
+                self.since = time.monotonic()
+            return stats
+
+    def _notify_listeners(self, event: Dict[str, Any]):
+        """
+        Pass event to registered listeners
+        """
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error("Error in event listener: %s", e, exc_info=True)
+
     def _process_report(self, rptid: int, values: List[Any]):
         """
         Process a report based on its RPTID.
@@ -58,7 +148,11 @@ class HandlerEvent:
             RPTID_STATE_CHANGE: self._process_state_change,
         }
         handler = event_handlers.get(rptid)
-        if handler:
+        if handler and rptid == RPTID_VALIDATE_LOT:
+            # the equipment waits for accept or reject, ahead of status polls
+            with self.gem_host.transactions.priority(PRIORITY_CRITICAL):
+                handler(values)
+        elif handler:
             handler(values)
         else:
             logger.error("No handler for RPTID: %s", rptid)
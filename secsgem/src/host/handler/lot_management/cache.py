@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import requests
+
+from src.metrics import collectors
+
+
+class TtlCache:
+    """
+    Thread safe cache of API responses, entries expire after ttl seconds.
+    ttl 0 disables the cache.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key) -> Optional[Any]:
+        """
+        Cached value or None when missing, expired or cache disabled
+        """
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        """
+        Store value, the least recently used entry is dropped when full
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Remove one entry or all entries
+        """
+        with self._lock:
+            if key is None:
+                self._items.clear()
+            else:
+                self._items.pop(key, None)
+
+    def stats(self) -> dict:
+        """Hit and miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": round(self.hits / total, 3) if total else 0.0}
+
+    def reset_stats(self):
+        """Reset hit and miss counters"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+class ConditionalCache:
+    """
+    Last response of each API url with its validators (ETag, Last-Modified).
+    Requests send them back and a 304 Not Modified reuses the parsed body,
+    so unchanged data is neither downloaded nor parsed again.
+    """
+
+    def __init__(self, api: str, max_size: int = 1000):
+        """
+        :param api: name of the API in the http api metrics
+        """
+        self.api = api
+        self.max_size = max_size
+        self.not_modified = 0
+        self.modified = 0
+        self._lock = threading.Lock()
+        # url: (etag, last modified, parsed body)
+        self._items: OrderedDict[str, tuple[Optional[str], Optional[str], Any]] = OrderedDict()
+
+    def get(self, url: str, conditional: bool = True, timeout: float = 10) -> tuple[Any, bool]:
+        """
+        GET a JSON document
+        :param conditional: send the validators of the cached response
+        :return: (parsed body, changed), changed is False when the server answered 304
+        :raise requests.exceptions.RequestException: request failed or error status
+        """
+        headers = {'Accept': 'application/json'}
+        with self._lock:
+            cached = self._items.get(url)
+        if conditional and cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        with collectors.http_api_latency.time(api=self.api):
+            try:
+                response = requests.get(url, timeout=timeout, headers=headers)
+                response.raise_for_status()
+            except requests.exceptions.RequestException:
+                collectors.http_api_errors.inc(api=self.api)
+                raise
+
+        if response.status_code == 304 and cached is not None:
+            with self._lock:
+                self.not_modified += 1
+                if url in self._items:
+                    self._items.move_to_end(url)
+            return cached[2], False
+
+        body = response.json()
+        with self._lock:
+            self.modified += 1
+            self._items[url] = (response.headers.get("ETag"), response.headers.get("Last-Modified"), body)
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return body, True
+
+    def invalidate(self, url: str = None):
+        """
+        Remove one response or all responses, the next request is unconditional
+        """
+        with self._lock:
+            if url is None:
+                self._items.clear()
+            else:
+                self._items.pop(url, None)
+
+    def stats(self) -> dict:
+        """Responses kept and 304 / 200 counters"""
+        with self._lock:
+            total = self.not_modified + self.modified
+            return {"size": len(self._items), "not_modified": self.not_modified, "modified": self.modified,
+                    "not_modified_ratio": round(self.not_modified / total, 3) if total else 0.0}
+
+    def reset_stats(self):
+        """Reset 304 / 200 counters"""
+        with self._lock:
+            self.not_modified = 0
+            self.modified = 0
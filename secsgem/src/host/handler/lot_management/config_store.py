@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+
+from config.app_config import VALIDATE_CONFIG_API_PAGE_SIZE, VALIDATE_CONFIG_DB_PATH, VALIDATE_CONFIG_SYNC_INTERVAL
+from src.host.handler.lot_management.cache import ConditionalCache
+
+logger = logging.getLogger("app_logger")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS equipment_config (
+    equipment_name TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS package_config (
+    equipment_name TEXT NOT NULL,
+    package8digit TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    config TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS package_config_match ON package_config (equipment_name, package8digit);
+"""
+
+
+class ValidateConfigStore:
+    """
+    Last known lot validate configuration of every equipment in SQLite (WAL mode),
+    one row per package of an equipment indexed for the package code match.
+    One connection is shared by the sync and the lot validation threads behind a lock,
+    it is opened and the schema created once on first use.
+    """
+
+    def __init__(self, path: str = VALIDATE_CONFIG_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # call with self._lock held
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._db = connection
+        return self._db
+
+    def package_configs(self, equipment_name: str, package8digit: str) -> Optional[list[dict]]:
+        """
+        Configurations of an equipment for the first 8 digits of a package code
+        :return: list of config dict as in the API, None if the equipment is not in the store
+        """
+        with self._lock:
+            connection = self._connection()
+            rows = connection.execute(
+                "SELECT config FROM package_config WHERE equipment_name = ? AND package8digit = ? ORDER BY position",
+                (equipment_name, package8digit)).fetchall()
+            known = rows or connection.execute(
+                "SELECT 1 FROM equipment_config WHERE equipment_name = ?", (equipment_name,)).fetchone()
+        if rows:
+            return [json.loads(row[0]) for row in rows]
+        return [] if known else None
+
+    def replace(self, equipment_name: str, config: list[dict]) -> bool:
+        """
+        Store the configuration of an equipment
+        :param config: "config" list of the equipment document of the API
+        :return: True if it changed
+        """
+        encoded = json.dumps(config, sort_keys=True)
+        with self._lock:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT config FROM equipment_config WHERE equipment_name = ?", (equipment_name,)).fetchone()
+            if row is not None and row[0] == encoded:
+                connection.execute("UPDATE equipment_config SET synced_at = ? WHERE equipment_name = ?",
+                                   (time.time(), equipment_name))
+                connection.commit()
+                return False
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO equipment_config (equipment_name, config, synced_at) VALUES (?, ?, ?)",
+                    (equipment_name, encoded, time.time()))
+                connection.execute(
+                    "DELETE FROM package_config WHERE equipment_name = ?", (equipment_name,))
+                connection.executemany(
+                    "INSERT INTO package_config (equipment_name, package8digit, position, config) VALUES (?, ?, ?, ?)",
+                    [(equipment_name, str(item.get("package8digit", "")), position, json.dumps(item))
+                     for position, item in enumerate(config)])
+            return True
+
+    def remove(self, equipment_names: list[str]):
+        """Forget equipments whose configuration was deleted in the API"""
+        with self._lock:
+            with self._connection() as connection:
+                for equipment_name in equipment_names:
+                    connection.execute(
+                        "DELETE FROM equipment_config WHERE equipment_name = ?", (equipment_name,))
+                    connection.execute(
+                        "DELETE FROM package_config WHERE equipment_name = ?", (equipment_name,))
+
+    def equipments(self) -> dict[str, float]:
+        """Equipment name: epoch seconds of the last sync"""
+        with self._lock:
+            return dict(self._connection().execute(
+                "SELECT equipment_name, synced_at FROM equipment_config").fetchall())
+
+
+# process wide store, shared by the sync thread and lot validation
+validate_config_store = ValidateConfigStore()
+
+
+class ValidateConfigSync:
+    """
+    Keep the validate config store current with the API every interval seconds,
+    each round costs one 304 response per page while nothing changed.
+    When the API is unreachable the store keeps serving the last known configuration.
+    """
+
+    def __init__(self, store: ValidateConfigStore = validate_config_store,
+                 interval: float = VALIDATE_CONFIG_SYNC_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self.responses = ConditionalCache("validate_configs_sync")
+        self.last_sync: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="validate-config-sync", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # first round at once, a new host has an empty store
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error("Error syncing validate configs: %s", e, exc_info=True)
+            if self._stop.wait(self.interval):
+                return
+
+    def sync(self) -> Optional[dict]:
+        """
+        Fetch every page of the validate configs and store the changed ones
+        :return: {"changed", "removed"} or None if the API is unreachable or a page is malformed,
+                 the store is left unchanged then
+        """
+        load_dotenv()
+        api_server = os.getenv("API_SERVER")
+        api_port = os.getenv("API_PORT")
+        api_endpoint = os.getenv("API_ENDPOINT")
+
+        docs = []
+        changed = False
+        page = 1
+        try:
+            while True:
+                api_url = (f"http://{api_server}:{api_port}/{api_endpoint}/validate/configs"
+                           f"?page={page}&limit={VALIDATE_CONFIG_API_PAGE_SIZE}&sort=equipment_name&order=1")
+                body, page_changed = self.responses.get(api_url)
+                changed = changed or page_changed
+                page_docs = body.get("docs") if isinstance(body, dict) else None
+                if not isinstance(page_docs, list) or not all(isinstance(doc, dict) for doc in page_docs):
+                    raise ValueError(f"malformed page {page} of validate configs")
+                docs.extend(page_docs)
+                if not body.get("hasNextPage"):
+                    break
+                page += 1
+            total = body.get("totalDocs")
+            if isinstance(total, int) and total != len(docs):
+                raise ValueError(f"incomplete validate configs, {len(docs)} of {total}")
+            if not docs:
+                raise ValueError("empty validate config listing")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # nothing stored or removed from a partial listing, the next round fetches every page again
+            self.responses.invalidate()
+            self.last_error = str(e)
+            logger.warning("Validate configs not synced, serving the stored ones: %s", e)
+            return None
+
+        self.last_sync = time.time()
+        self.last_error = None
+        if not changed:
+            return {"changed": [], "removed": []}
+        names = set()
+        updated = []
+        for doc in docs:
+            name = doc.get("equipment_name")
+            if not name:
+                continue
+            names.add(name)
+            if self.store.replace(name, doc.get("config", [])):
+                updated.append(name)
+        # the listing is complete here, only it tells which equipments were deleted
+        removed = [name for name in self.store.equipments() if name not in names]
+        self.store.remove(removed)
+        if updated or removed:
+            logger.info("Validate configs synced, changed %s, removed %s", updated, removed)
+        return {"changed": updated, "removed": removed}
+
+    def stats(self) -> dict:
+        """Equipments stored, last successful sync and error"""
+        return {"equipments": len(self.store.equipments()), "last_sync": self.last_sync,
+                "last_error": self.last_error, "responses": self.responses.stats()}
+
+    def stop(self):
+        """Stop syncing"""
+        self._stop.set()
+        self._thread.join(timeout=1)
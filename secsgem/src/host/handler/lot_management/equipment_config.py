@@ -4,12 +4,20 @@ from dataclasses import dataclass, field
 import os
 from typing import List, Optional
 
-import requests
 from dotenv import load_dotenv
 
+from config.app_config import EQUIPMENT_CONFIG_CACHE_TTL, VALIDATE_CONFIG_STORE_ENABLE
+from src.host.handler.lot_management.cache import ConditionalCache, TtlCache
+from src.host.handler.lot_management.config_store import validate_config_store
+
 # Configure logger
 logger = logging.getLogger("app_logger")
 
+# validate config list by equipment name
+equipment_config_cache = TtlCache(EQUIPMENT_CONFIG_CACHE_TTL)
+# responses revalidated with ETag / Last-Modified once the ttl expired
+validate_config_responses = ConditionalCache("validate_configs")
+
 
 @dataclass
 class AllowToolId:
@@ -58,10 +66,29 @@ class EquipmentConfig:
     data_with_selection_code: Optional[DataWithSelectionCode] = None
 
     def __post_init__(self):
+        if VALIDATE_CONFIG_STORE_ENABLE and self._load_config_from_store():
+            return
         self._load_config_from_api()
 
+    def _load_config_from_store(self) -> bool:
+        """
+        Load Equipment Configuration data from the local store kept current by ValidateConfigSync
+        :return: False if the equipment is not in the store yet
+        """
+        configs = validate_config_store.package_configs(
+            self.equipment_name, self.package_code[:8])
+        if configs is None:
+            return False
+        self._find_matching_config(configs)
+        return True
+
     def _load_config_from_api(self):
         """Load Equipment Configuration data from API"""
+        config = equipment_config_cache.get(self.equipment_name)
+        if config is not None:
+            self._find_matching_config(config)
+            return
+
         load_dotenv()
         api_server = os.getenv("API_SERVER")
         api_port = os.getenv("API_PORT")
@@ -70,18 +97,17 @@ class EquipmentConfig:
         # create url
         api_url = f"http://{api_server}:{api_port}/{api_endpoint}//validate/configs?filter={self.equipment_name}&fields=equipment_name"
 
-        response = requests.get(
-            api_url,
-            timeout=10,
-            headers={'Accept': 'application/json'}
-        )
-        response.raise_for_status()
-        response_data = response.json()
+        # 304 when unchanged, the previous response is reused without parsing
+        response_data, _ = validate_config_responses.get(api_url)
 
         if isinstance(response_data, dict):
             if response_data.get("totalDocs") == 1:
                 docs = response_data.get("docs")
                 config = docs[0].get("config", [])
+                equipment_config_cache.put(self.equipment_name, config)
+                if VALIDATE_CONFIG_STORE_ENABLE:
+                    # served from the store from now on, also when the API is down
+                    validate_config_store.replace(self.equipment_name, config)
                 self._find_matching_config(config)
 
     def _load_config_from_file(self):
@@ -6,9 +6,14 @@ from urllib.parse import quote, urlencode
 
 import requests
 from dotenv import load_dotenv
-# from config.app_config import
+from config.app_config import LOT_INFO_CACHE_TTL
+from src.host.handler.lot_management.cache import TtlCache
+from src.metrics import collectors
 logger = logging.getLogger("app_logger")
 
+# successful lot information responses by lot id
+lot_info_cache = TtlCache(LOT_INFO_CACHE_TTL)
+
 
 class LotInformation:
     """
@@ -40,18 +45,25 @@ class LotInformation:
         api_endpoint = os.getenv("API_ENDPOINT")
 
         try:
-            # create url
-            api_url = f"http://{api_server}:{api_port}/{api_endpoint}/lotinfo/{self.lot_id}"
-            # print(api_url)
-            response = requests.get(
-                api_url,
-                timeout=10,
-                headers={'Accept': 'application/json'}
-            )
-            response.raise_for_status()
-
-            # Validate response format
-            self.lot_data = response.json()
+            self.lot_data = lot_info_cache.get(self.lot_id)
+            if self.lot_data is None:
+                # create url
+                api_url = f"http://{api_server}:{api_port}/{api_endpoint}/lotinfo/{self.lot_id}"
+                # print(api_url)
+                with collectors.http_api_latency.time(api="lotinfo"):
+                    try:
+                        response = requests.get(
+                            api_url,
+                            timeout=10,
+                            headers={'Accept': 'application/json'}
+                        )
+                        response.raise_for_status()
+                    except requests.exceptions.RequestException:
+                        collectors.http_api_errors.inc(api="lotinfo")
+                        raise
+
+                # Validate response format
+                self.lot_data = response.json()
 
             if self.lot_data and isinstance(self.lot_data, dict):
                 self.status = self.lot_data.get("Status", False)
@@ -61,6 +73,7 @@ class LotInformation:
                         "Failed to retrieve Lot:%s, Information: %s", self.message, self.message)
                     self.lot_data = None
                     return
+                lot_info_cache.put(self.lot_id, self.lot_data)
                 output_info = self.lot_data.get("OutputLotInfo", [])
                 for field in output_info:
                     self.field_by_name[field["FieldName"]] = field["Value"]
@@ -194,13 +207,14 @@ class LotInformation:
             url = self._build_url(lot_ids)
             for attempt in range(max_retries):
                 try:
-                    response = requests.get(
-                        url,
-                        timeout=self.timeout,
-                        headers={'Accept': 'application/json'}
-                    )
+                    with collectors.http_api_latency.time(api="oee_lotinfo"):
+                        response = requests.get(
+                            url,
+                            timeout=self.timeout,
+                            headers={'Accept': 'application/json'}
+                        )
 
-                    response.raise_for_status()
+                        response.raise_for_status()
 
                     # Validate response format
                     data = response.json()
@@ -210,6 +224,7 @@ class LotInformation:
                     return data
 
                 except requests.exceptions.RequestException as e:
+                    collectors.http_api_errors.inc(api="oee_lotinfo")
                     print(
                         f"API request failed(attempt {attempt+1}/{max_retries}): {str(e)}")
                     if attempt == max_retries - 1:
@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+from config.app_config import (RECONNECT_JITTER, RECONNECT_PROGRESS_INTERVAL, RECONNECT_PROGRESS_TOPIC,
+                               RECONNECT_SYNC_CONCURRENCY)
+from src.host import secsgem_compat
+from src.metrics import collectors
+
+if TYPE_CHECKING:
+    from src.host.gemhost import SecsGemHost
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+
+class ReconnectSupervisor:
+    """
+    Initial synchronization of equipments that (re)connected, at most
+    RECONNECT_SYNC_CONCURRENCY at once, the others wait by priority (lower first)
+    then in order of connection. Progress is published while equipments are synchronizing.
+    """
+
+    def __init__(self, concurrency: int = RECONNECT_SYNC_CONCURRENCY, jitter: float = RECONNECT_JITTER):
+        """
+        :param jitter: max seconds added to T5 connect separation of each equipment
+        """
+        self.concurrency = max(1, concurrency)
+        self.jitter = jitter
+        self.node = f"{socket.gethostname()}-{os.getpid()}"
+        self._cond = threading.Condition()
+        self._counter = itertools.count()
+        # (priority, order, equipment name, gem host)
+        self._queue: list[tuple] = []
+        self._queued: set[str] = set()
+        self._running: set[str] = set()
+        self._workers: list[threading.Thread] = []
+        self._mqtt_client: Optional['MqttClient'] = None
+        self._last_publish = 0.0
+        self._durations: list[float] = []
+        self._reset_burst()
+
+    def _reset_burst(self):
+        # counters of the current recovery, reset when all equipments are synchronized
+        self.started: Optional[float] = None
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def jitter_reconnect(self, gem_host: 'SecsGemHost', base: float = None):
+        """
+        Spread the reconnect attempts of equipments disconnected at the same moment
+        :param base: T5 without jitter, default the current T5 of the equipment
+        """
+        timeouts = gem_host.settings.timeouts
+        base = timeouts.t5 if base is None else base
+        secsgem_compat.set_t5(timeouts, base + random.uniform(0, self.jitter))
+
+    def submit(self, gem_host: 'SecsGemHost'):
+        """Queue initial synchronization of an equipment that started communicating"""
+        with self._cond:
+            self._mqtt_client = gem_host.mqtt_client
+            if gem_host.equipment_name in self._queued:
+                return
+            if self.started is None:
+                self.started = time.monotonic()
+            heapq.heappush(self._queue, (gem_host.sync_priority, next(self._counter),
+                                         gem_host.equipment_name, gem_host))
+            self._queued.add(gem_host.equipment_name)
+            collectors.worker_queue_depth.set(len(self._queue), queue="initial_sync")
+            while len(self._workers) < self.concurrency:
+                worker = threading.Thread(target=self._worker, name=f"initial-sync-{len(self._workers)}",
+                                          daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._cond.notify()
+        self._publish()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, name, gem_host = heapq.heappop(self._queue)
+                self._queued.discard(name)
+                self._running.add(name)
+                collectors.worker_queue_depth.set(len(self._queue), queue="initial_sync")
+
+            outcome = self._synchronize(gem_host)
+
+            with self._cond:
+                self._running.discard(name)
+                setattr(self, outcome, getattr(self, outcome) + 1)
+                done = not self._queue and not self._running
+            self._publish(force=done)
+            if done:
+                with self._cond:
+                    if not self._queue and not self._running:
+                        self._reset_burst()
+
+    def _synchronize(self, gem_host: 'SecsGemHost') -> str:
+        # disconnected again while waiting, synchronized on the next connect
+        if not gem_host.is_communicating:
+            return "skipped"
+        start = time.monotonic()
+        try:
+            gem_host.secs_control.initial_equipment()
+        except Exception as e:
+            logger.error("Initial synchronization of %s failed: %s",
+                         gem_host.equipment_name, e, exc_info=True)
+            return "failed"
+        with self._cond:
+            self._durations = (self._durations + [time.monotonic() - start])[-50:]
+        return "completed"
+
+    def progress(self) -> dict:
+        """Queued and running equipments of the current recovery and estimated time left"""
+        with self._cond:
+            average = sum(self._durations) / len(self._durations) if self._durations else None
+            waiting = len(self._queue) + len(self._running)
+            return {
+                "node": self.node,
+                "queued": len(self._queue),
+                "running": sorted(self._running),
+                "completed": self.completed,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "elapsed": round(time.monotonic() - self.started, 1) if self.started else 0.0,
+                "average_sync": round(average, 2) if average is not None else None,
+                "estimated_remaining": round(waiting * average / self.concurrency, 1)
+                if average is not None else None,
+                "next": [entry[2] for entry in heapq.nsmallest(10, self._queue)],
+            }
+
+    def _publish(self, force: bool = False):
+        """Publish progress, at most every RECONNECT_PROGRESS_INTERVAL seconds"""
+        now = time.monotonic()
+        if self._mqtt_client is None or (not force and now - self._last_publish < RECONNECT_PROGRESS_INTERVAL):
+            return
+        self._last_publish = now
+        self._mqtt_client.client.publish(
+            RECONNECT_PROGRESS_TOPIC, json.dumps(self.progress()), qos=0)
+
+
+# process wide supervisor shared by all equipments
+reconnect_supervisor = ReconnectSupervisor()
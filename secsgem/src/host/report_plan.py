@@ -0,0 +1,96 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from config.app_config import EVENT_REPORT_PLAN_DIR
+
+logger = logging.getLogger("app_logger")
+
+
+def plan_entries(subscribe: list[dict]) -> dict[str, dict]:
+    """
+    Report definitions and links of a SUBSCRIBE_LOT_CONTROL list by report ID
+    :return: {"<REPORT_ID>": {"CEID": ceid, "DVS": [vid, ...]}}
+    """
+    return {str(sub["REPORT_ID"]): {"CEID": sub["CEID"], "DVS": list(sub["DVS"])} for sub in subscribe}
+
+
+def plan_hash(entries: dict[str, dict]) -> str:
+    """Content hash of plan entries, independent of their order"""
+    return hashlib.sha256(json.dumps(entries, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def plan_diff(applied: dict[str, dict], desired: dict[str, dict]) -> tuple[list[str], list[str]]:
+    """
+    Reports to delete and reports to define and link to go from applied to desired,
+    a changed report is in both
+    :return: (remove, add) report IDs
+    """
+    changed = [rptid for rptid in desired if rptid in applied and applied[rptid] != desired[rptid]]
+    remove = changed + [rptid for rptid in applied if rptid not in desired]
+    add = changed + [rptid for rptid in desired if rptid not in applied]
+    return remove, add
+
+
+class ReportPlanStore:
+    """
+    Report definitions and event links applied on each equipment,
+    one JSON file per equipment so shard processes never write the same file
+    """
+
+    def __init__(self, directory: str = EVENT_REPORT_PLAN_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, equipment_name: str) -> str:
+        return os.path.join(self.directory, f"{equipment_name}.json")
+
+    def load(self, equipment_name: str) -> Optional[dict]:
+        """
+        Applied plan of an equipment
+        :return: {"hash", "reports", "applied_at"} or None if unknown
+        """
+        try:
+            with open(self._path(equipment_name), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error("Error reading report plan of %s: %s", equipment_name, e)
+            return None
+        if not isinstance(record, dict) or plan_hash(record.get("reports", {})) != record.get("hash"):
+            logger.warning("Report plan of %s is invalid, ignored", equipment_name)
+            return None
+        return record
+
+    def save(self, equipment_name: str, reports: dict[str, dict]):
+        """Record the reports now defined and linked on an equipment"""
+        record = {"hash": plan_hash(reports), "reports": reports,
+                  "applied_at": datetime.datetime.now().isoformat(timespec="seconds")}
+        path = self._path(equipment_name)
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(record, f, indent=4)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                logger.error("Error saving report plan of %s: %s", equipment_name, e)
+
+    def clear(self, equipment_name: str):
+        """Forget the applied plan, the next sync defines every report again"""
+        with self._lock:
+            try:
+                os.remove(self._path(equipment_name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error("Error removing report plan of %s: %s", equipment_name, e)
+
+
+# process wide store shared by all equipments
+report_plans = ReportPlanStore()
@@ -0,0 +1,118 @@
+"""
+Access to the secsgem internals the host relies on, pinned to secsgem 0.3.0.
+The library has no public API for concurrent transactions, T5 updates or
+frame hooks, every private attribute used by the host goes through this module.
+The attributes are checked at import, a changed secsgem fails at startup
+instead of on the first transaction.
+"""
+import logging
+from importlib import metadata
+from typing import Callable
+
+import secsgem.common
+import secsgem.hsms
+import secsgem.secs
+
+logger = logging.getLogger("app_logger")
+
+# version the internals below were written against, see requiment.txt
+SECSGEM_VERSION = "0.3.0"
+
+# methods looked up on the protocol class
+_PROTOCOL_METHODS = ("get_next_system_counter", "_create_message_for_function",
+                     "_get_log_extra", "send_message", "_on_connection_message_received")
+# attributes set by the protocol constructor
+_PROTOCOL_ATTRIBUTES = ("_response_queues", "_communication_logger")
+
+
+def _check():
+    try:
+        version = metadata.version("secsgem")
+    except metadata.PackageNotFoundError:
+        version = None
+    if version != SECSGEM_VERSION:
+        logger.warning("secsgem %s installed, the host is tested with %s",
+                       version, SECSGEM_VERSION)
+
+    missing = [name for name in _PROTOCOL_METHODS
+               if not callable(getattr(secsgem.hsms.HsmsProtocol, name, None))]
+    if not isinstance(getattr(secsgem.common.Timeouts(), "_data", None), dict):
+        missing.append("Timeouts._data")
+    if missing:
+        raise ImportError(
+            f"secsgem {version} is not supported, missing {', '.join(missing)} (requires secsgem=={SECSGEM_VERSION})")
+
+
+_check()
+
+
+def check_protocol(protocol: secsgem.common.Protocol):
+    """
+    Check the attributes set by the protocol constructor, called once per host
+    :raise RuntimeError: the installed secsgem does not have them
+    """
+    missing = [name for name in _PROTOCOL_ATTRIBUTES if not hasattr(protocol, name)]
+    if missing:
+        raise RuntimeError(
+            f"secsgem protocol is missing {', '.join(missing)} (requires secsgem=={SECSGEM_VERSION})")
+
+
+def set_t5(timeouts: secsgem.common.Timeouts, value: float):
+    """
+    Change the connect separation time, secsgem has no setter.
+    The connect thread reads t5 before each wait.
+    """
+    timeouts._data["t5"] = value
+
+
+def next_system_id(protocol: secsgem.common.Protocol) -> int:
+    """System bytes for the next primary message"""
+    return protocol.get_next_system_counter()
+
+
+def register_response(protocol: secsgem.common.Protocol, system_id: int, queue):
+    """
+    Deliver the reply with system_id to queue.put_nowait instead of a
+    queue created by send_and_waitfor_response
+    """
+    protocol._response_queues[system_id] = queue
+
+
+def unregister_response(protocol: secsgem.common.Protocol, system_id: int):
+    """Stop delivering the reply with system_id, e.g. after a timeout"""
+    protocol._response_queues.pop(system_id, None)
+
+
+def send_function(protocol: secsgem.common.Protocol, function: secsgem.secs.SecsStreamFunction,
+                  system_id: int) -> bool:
+    """
+    Send a primary message with the given system bytes, logged to the communication log
+    :return: False if sending failed
+    """
+    message = protocol._create_message_for_function(function, system_id)
+    protocol._communication_logger.info(
+        "> %s\n%s", message, function, extra=protocol._get_log_extra())
+    return protocol.send_message(message)
+
+
+def hook_frames(protocol: secsgem.common.Protocol,
+                on_send: Callable[[secsgem.common.Message], None],
+                on_receive: Callable[[secsgem.common.Message], None]):
+    """
+    Call on_send and on_receive for every frame sent and received by the protocol,
+    HSMS control messages included
+    """
+    send_message = protocol.send_message
+    message_received = protocol._on_connection_message_received
+
+    def hooked_send_message(message):
+        on_send(message)
+        return send_message(message)
+
+    def hooked_message_received(source, message):
+        on_receive(message)
+        return message_received(source, message)
+
+    # the protocol looks both up on the instance for every message
+    protocol.send_message = hooked_send_message
+    protocol._on_connection_message_received = hooked_message_received
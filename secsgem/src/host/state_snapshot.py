@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+from config.app_config import STATE_SNAPSHOT_DIR, STATE_SNAPSHOT_INTERVAL, STATE_SNAPSHOT_MAX_AGE
+
+if TYPE_CHECKING:
+    from src.host.equipment_state import EquipmentState
+    from src.manager.host_manager import SecsGemHostManager
+
+logger = logging.getLogger("app_logger")
+
+# fields restored at startup, each is read again or confirmed by SecsControl.initial_equipment after connect.
+# communication and enable state always come from the running host, the active lot is only known
+# from lot events and cannot be confirmed
+RESTORED_FIELDS = ("control_state", "process_state", "process_program", "alarms")
+
+
+class StateSnapshotStore:
+    """
+    Last known state of each equipment for a warm start,
+    one JSON file per equipment so shard processes never write the same file
+    """
+
+    def __init__(self, directory: str = STATE_SNAPSHOT_DIR, max_age: float = STATE_SNAPSHOT_MAX_AGE):
+        """
+        :param max_age: seconds after which a snapshot is too old to restore, 0 = no limit
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def _path(self, equipment_name: str) -> str:
+        return os.path.join(self.directory, f"{equipment_name}.json")
+
+    def load(self, equipment_name: str) -> Optional[dict]:
+        """
+        Saved state of an equipment
+        :return: {"saved_at", "version", "updated", <field>: value, "alarms": {ALID: text}} or None
+        """
+        try:
+            with open(self._path(equipment_name), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error("Error reading state snapshot of %s: %s", equipment_name, e)
+            return None
+        if not isinstance(record, dict) or not isinstance(record.get("saved_at"), (int, float)):
+            logger.warning("State snapshot of %s is invalid, ignored", equipment_name)
+            return None
+        record["alarms"] = {int(alid): text for alid, text in record.get("alarms", {}).items()}
+        return record
+
+    def save(self, state: 'EquipmentState'):
+        """Write the current state of an equipment"""
+        snapshot = state.snapshot()
+        record = {field: snapshot[field] for field in RESTORED_FIELDS}
+        # json keys are strings
+        record["alarms"] = {str(alid): text for alid, text in snapshot["alarms"].items()}
+        record.update(saved_at=time.time(), version=snapshot["version"],
+                      updated={field: updated for field, updated in snapshot["updated"].items()
+                               if field in RESTORED_FIELDS})
+        path = self._path(state.equipment_name)
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(record, f)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                logger.error("Error saving state snapshot of %s: %s", state.equipment_name, e)
+
+    def restore(self, state: 'EquipmentState') -> bool:
+        """
+        Load the saved state into a new EquipmentState, values stay stale until confirmed
+        :return: True if a snapshot was restored
+        """
+        record = self.load(state.equipment_name)
+        if record is None:
+            return False
+        age = time.time() - record["saved_at"]
+        if self.max_age and age > self.max_age:
+            logger.info("State snapshot of %s is %.0f s old, not restored", state.equipment_name, age)
+            return False
+        values = {field: record[field] for field in RESTORED_FIELDS
+                  if record.get(field) not in (None, {})}
+        state.restore(values, record.get("updated", {}))
+        logger.info("State of %s restored from snapshot of %.0f s ago", state.equipment_name, age)
+        return True
+
+    def clear(self, equipment_name: str):
+        """Forget the saved state of a removed equipment"""
+        with self._lock:
+            try:
+                os.remove(self._path(equipment_name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error("Error removing state snapshot of %s: %s", equipment_name, e)
+
+
+# process wide store shared by all equipments
+state_snapshots = StateSnapshotStore()
+
+
+class StateSnapshotWriter:
+    """
+    Save the state of the equipments of a manager every interval seconds,
+    only equipments whose state version changed since the last save are written
+    """
+
+    def __init__(self, manager: 'SecsGemHostManager', store: StateSnapshotStore = state_snapshots,
+                 interval: float = STATE_SNAPSHOT_INTERVAL):
+        self.manager = manager
+        self.store = store
+        self.interval = interval
+        # equipment name: state version last saved
+        self._versions: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="state-snapshot", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save_all()
+            except Exception as e:
+                logger.error("Error saving state snapshots: %s", e, exc_info=True)
+
+    def save_all(self, force: bool = False) -> int:
+        """
+        Save changed states
+        :param force: save every equipment
+        :return: number of snapshots written
+        """
+        written = 0
+        for gem_host in list(self.manager.gem_hosts):
+            version = gem_host.state.version
+            if not force and self._versions.get(gem_host.equipment_name) == version:
+                continue
+            self.store.save(gem_host.state)
+            self._versions[gem_host.equipment_name] = version
+            written += 1
+        return written
+
+    def stop(self):
+        """Stop the periodic save and write the final state"""
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        self.save_all()
@@ -0,0 +1,301 @@
+import contextlib
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, List, Optional
+
+import secsgem.common
+import secsgem.secs
+
+from config.app_config import SECS_SEND_DEFAULT_PRIORITY, SECS_SEND_PRIORITY
+from src.host import secsgem_compat
+from src.host.adaptive_timeout import (REASON_CONNECTION_CLOSED, REASON_LINK_DEGRADED, REASON_SEND_FAILED,
+                                       REASON_T3, AdaptiveTimeout)
+from src.metrics import collectors
+
+if TYPE_CHECKING:
+    from src.host.gemhost import SecsGemHost
+
+logger = logging.getLogger("app_logger")
+
+
+class SecsTransaction(Future):
+    """
+    Future for a single primary/secondary SECS transaction.
+    The protocol delivers the reply through put_nowait, the same call it uses
+    for the queue created by send_and_waitfor_response.
+    """
+
+    def __init__(self, pool: 'SecsTransactionPool', system_id: int, function: secsgem.secs.SecsStreamFunction,
+                 deadline: float, timeout_reason: str = REASON_T3):
+        super().__init__()
+        self.pool = pool
+        self.system_id = system_id
+        self.function = function
+        self.deadline = deadline
+        # reason recorded if the deadline expires, "t3" or "adaptive"
+        self.timeout_reason = timeout_reason
+        self.sent_at = time.monotonic()
+        # why the transaction ended without reply, None if answered
+        self.reason = None
+
+    @property
+    def name(self) -> str:
+        """SxFy name of the primary message"""
+        return f"S{self.function.stream}F{self.function.function}"
+
+    def put_nowait(self, message: secsgem.common.Message):
+        """
+        Reply received from equipment
+        """
+        self.pool._finish(self, message)
+
+    def wait(self) -> Optional[secsgem.common.Message]:
+        """
+        Wait for the reply until the deadline expires
+        :return: reply message or None on timeout/send failure, see reason
+        """
+        try:
+            return self.result(max(0.0, self.deadline - time.monotonic()))
+        except TimeoutError:
+            self.expire()
+            return self.result()
+
+    def expire(self):
+        """
+        Give up on the reply, resolves the transaction with None
+        """
+        self.pool._timeout(self)
+
+
+# priority classes of outbound primary messages, lower is sent first
+PRIORITY_CRITICAL = 0
+PRIORITY_HIGH = 1
+PRIORITY_NORMAL = 2
+PRIORITY_BULK = 3
+PRIORITY_NAMES = {PRIORITY_CRITICAL: "critical", PRIORITY_HIGH: "high",
+                  PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+
+
+def function_priority(function: secsgem.secs.SecsStreamFunction) -> int:
+    """Priority class of a primary message by SxFy, SECS_SEND_PRIORITY"""
+    return SECS_SEND_PRIORITY.get(f"S{function.stream}F{function.function}", SECS_SEND_DEFAULT_PRIORITY)
+
+
+class SecsTransactionPool:
+    """
+    Keep several SECS transactions of one equipment in flight at once.
+    At most `window` transactions are open, further requests wait for a free slot
+    and get it by priority class, then in order of arrival.
+    Reply deadlines come from the round trips observed by `timeouts`.
+    """
+
+    def __init__(self, gem_host: 'SecsGemHost', window: int = 1):
+        secsgem_compat.check_protocol(gem_host.protocol)
+        self.gem_host = gem_host
+        self.window = max(1, window)
+        self.timeouts = AdaptiveTimeout(gem_host.equipment_name)
+        self._lock = threading.Lock()
+        self._open: dict[int, SecsTransaction] = {}
+        # slots in use and the (priority, ticket) of waiting senders
+        self._slot_cond = threading.Condition()
+        self._in_use = 0
+        self._waiting: list[tuple[int, int]] = []
+        self._tickets = itertools.count()
+        # priority of the current thread, set by priority()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def priority(self, priority: int):
+        """
+        Send every primary message of the current thread with at least this priority,
+        e.g. the status reads done while validating a lot
+        """
+        previous = getattr(self._local, "priority", None)
+        self._local.priority = priority if previous is None else min(
+            previous, priority)
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    @property
+    def waiting(self) -> dict[str, int]:
+        """Senders waiting for a slot by priority class"""
+        with self._slot_cond:
+            counts = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiting:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                counts[name] = counts.get(name, 0) + 1
+            return counts
+
+    def _acquire(self, priority: int, blocking: bool) -> bool:
+        t3 = self.gem_host.settings.timeouts.t3
+        with self._slot_cond:
+            if not blocking:
+                if self._in_use < self.window and not self._waiting:
+                    self._in_use += 1
+                    return True
+                return False
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            collectors.worker_queue_depth.inc(queue="transaction_slot")
+            try:
+                while self._waiting[0] != ticket or self._in_use >= self.window:
+                    if not self._slot_cond.wait(timeout=t3):
+                        # replies lost, free their slots
+                        self._expire()
+                heapq.heappop(self._waiting)
+                self._in_use += 1
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                collectors.worker_queue_depth.dec(queue="transaction_slot")
+                # the next waiter may take another free slot
+                self._slot_cond.notify_all()
+            return True
+
+    def _release(self):
+        with self._slot_cond:
+            self._in_use -= 1
+            self._slot_cond.notify_all()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of open transactions"""
+        return len(self._open)
+
+    def submit(self, function: secsgem.secs.SecsStreamFunction, wait_slot: bool = True,
+               priority: int = None) -> Optional[SecsTransaction]:
+        """
+        Send a primary message without waiting for the reply
+        :param function: stream function to send
+        :param wait_slot: wait for a free slot when the window is full,
+                          otherwise return None immediately
+        :param priority: priority class, default by SxFy and the thread priority
+        :return: SecsTransaction resolved with the reply or None
+        """
+        protocol = self.gem_host.protocol
+        t3 = self.gem_host.settings.timeouts.t3
+
+        if priority is None:
+            priority = function_priority(function)
+        thread_priority = getattr(self._local, "priority", None)
+        if thread_priority is not None:
+            priority = min(priority, thread_priority)
+
+        self._expire()
+        name = collectors.stream_function_name(function)
+        # link degraded, fail before waiting for a slot
+        probe = self.timeouts.degraded
+        if not self.timeouts.allow(name):
+            return self._reject(function)
+        queued_at = time.monotonic()
+        if not self._acquire(priority, wait_slot):
+            return None
+        collectors.secs_send_wait.observe(time.monotonic() - queued_at, equipment=self.gem_host.equipment_name,
+                                          priority=PRIORITY_NAMES.get(priority, str(priority)))
+        # degraded while waiting for the slot
+        if not probe and self.timeouts.degraded and not self.timeouts.allow(name):
+            self._release()
+            return self._reject(function)
+
+        system_id = secsgem_compat.next_system_id(protocol)
+        timeout, timeout_reason = self.timeouts.timeout(name, t3)
+        transaction = SecsTransaction(
+            self, system_id, function, time.monotonic() + timeout, timeout_reason)
+        with self._lock:
+            self._open[system_id] = transaction
+            # the protocol puts the reply into this "queue"
+            secsgem_compat.register_response(protocol, system_id, transaction)
+            self._update_in_flight()
+
+        collectors.record_message(
+            self.gem_host.equipment_name, "out", function)
+        if not secsgem_compat.send_function(protocol, function, system_id):
+            logger.error("Sending message failed: %s, %s",
+                         transaction.name, self.gem_host.equipment_name)
+            self._finish(transaction, None, REASON_SEND_FAILED)
+
+        return transaction
+
+    def _reject(self, function: secsgem.secs.SecsStreamFunction) -> SecsTransaction:
+        """Transaction resolved at once without sending, the link is degraded"""
+        transaction = SecsTransaction(self, 0, function, time.monotonic(), REASON_LINK_DEGRADED)
+        transaction.reason = REASON_LINK_DEGRADED
+        logger.warning("Transaction not sent, link degraded: %s, %s",
+                       transaction.name, self.gem_host.equipment_name)
+        self.gem_host.record_transaction(function, 0.0, None, False, REASON_LINK_DEGRADED)
+        transaction.set_result(None)
+        return transaction
+
+    def submit_all(self, functions: List[secsgem.secs.SecsStreamFunction]) -> List[SecsTransaction]:
+        """
+        Send several primary messages, keeping up to `window` of them in flight
+        :param functions: stream functions to send
+        :return: list of SecsTransaction in the same order
+        """
+        return [self.submit(function) for function in functions]
+
+    def request_all(self, functions: List[secsgem.secs.SecsStreamFunction]) -> List[Optional[secsgem.common.Message]]:
+        """
+        Send several primary messages and wait for all replies
+        :param functions: stream functions to send
+        :return: list of reply messages (None on timeout) in the same order
+        """
+        return [transaction.wait() for transaction in self.submit_all(functions)]
+
+    def cancel_all(self):
+        """
+        Resolve every open transaction with None, e.g. on connection closed
+        """
+        for transaction in list(self._open.values()):
+            self._finish(transaction, None, REASON_CONNECTION_CLOSED)
+
+    def _timeout(self, transaction: SecsTransaction):
+        logger.warning("Transaction timeout (%s, %.1f s): %s, %s", transaction.timeout_reason,
+                       time.monotonic() - transaction.sent_at, transaction.name, self.gem_host.equipment_name)
+        self._finish(transaction, None, transaction.timeout_reason)
+
+    def _finish(self, transaction: SecsTransaction, message: Optional[secsgem.common.Message],
+                reason: str = None):
+        """
+        :param reason: why the transaction ended without reply, None for a reply
+        """
+        with self._lock:
+            if self._open.pop(transaction.system_id, None) is None:
+                return
+            secsgem_compat.unregister_response(
+                self.gem_host.protocol, transaction.system_id)
+            self._update_in_flight()
+
+        self._release()
+        seconds = time.monotonic() - transaction.sent_at
+        if message is not None:
+            collectors.record_message(
+                self.gem_host.equipment_name, "in", message)
+            self.timeouts.observe(transaction.name, seconds)
+        else:
+            transaction.reason = reason
+            if reason == transaction.timeout_reason:
+                self.timeouts.timed_out(transaction.name, reason)
+        # cancel_all on connection closed is neither a reply nor a timeout
+        if reason != REASON_CONNECTION_CLOSED:
+            self.gem_host.record_transaction(transaction.function, seconds, message,
+                                             reason == transaction.timeout_reason, reason)
+        transaction.set_result(message)
+
+    def _update_in_flight(self):
+        collectors.secs_transactions_in_flight.set(
+            len(self._open), equipment=self.gem_host.equipment_name)
+
+    def _expire(self):
+        now = time.monotonic()
+        for transaction in list(self._open.values()):
+            if transaction.deadline <= now:
+                self._timeout(transaction)
@@ -0,0 +1,134 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import TYPE_CHECKING
+
+from config.app_config import (TRANSACTION_SLOW_LOG_PATH, TRANSACTION_SLOW_LOG_SIZE,
+                               TRANSACTION_SLOW_THRESHOLD, TRANSACTION_STATS_WINDOW)
+from config.logger.all_logger import AppLogger
+
+if TYPE_CHECKING:
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+slow_logger = logging.getLogger("slow_transaction")
+slow_logger.propagate = False
+if TRANSACTION_SLOW_LOG_PATH and not slow_logger.handlers:
+    # recreates the file and directory on first write
+    slow_handler = AppLogger.CustomFileHandler(
+        TRANSACTION_SLOW_LOG_PATH, mode="a", delay=True)
+    slow_handler.setFormatter(logging.Formatter("%(asctime)s: %(message)s"))
+    slow_logger.addHandler(slow_handler)
+    slow_logger.setLevel(logging.INFO)
+
+
+class _Series:
+    """Rolling latency window and outcome counters of one SxFy"""
+
+    def __init__(self, window: int):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.timeouts = 0
+        self.failures = 0
+        # timeouts and failures by reason
+        self.reasons: Counter[str] = Counter()
+        self.slow = 0
+        self.max = 0.0
+        self.last_at = 0.0
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+
+        return {"count": self.count, "timeouts": self.timeouts, "failures": self.failures,
+                "reasons": dict(self.reasons), "slow": self.slow,
+                "avg_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+                "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99),
+                "max_ms": round(self.max * 1000, 1), "last_at": self.last_at}
+
+
+class TransactionStats:
+    """
+    Round trip statistics of the SECS transactions of one equipment by SxFy,
+    transactions slower than the threshold or timed out go to the slow transaction log
+    and equipments/status/slow_transaction/<equipment_name>
+    """
+
+    def __init__(self, equipment_name: str, mqtt_client: 'MqttClient' = None,
+                 threshold: float = TRANSACTION_SLOW_THRESHOLD, window: int = TRANSACTION_STATS_WINDOW):
+        """
+        :param threshold: seconds from which a transaction is logged as slow, 0 = only timeouts
+        :param window: latest latencies kept per SxFy for the percentiles
+        """
+        self.equipment_name = equipment_name
+        self.mqtt_client = mqtt_client
+        self.threshold = threshold
+        self.window = window
+        self._lock = threading.Lock()
+        self._series: dict[str, _Series] = {}
+        self._slow: deque[dict] = deque(maxlen=TRANSACTION_SLOW_LOG_SIZE)
+
+    def record(self, name: str, seconds: float, outcome: str = "ok", reason: str = None):
+        """
+        Record one transaction
+        :param name: SxFy of the primary message
+        :param outcome: "ok", "timeout" or "failed"
+        :param reason: why there is no reply, e.g. "adaptive" or "link_degraded"
+        """
+        now = time.time()
+        slow = outcome == "timeout" or (
+            outcome == "ok" and self.threshold > 0 and seconds >= self.threshold)
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = _Series(self.window)
+            series.count += 1
+            series.last_at = now
+            if outcome == "ok":
+                series.latencies.append(seconds)
+                series.max = max(series.max, seconds)
+            elif outcome == "timeout":
+                series.timeouts += 1
+            else:
+                series.failures += 1
+            if outcome != "ok" and reason:
+                series.reasons[reason] += 1
+            if slow:
+                series.slow += 1
+                entry = {"equipment_name": self.equipment_name, "sf": name, "outcome": outcome,
+                         "ms": round(seconds * 1000, 1), "at": now}
+                if reason:
+                    entry["reason"] = reason
+                self._slow.append(entry)
+        if slow:
+            self._log_slow(entry)
+
+    def _log_slow(self, entry: dict):
+        slow_logger.info("%s %s %s %.1f ms %s", entry["equipment_name"], entry["sf"],
+                         entry["outcome"], entry["ms"], entry.get("reason", ""))
+        if self.mqtt_client:
+            self.mqtt_client.client.publish(
+                f"equipments/status/slow_transaction/{self.equipment_name}", json.dumps(entry))
+
+    def summary(self) -> dict:
+        """Statistics by SxFy"""
+        with self._lock:
+            return {name: series.summary() for name, series in sorted(self._series.items())}
+
+    def slow_transactions(self) -> list[dict]:
+        """Latest slow and timed out transactions, oldest first"""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        """Clear statistics and slow transactions"""
+        with self._lock:
+            self._series.clear()
+            self._slow.clear()
@@ -0,0 +1,460 @@
+import abc
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Optional
+
+import secsgem.hsms
+
+from config.app_config import CLUSTER_INTERVAL, CLUSTER_LEASE_TTL
+from src.manager.host_manager import SecsGemHostManager, fetch_equipments, validate_hsms_settings
+from config.logger.output_sink import output
+
+if TYPE_CHECKING:
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+
+class LeaseStore(abc.ABC):
+    """
+    Coordination store holding node heartbeats, equipment leases and
+    the equipments added to or removed from the cluster at runtime.
+    Times are wall clock seconds, shared between processes and machines.
+    """
+
+    @abc.abstractmethod
+    def heartbeat(self, node_id: str, ttl: float):
+        """Mark node alive for ttl seconds"""
+
+    @abc.abstractmethod
+    def remove_node(self, node_id: str):
+        """Remove node heartbeat"""
+
+    @abc.abstractmethod
+    def nodes(self) -> list[str]:
+        """Alive node ids"""
+
+    @abc.abstractmethod
+    def claim(self, equipment_name: str, node_id: str, ttl: float) -> bool:
+        """Claim or renew a lease, False if another node holds a valid lease"""
+
+    @abc.abstractmethod
+    def release(self, equipment_name: str, node_id: str):
+        """Release a lease held by node"""
+
+    @abc.abstractmethod
+    def owner(self, equipment_name: str) -> Optional[str]:
+        """Node holding a valid lease of the equipment"""
+
+    @abc.abstractmethod
+    def set_equipment(self, equipment_name: str, equipment: Optional[dict]):
+        """Add or change an equipment of the cluster, None removes it"""
+
+    @abc.abstractmethod
+    def equipment_changes(self) -> dict[str, Optional[dict]]:
+        """Equipments set at runtime by name, None if removed"""
+
+    def wait_synced(self, timeout: float) -> bool:
+        """Wait until the store reflects the state of the other nodes, False on timeout"""
+        return True
+
+
+class FileLeaseStore(LeaseStore):
+    """
+    Lease store in a json file guarded by a lock file, for nodes on one machine and testing
+    """
+
+    def __init__(self, path: str, stale_lock: float = 10):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.stale_lock = stale_lock
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _lock(self):
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL))
+                return
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.stale_lock:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+
+    def _unlock(self):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def _update(self, change):
+        """Read, change and write the store under lock"""
+        self._lock()
+        try:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                data = {}
+            data.setdefault("nodes", {})
+            data.setdefault("leases", {})
+            data.setdefault("equipments", {})
+            result = change(data)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4)
+            os.replace(self.path + ".tmp", self.path)
+            return result
+        finally:
+            self._unlock()
+
+    def heartbeat(self, node_id: str, ttl: float):
+        def change(data):
+            data["nodes"][node_id] = time.time() + ttl
+        self._update(change)
+
+    def remove_node(self, node_id: str):
+        self._update(lambda data: data["nodes"].pop(node_id, None))
+
+    def nodes(self) -> list[str]:
+        now = time.time()
+        return self._update(lambda data: sorted(
+            node for node, expires in data["nodes"].items() if expires > now))
+
+    def claim(self, equipment_name: str, node_id: str, ttl: float) -> bool:
+        def change(data):
+            lease = data["leases"].get(equipment_name)
+            if lease and lease["node"] != node_id and lease["expires"] > time.time():
+                return False
+            data["leases"][equipment_name] = {
+                "node": node_id, "expires": time.time() + ttl}
+            return True
+        return self._update(change)
+
+    def release(self, equipment_name: str, node_id: str):
+        def change(data):
+            lease = data["leases"].get(equipment_name)
+            if lease and lease["node"] == node_id:
+                del data["leases"][equipment_name]
+        self._update(change)
+
+    def owner(self, equipment_name: str) -> Optional[str]:
+        def change(data):
+            lease = data["leases"].get(equipment_name)
+            if lease and lease["expires"] > time.time():
+                return lease["node"]
+            return None
+        return self._update(change)
+
+    def set_equipment(self, equipment_name: str, equipment: Optional[dict]):
+        def change(data):
+            data["equipments"][equipment_name] = equipment
+        self._update(change)
+
+    def equipment_changes(self) -> dict[str, Optional[dict]]:
+        return self._update(lambda data: dict(data["equipments"]))
+
+
+class MqttLeaseStore(LeaseStore):
+    """
+    Lease store in retained MQTT topics <prefix>/nodes/<node_id>, <prefix>/leases/<equipment_name>
+    and <prefix>/equipments/<equipment_name> ({"removed": true} once removed), payload json.
+    A claim is published and then confirmed from the broker echo,
+    the last claim accepted by the broker wins.
+    """
+
+    def __init__(self, mqtt_client: 'MqttClient', prefix: str = "dejtnf/cluster", settle: float = 0.5):
+        self.mqtt = mqtt_client
+        self.prefix = prefix
+        self.settle = settle
+        self._nodes: dict[str, float] = {}
+        self._leases: dict[str, dict] = {}
+        self._equipments: dict[str, Optional[dict]] = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._sync_token = uuid.uuid4().hex
+        self.mqtt.client.message_callback_add(
+            f"{prefix}/#", self._on_message)
+        self.mqtt.client.subscribe(f"{prefix}/#", qos=1)
+        # the broker sends the retained messages of the subscription before this marker
+        self.mqtt.client.publish(f"{prefix}/sync/{self._sync_token}", "", qos=1)
+
+    def wait_synced(self, timeout: float) -> bool:
+        return self._synced.wait(timeout)
+
+    def _on_message(self, client, userdata, message):
+        parts = message.topic[len(self.prefix) + 1:].split("/", 1)
+        if len(parts) != 2:
+            return
+        kind, name = parts
+        if kind == "sync":
+            if name == self._sync_token:
+                self._synced.set()
+            return
+        try:
+            value = json.loads(message.payload) if message.payload else None
+        except json.JSONDecodeError:
+            return
+        with self._lock:
+            if kind == "nodes":
+                if value is None:
+                    self._nodes.pop(name, None)
+                else:
+                    self._nodes[name] = value.get("expires", 0)
+            elif kind == "leases":
+                if value is None:
+                    self._leases.pop(name, None)
+                else:
+                    self._leases[name] = value
+            elif kind == "equipments" and value is not None:
+                self._equipments[name] = None if value.get("removed") else value
+
+    def _publish(self, kind: str, name: str, value: Optional[dict]):
+        self.mqtt.client.publish(f"{self.prefix}/{kind}/{name}",
+                                 json.dumps(value) if value is not None else None, qos=1, retain=True)
+
+    def heartbeat(self, node_id: str, ttl: float):
+        self._publish("nodes", node_id, {"expires": time.time() + ttl})
+
+    def remove_node(self, node_id: str):
+        self._publish("nodes", node_id, None)
+
+    def nodes(self) -> list[str]:
+        now = time.time()
+        with self._lock:
+            return sorted(node for node, expires in self._nodes.items() if expires > now)
+
+    def claim(self, equipment_name: str, node_id: str, ttl: float) -> bool:
+        owner = self.owner(equipment_name)
+        if owner not in (None, node_id):
+            return False
+        self._publish("leases", equipment_name, {
+                      "node": node_id, "expires": time.time() + ttl})
+        if owner == node_id:
+            return True
+        # wait for the broker echo, a concurrent claim may have won
+        time.sleep(self.settle)
+        return self.owner(equipment_name) == node_id
+
+    def release(self, equipment_name: str, node_id: str):
+        if self.owner(equipment_name) == node_id:
+            self._publish("leases", equipment_name, None)
+
+    def owner(self, equipment_name: str) -> Optional[str]:
+        with self._lock:
+            lease = self._leases.get(equipment_name)
+        if lease and lease.get("expires", 0) > time.time():
+            return lease.get("node")
+        return None
+
+    def set_equipment(self, equipment_name: str, equipment: Optional[dict]):
+        # retained tombstone, an empty payload would only clear the retained add
+        self._publish("equipments", equipment_name, equipment if equipment is not None else {"removed": True})
+        with self._lock:
+            self._equipments[equipment_name] = equipment
+
+    def equipment_changes(self) -> dict[str, Optional[dict]]:
+        with self._lock:
+            return dict(self._equipments)
+
+
+def rendezvous_owner(equipment_name: str, nodes: list[str]) -> Optional[str]:
+    """
+    Highest random weight node of an equipment,
+    only the equipments of a joining or leaving node move
+    """
+    if not nodes:
+        return None
+    return max(nodes, key=lambda node: hashlib.md5(
+        f"{node}/{equipment_name}".encode("utf-8")).hexdigest())
+
+
+class ClusterNode:
+    """
+    Host node in a cluster sharing one equipment list.
+    Each equipment runs on the node holding its lease, leases are assigned by
+    rendezvous hashing over alive nodes and rebalance when a node joins or dies.
+    Equipments added or removed on any node are shared through the lease store.
+    Provides the SecsGemHostManager interface used by MainCli and ConfigCli.
+    """
+
+    def __init__(self, mqtt_client_instant: 'MqttClient', store: LeaseStore, node_id: str = None, equipments: list[dict] = None,
+                 lease_ttl: float = CLUSTER_LEASE_TTL, interval: float = CLUSTER_INTERVAL, sync_timeout: float = 10):
+        """
+        :param sync_timeout: seconds to wait for the state of the other nodes before the first rebalance
+        """
+        self.mqtt = mqtt_client_instant
+        self.store = store
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.equipments = fetch_equipments() if equipments is None else equipments
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.manager = SecsGemHostManager(
+            self.mqtt, equipments=[], persist=False, node=self.node_id)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        # without the leases of the other nodes the first rebalance would claim their equipments
+        if not self.store.wait_synced(sync_timeout):
+            logger.warning("Cluster state not received within %s s, rebalancing without it", sync_timeout)
+        self.store.heartbeat(self.node_id, self.lease_ttl)
+        self._thread = threading.Thread(
+            target=self._run, name=f"cluster-{self.node_id}", daemon=True)
+        self._thread.start()
+        logger.info("Cluster node %s started", self.node_id)
+
+    @property
+    def gem_hosts(self):
+        """Equipments running on this node"""
+        return self.manager.gem_hosts
+
+    def __getattr__(self, name: str):
+        if name == "manager":
+            raise AttributeError(name)
+        return getattr(self.manager, name)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.rebalance()
+            except Exception as e:
+                logger.error("Cluster rebalance failed: %s",
+                             e, exc_info=True)
+            self._stop.wait(self.interval)
+
+    def rebalance(self):
+        """
+        Heartbeat, renew or claim leases of equipments assigned to this node
+        and hand over equipments assigned to other nodes
+        """
+        with self._lock:
+            self.store.heartbeat(self.node_id, self.lease_ttl)
+            nodes = self.store.nodes()
+            if self.node_id not in nodes:
+                nodes.append(self.node_id)
+            self._apply_membership(self.store.equipment_changes())
+
+            # removed from the cluster on any node
+            names = {equipment["equipment_name"] for equipment in self.equipments}
+            for gem_host in list(self.manager.gem_hosts):
+                if gem_host.equipment_name not in names:
+                    self._stop_host(gem_host.equipment_name, forget_state=True)
+                    self.store.release(gem_host.equipment_name, self.node_id)
+
+            for equipment in self.equipments:
+                name = equipment["equipment_name"]
+                running = self._gem_host(name) is not None
+                if rendezvous_owner(name, nodes) == self.node_id:
+                    if self.store.claim(name, self.node_id, self.lease_ttl):
+                        if not running:
+                            self._start(equipment)
+                    elif running:
+                        logger.warning(
+                            "Lease of %s lost to %s", name, self.store.owner(name))
+                        self._stop_host(name)
+                elif running:
+                    # another node is assigned, hand over
+                    self._stop_host(name)
+                    self.store.release(name, self.node_id)
+
+    def _apply_membership(self, changes: dict[str, Optional[dict]]):
+        """Merge equipments added, changed or removed at runtime into the equipment list"""
+        for name, equipment in changes.items():
+            current = next((eq for eq in self.equipments if eq["equipment_name"] == name), None)
+            if current == equipment:
+                continue
+            if current is not None:
+                self.equipments.remove(current)
+                # restarted with the new settings by the node it is assigned to
+                self._stop_host(name)
+            if equipment is not None:
+                self.equipments.append(equipment)
+
+    def _gem_host(self, equipment_name: str):
+        return next((host for host in self.manager.gem_hosts if host.equipment_name == equipment_name), None)
+
+    def _start(self, equipment: dict):
+        logger.info("Node %s takes %s", self.node_id,
+                    equipment["equipment_name"])
+        self.manager.add_gem_hosts([equipment])
+
+    def _stop_host(self, equipment_name: str, forget_state: bool = False):
+        """
+        :param forget_state: the equipment was removed from the cluster, else its state
+            is kept for the node taking it over
+        """
+        gem_host = self._gem_host(equipment_name)
+        if gem_host is None:
+            return
+        logger.info("Node %s releases %s", self.node_id, equipment_name)
+        self.manager.retire(gem_host, forget_state)
+
+    def add_equipment(self, equipment_name: str, equipment_model: str, enable: bool, address: str, port: int, session_id: int, mode: str):
+        """
+        Add equipment to the cluster, started by the node it is assigned to
+        """
+        equipment = {"equipment_name": equipment_name, "equipment_model": equipment_model, "enable": enable,
+                     "address": address, "port": port, "session_id": session_id, "mode": mode}
+        setts = validate_hsms_settings(equipment)
+        if not isinstance(setts, secsgem.hsms.HsmsSettings):
+            output("Validation error %s", setts)
+            return f"Validation error {setts}"
+        with self._lock:
+            if next((eq for eq in self.equipments if eq["equipment_name"] == equipment_name), None):
+                output("Equipment %s already exists", equipment_name)
+                return f"Equipment {equipment_name} already exists"
+            self.equipments.append(equipment)
+            # the other nodes pick it up in their next rebalance
+            self.store.set_equipment(equipment_name, equipment)
+        self.rebalance()
+        output("Equipment %s added", equipment_name)
+        return f"Equipment {equipment_name} added"
+
+    def remove_equipment(self, equipment_name: str):
+        """
+        Remove equipment from the cluster
+        """
+        with self._lock:
+            equipment = next(
+                (eq for eq in self.equipments if eq["equipment_name"] == equipment_name), None)
+            if not equipment:
+                output("Equipment %s not found", equipment_name)
+                return f"Equipment {equipment_name} not found"
+            self.equipments.remove(equipment)
+            # stopped by the node running it in its next rebalance
+            self.store.set_equipment(equipment_name, None)
+            self._stop_host(equipment_name, forget_state=True)
+            self.store.release(equipment_name, self.node_id)
+        output("Equipment %s removed", equipment_name)
+        return f"Equipment {equipment_name} removed"
+
+    def owners(self) -> dict:
+        """
+        Lease owner of every equipment
+        """
+        return {equipment["equipment_name"]: self.store.owner(equipment["equipment_name"]) for equipment in self.equipments}
+
+    def _leave(self):
+        """Release the leases of the closed equipments and leave the cluster"""
+        with self._lock:
+            for gem_host in self.manager.gem_hosts:
+                self.store.release(gem_host.equipment_name, self.node_id)
+            self.store.remove_node(self.node_id)
+
+    def exit(self):
+        """
+        Exit, the owned equipments are closed by the manager shutdown (concurrent, state kept
+        for the warm start) and their leases released after, before MQTT disconnects
+        :return: shutdown report, see ShutdownCoordinator.run
+        """
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 5)
+        return self.manager.exit(after_close=self._leave)
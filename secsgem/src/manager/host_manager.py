@@ -3,16 +3,26 @@ import ipaddress
 import json
 import logging
 import os
+import threading
 import requests
 import secsgem.hsms
 from src.host.gemhost import SecsGemHost
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Optional
 from dotenv import load_dotenv
 
 if TYPE_CHECKING:
     from src.mqtt.mqtt_client import MqttClient
 
-from config.app_config import EQUIPMENTS_CONFIG_PATH
+from config.app_config import (EQUIPMENT_API_PAGE_SIZE, EQUIPMENT_RECONCILE_INTERVAL, EQUIPMENTS_CONFIG_PATH,
+                               FLEET_STATUS_ENABLE, MQTT_ENABLE, RECONNECT_DEFAULT_PRIORITY,
+                               SECS_TRANSACTION_WINDOW, STATE_SNAPSHOT_ENABLE, VALIDATE_CONFIG_STORE_ENABLE)
+from src.metrics import collectors
+from src.host.handler.lot_management.cache import ConditionalCache
+from src.host.handler.lot_management.config_store import ValidateConfigSync
+from src.mqtt.fleet_status import FleetStatusPublisher
+from src.host.state_snapshot import StateSnapshotWriter, state_snapshots
+from src.manager.shutdown import ShutdownCoordinator
+from config.logger.output_sink import output
 
 
 logger = logging.getLogger("app_logger")
@@ -68,64 +78,266 @@ def validate_hsms_settings(equipment):
         return ValueError(f"Invalid value: {e}")
 
 
+# equipment list pages, revalidated with ETag / Last-Modified
+equipment_list_responses = ConditionalCache("equipments")
+
+
+def _fetch_equipment_pages(conditional: bool) -> tuple[list[dict], bool]:
+    """
+    Fetch every page of the equipment list from API
+    :param conditional: send the validators of the previous response, unchanged pages are reused
+    :return: (equipments, changed), changed is False when no page changed
+    :raise requests.exceptions.RequestException: request failed
+    :raise ValueError: a page is malformed or the list incomplete
+    """
+    load_dotenv()
+
+    api_server = os.getenv("API_SERVER")
+    api_port = int(os.getenv("API_PORT"))
+    api_endpoint = os.getenv("API_ENDPOINT")
+
+    # api GET localhost:3000/api/secsgem/equipments?page=1&limit=100&sort=equipment_name&order=1
+    equipments = []
+    changed = False
+    page = 1
+    while True:
+        api_url = (f"http://{api_server}:{api_port}/{api_endpoint}/secsgem/equipments"
+                   f"?page={page}&limit={EQUIPMENT_API_PAGE_SIZE}&sort=equipment_name&order=1")
+        body, page_changed = equipment_list_responses.get(api_url, conditional)
+        if page_changed:
+            output(body)
+            changed = True
+        # {'docs': [{'_id': '67c700fe403ebe5e10ffb567', 'mode': 'ACTIVE', 'equipment_name': 'TNF-61', 'equipment_model': 'FCL', 'address': '192.168.226.161', 'port': 5000, 'session_id': 61, 'enable': False, 'createdAt': '2025-03-04T13:32:46.731Z', 'updatedAt': '2025-03-15T05:57:19.172Z'}, ...], 'totalDocs': 6, 'limit': 5, 'totalPages': 2, 'page': 1, 'pagingCounter': 1, 'hasPrevPage': False, 'hasNextPage': True, 'prevPage': None, 'nextPage': 2}
+        docs = body.get("docs") if isinstance(body, dict) else None
+        if not isinstance(docs, list) or not all(isinstance(doc, dict) for doc in docs):
+            # a partial list must not be taken for the whole, the next fetch is unconditional
+            equipment_list_responses.invalidate()
+            raise ValueError(f"malformed page {page} of the equipment list")
+        equipments.extend(docs)
+        if not body.get("hasNextPage"):
+            total = body.get("totalDocs")
+            if isinstance(total, int) and total != len(equipments):
+                equipment_list_responses.invalidate()
+                raise ValueError(f"incomplete equipment list, {len(equipments)} of {total}")
+            return equipments, changed
+        page += 1
+
+
+def fetch_equipments():
+    """
+    Fetch equipment list from API
+    :return: list of equipment dict
+    """
+    return _fetch_equipment_pages(conditional=False)[0]
+
+
+def fetch_equipments_if_changed() -> Optional[list[dict]]:
+    """
+    Fetch equipment list from API with conditional requests
+    :return: list of equipment dict, None if unchanged since the last fetch
+    """
+    equipments, changed = _fetch_equipment_pages(conditional=True)
+    return equipments if changed else None
+
+
+# settings compared by reconcile_equipments, a change of any but enable recreates the host
+RECONCILE_FIELDS = ("equipment_model", "address", "port", "session_id", "mode", "enable")
+
+
+class EquipmentReconciler:
+    """
+    Apply changes of the equipment list in the API to a manager every interval seconds,
+    each round costs one 304 response per page while nothing changed
+    """
+
+    def __init__(self, manager: 'SecsGemHostManager', interval: float = EQUIPMENT_RECONCILE_INTERVAL):
+        self.manager = manager
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="equipment-reconcile", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.manager.reload_equipments()
+            except Exception as e:
+                logger.error("Error reconciling equipments: %s", e)
+
+    def stop(self):
+        """Stop reconciling"""
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+
 class SecsGemHostManager:
     """
     Equipment manager class
     """
 
-    def __init__(self, mqtt_client_instant: 'MqttClient'):
+    def __init__(self, mqtt_client_instant: 'MqttClient', equipments: list[dict] = None, persist: bool = True,
+                 node: str = None, config_sync: bool = VALIDATE_CONFIG_STORE_ENABLE):
+        """
+        :param mqtt_client_instant: MqttClient
+        :param equipments: equipment list to manage, loaded from API when None
+        :param persist: save equipment list to EQUIPMENTS_CONFIG_PATH on change
+        :param node: name of this process in the fleet status topics, default host name
+        :param config_sync: keep the validate config store synced with the API,
+            False when another process of the host does (shards)
+        """
         self.mqtt = mqtt_client_instant
+        self.persist = persist
         self.gem_hosts: list[SecsGemHost] = []
-        self.mqtt.client.user_data_set({"gem_hosts": self.gem_hosts})
+        self.mqtt.client.user_data_set({"gem_hosts": self.gem_hosts, "manager": self})
+        self._reconcile_lock = threading.Lock()
 
         # self.load_equipments_config()
-        self.load_equipments()
+        # equipment list of the API, kept in sync by reload_equipments
+        self.from_api = equipments is None
+        if equipments is None:
+            self.load_equipments()
+        else:
+            self.add_gem_hosts(equipments)
+        self.reconciler = EquipmentReconciler(
+            self) if self.from_api and EQUIPMENT_RECONCILE_INTERVAL else None
+
+        self.fleet_status = FleetStatusPublisher(
+            self, self.mqtt, node) if FLEET_STATUS_ENABLE and MQTT_ENABLE else None
+        self.state_snapshot = StateSnapshotWriter(
+            self) if STATE_SNAPSHOT_ENABLE else None
+        self.config_sync = ValidateConfigSync() if config_sync else None
 
     def load_equipments(self):
         """
         Load equipments
         """
-        load_dotenv()
-
-        api_server = os.getenv("API_SERVER")
-        api_port = int(os.getenv("API_PORT"))
-        api_endpoint = os.getenv("API_ENDPOINT")
-
-        # api GET localhost:3000/api/secsgem/equipments?page=1&limit=5&sort=equipment_name&order=1
-        # create url
-        api_url = f"http://{api_server}:{api_port}/{api_endpoint}/secsgem/equipments?page=1&limit=5&sort=equipment_name&order=1"
-        # print(api_url)
-        response = requests.get(
-            api_url,
-            timeout=10,
-            headers={'Accept': 'application/json'}
-        )
-        response.raise_for_status()
-
-        # Validate response format
-        equipments = response.json()
-        print(equipments)
-        # {'docs': [{'_id': '67c700fe403ebe5e10ffb567', 'mode': 'ACTIVE', 'equipment_name': 'TNF-61', 'equipment_model': 'FCL', 'address': '192.168.226.161', 'port': 5000, 'session_id': 61, 'enable': False, 'createdAt': '2025-03-04T13:32:46.731Z', 'updatedAt': '2025-03-15T05:57:19.172Z'}, {'_id': '67d4d1a0018c593bd0645f0a', 'mode': 'ACTIVE', 'equipment_name': 'TNF-62', 'equipment_model': 'FCL', 'address': '192.168.226.162', 'port': 5000, 'session_id': 62, 'enable': False, 'createdAt': '2025-03-15T01:02:24.373Z', 'updatedAt': '2025-03-15T06:01:04.762Z'}, {'_id': '67d4ece4018c593bd0645f4f', 'mode': 'PASSIVE', 'equipment_name': 'TNF-63', 'equipment_model': 'FCL', 'address': '192.168.226.163', 'port': 5000, 'session_id': 63, 'enable': False, 'createdAt': '2025-03-15T02:58:44.546Z', 'updatedAt': '2025-03-15T06:01:13.534Z'}, {'_id': '67d4ed1d018c593bd0645f54', 'mode': 'ACTIVE', 'equipment_name': 'TNF-64', 'equipment_model': 'FCL', 'address': '192.168.226.164', 'port': 5000, 'session_id': 64, 'enable': False, 'createdAt': '2025-03-15T02:59:41.444Z', 'updatedAt': '2025-03-15T04:14:44.446Z'}, {'_id': '67d51922018c593bd06460e0', 'mode': 'ACTIVE', 'equipment_name': 'TNF-65', 'equipment_model': 'FCL', 'address': '192.168.226.165', 'port': 5000, 'session_id': 65, 'enable': False, 'createdAt': '2025-03-15T06:07:30.422Z', 'updatedAt': '2025-03-15T06:14:15.597Z'}], 'totalDocs': 6, 'limit': 5, 'totalPages': 2, 'page': 1, 'pagingCounter': 1, 'hasPrevPage': False, 'hasNextPage': True, 'prevPage': None, 'nextPage': 2}
-        if isinstance(equipments, dict):
-
-            for equipment in equipments.get("docs", []):
-                setts = validate_hsms_settings(equipment)
-                if isinstance(setts, secsgem.hsms.HsmsSettings):
-                    gem_host = SecsGemHost(
-                        equipment_name=equipment["equipment_name"],
-                        equipment_model=equipment["equipment_model"],
-                        enable=True if equipment["enable"] else False,
-                        mqtt_client=self.mqtt,
-                        settings=setts
-                    )
-                    self.gem_hosts.append(gem_host)
-                    logging.info(
-                        "Equipment %s loaded successfully", equipment['equipment_name'])
+        self.add_gem_hosts(fetch_equipments())
+
+    def reload_equipments(self):
+        """
+        Fetch the equipment list from API and apply its changes, nothing when unchanged
+        :return: reconcile result or message
+        """
+        if not self.from_api:
+            return "Equipments are not loaded from API"
+        try:
+            equipments = fetch_equipments_if_changed()
+            if equipments is not None and not equipments and self.gem_hosts:
+                # an API answering an empty list is far more likely broken than the fleet gone
+                equipment_list_responses.invalidate()
+                raise ValueError("empty equipment list")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Equipment list not reloaded, keeping the current equipments: %s", e)
+            return f"Equipment list not reloaded: {e}"
+        if equipments is None:
+            return "Equipment list unchanged"
+        return self.reconcile_equipments(equipments)
+
+    @staticmethod
+    def _host_settings(gem_host: SecsGemHost) -> dict:
+        return {
+            "equipment_model": gem_host.equipment_model,
+            "address": getattr(gem_host.settings, "address", ""),
+            "port": getattr(gem_host.settings, "port", None),
+            "session_id": gem_host.settings.session_id,
+            "mode": getattr(gem_host.settings, "connect_mode").name,
+            "enable": gem_host.is_enable,
+        }
+
+    def reconcile_equipments(self, equipments: list[dict]):
+        """
+        Bring the hosts in line with an equipment list by equipment name,
+        hosts whose RECONCILE_FIELDS are unchanged keep their session
+        :return: {"added", "removed", "updated", "enabled", "disabled", "unchanged"}
+        """
+        result = {"added": [], "removed": [], "updated": [], "enabled": [], "disabled": [], "unchanged": 0}
+        desired = {equipment["equipment_name"]: equipment for equipment in equipments
+                   if "equipment_name" in equipment}
+        with self._reconcile_lock:
+            for gem_host in list(self.gem_hosts):
+                if gem_host.equipment_name not in desired:
+                    self.retire(gem_host, forget_state=True)
+                    result["removed"].append(gem_host.equipment_name)
+
+            for name, equipment in desired.items():
+                gem_host = next(
+                    (host for host in self.gem_hosts if host.equipment_name == name), None)
+                if gem_host is None:
+                    if self.add_gem_hosts([equipment]):
+                        result["added"].append(name)
+                    continue
+                current = self._host_settings(gem_host)
+                changed = [field for field in RECONCILE_FIELDS
+                           if field != "enable" and equipment.get(field) != current[field]]
+                if changed:
+                    self.retire(gem_host, forget_state=False)
+                    self.add_gem_hosts([equipment])
+                    result["updated"].append(name)
+                elif bool(equipment.get("enable")) != current["enable"]:
+                    if equipment.get("enable"):
+                        gem_host.secs_control.enable_equipment()
+                        result["enabled"].append(name)
+                    else:
+                        gem_host.secs_control.disable_equipment()
+                        result["disabled"].append(name)
                 else:
-                    logging.error(
-                        "Equipment %s failed to load with error: %s", equipment['equipment_name'], setts)
-                    print(
-                        f"Equipment {equipment['equipment_name']} not initialized")
+                    result["unchanged"] += 1
+
+            if any(result[key] for key in ("added", "removed", "updated", "enabled", "disabled")):
+                logger.info("Equipments reconciled: %s", result)
+                self.save()
+        return result
+
+    def retire(self, gem_host: SecsGemHost, forget_state: bool):
+        """
+        Disable a host and drop it from the manager
+        :param forget_state: remove its state snapshot, False when it is recreated here
+            or by another cluster node, its state is kept and saved for the warm start then
+        """
+        keep_state = not forget_state and self.state_snapshot is not None
+        gem_host.keep_state_on_close = keep_state
+        if gem_host.is_enable:
+            gem_host.disable()
+        self.gem_hosts.remove(gem_host)
+        collectors.remove_equipment(gem_host.equipment_name)
+        if gem_host.archive:
+            gem_host.archive.close()
+        if keep_state:
+            self.state_snapshot.store.save(gem_host.state)
+        elif forget_state:
+            state_snapshots.clear(gem_host.equipment_name)
+
+    def add_gem_hosts(self, equipments: list[dict]):
+        """
+        Create SecsGemHost for each equipment
+        :param equipments: list of equipment dict
+        :return: number of hosts created
+        """
+        created = 0
+        for equipment in equipments:
+            setts = validate_hsms_settings(equipment)
+            if isinstance(setts, secsgem.hsms.HsmsSettings):
+                gem_host = SecsGemHost(
+                    equipment_name=equipment["equipment_name"],
+                    equipment_model=equipment["equipment_model"],
+                    enable=True if equipment["enable"] else False,
+                    mqtt_client=self.mqtt,
+                    settings=setts,
+                    transaction_window=equipment.get(
+                        "transaction_window", SECS_TRANSACTION_WINDOW),
+                    sync_priority=equipment.get(
+                        "sync_priority", RECONNECT_DEFAULT_PRIORITY)
+                )
+                self.gem_hosts.append(gem_host)
+                created += 1
+                logging.info(
+                    "Equipment %s loaded successfully", equipment['equipment_name'])
+            else:
+                logging.error(
+                    "Equipment %s failed to load with error: %s", equipment['equipment_name'], setts)
+                output("Equipment %s not initialized", equipment['equipment_name'])
+        return created
 
     def load_equipments_config(self):
         """
@@ -143,7 +355,11 @@ class SecsGemHostManager:
                             equipment_model=equipment["equipment_model"],
                             enable=True if equipment["enable"] else False,
                             mqtt_client=self.mqtt,
-                            settings=setts
+                            settings=setts,
+                            transaction_window=equipment.get(
+                                "transaction_window", SECS_TRANSACTION_WINDOW),
+                            sync_priority=equipment.get(
+                                "sync_priority", RECONNECT_DEFAULT_PRIORITY)
                         )
                         self.gem_hosts.append(gem_host)
                         logging.info(
@@ -151,38 +367,50 @@ class SecsGemHostManager:
                     else:
                         logging.error(
                             "Equipment %s failed to load with error: %s", equipment['equipment_name'], setts)
-                        print(
-                            f"Equipment {equipment['equipment_name']} not initialized")
+                        output("Equipment %s not initialized", equipment['equipment_name'])
         except FileNotFoundError:
             logging.error("Equipments configuration file not found")
-            print("Equipments configuration file not found")
+            output("Equipments configuration file not found")
         except json.JSONDecodeError:
             logging.error("Equipments configuration file is not a valid JSON")
-            print("Equipments configuration file is not a valid JSON")
+            output("Equipments configuration file is not a valid JSON")
         except Exception as e:
             logging.error("Error loading equipments configuration: %s", e)
-            print(f"Error loading equipments configuration: {e}")
+            output("Error loading equipments configuration: %s", e)
 
-    def exit(self):
+    def exit(self, after_close: Callable[[], None] = None):
         """
-        Exit
+        Exit, equipments are disabled concurrently within SHUTDOWN_TIMEOUT
+        :param after_close: called once the equipments are closed, before MQTT disconnects
+        :return: shutdown report, see ShutdownCoordinator.run
         """
         self.save()
+        if self.reconciler:
+            self.reconciler.stop()
+        if self.config_sync:
+            self.config_sync.stop()
+        if self.fleet_status:
+            self.fleet_status.stop()
+        if self.state_snapshot:
+            self.state_snapshot.stop()
         for gem_host in self.gem_hosts:
-            if gem_host.is_enable:
-                gem_host.disable()
-                logger.info("Equipment %s disabled", gem_host.equipment_name)
-        self.mqtt.client.loop_stop()
-        self.mqtt.client.disconnect()
+            # restored on the next start, see src.host.state_snapshot
+            gem_host.keep_state_on_close = self.state_snapshot is not None
+        report = ShutdownCoordinator().run(list(self.gem_hosts), self.mqtt, after_close)
+        if report["not_closed"]:
+            output("Equipments not closed cleanly: %s", report['not_closed'])
 
         logger.info("Exiting application")
-        print("Exiting application")
+        output("Exiting application")
+        return report
 
     def save(self):
         """
         Save equipments to file
         :return: str
         """
+        if not self.persist:
+            return "Equipments are not persisted"
         equipments = []
         try:
             for equipment in self.gem_hosts:
@@ -193,14 +421,16 @@ class SecsGemHostManager:
                     "port": getattr(equipment.settings, "port", "5000"),
                     "session_id": equipment.settings.session_id,
                     "mode": getattr(equipment.settings, "connect_mode").name,
-                    "enable": equipment.is_enable
+                    "enable": equipment.is_enable,
+                    "transaction_window": equipment.transactions.window,
+                    "sync_priority": equipment.sync_priority
                 })
 
             with open(EQUIPMENTS_CONFIG_PATH, "w", encoding="utf-8") as f:
                 json.dump({"equipments": equipments}, f, indent=4)
                 return "Equipments saved to file"
         except Exception as e:
-            print(f"Error saving equipments: {e}")
+            output("Error saving equipments: %s", e)
             return f"Error saving equipments: {e}"
 
     def list_equipments(self):
@@ -216,7 +446,9 @@ class SecsGemHostManager:
                 "port": getattr(equipment.settings, "port", "5000"),
                 "session_id": equipment.settings.session_id,
                 "mode": getattr(equipment.settings, "connect_mode").name,
-                "enable": equipment.is_enable
+                "enable": equipment.is_enable,
+                "transaction_window": equipment.transactions.window,
+                "sync_priority": equipment.sync_priority
             })
 
         return json.dumps({"equipments": equipments}, indent=4)
@@ -233,46 +465,48 @@ class SecsGemHostManager:
         :param session_id: int
         :param mode: str
         """
-        try:
-            settings = validate_hsms_settings(
-                {"address": address, "port": port, "session_id": session_id, "mode": mode})
-            if not isinstance(settings, secsgem.hsms.HsmsSettings):
-                print(f"Validation error {settings}")
-                return f"Validation error {settings}"
-
-            # Check if equipment already exists with name and address
-            if next((eq for eq in self.gem_hosts if eq.equipment_name == equipment_name), None):
-                print(f"Equipment {equipment_name} already exists")
-                return f"Equipment {equipment_name} already exists"
-            if next((eq for eq in self.gem_hosts if getattr(eq.settings, "address") == settings.address), None):
-                print(
-                    f"Equipment with address {settings.address} already exists")
-                return f"Equipment with address {settings.address} already exists"
-            equipment = SecsGemHost(
-                equipment_name, equipment_model, enable, self.mqtt, settings)
-            self.gem_hosts.append(equipment)
-            print(f"Equipment {equipment_name} added")
-            self.save()
-            return f"Equipment {equipment_name} added"
-        except Exception as e:
-            print(f"Error adding equipment: {e}")
-            return f"Error adding equipment: {e}"
+        # not while a reload reconciles the list
+        with self._reconcile_lock:
+            try:
+                settings = validate_hsms_settings(
+                    {"address": address, "port": port, "session_id": session_id, "mode": mode})
+                if not isinstance(settings, secsgem.hsms.HsmsSettings):
+                    output("Validation error %s", settings)
+                    return f"Validation error {settings}"
+
+                # Check if equipment already exists with name and address
+                if next((eq for eq in self.gem_hosts if eq.equipment_name == equipment_name), None):
+                    output("Equipment %s already exists", equipment_name)
+                    return f"Equipment {equipment_name} already exists"
+                if next((eq for eq in self.gem_hosts if getattr(eq.settings, "address") == settings.address), None):
+                    output("Equipment with address %s already exists", settings.address)
+                    return f"Equipment with address {settings.address} already exists"
+                equipment = SecsGemHost(
+                    equipment_name, equipment_model, enable, self.mqtt, settings)
+                self.gem_hosts.append(equipment)
+                output("Equipment %s added", equipment_name)
+                self.save()
+                return f"Equipment {equipment_name} added"
+            except Exception as e:
+                output("Error adding equipment: %s", e)
+                return f"Error adding equipment: {e}"
 
     def remove_equipment(self, equipment_name: str):
         """
         Remove equipment
         :param equipment_name: str
         """
-        try:
-            equipment = next(
-                (eq for eq in self.gem_hosts if eq.equipment_name == equipment_name), None)
-            if not equipment:
-                print(f"Equipment {equipment_name} not found")
-                return f"Equipment {equipment_name} not found"
-            self.gem_hosts.remove(equipment)
-            print(f"Equipment {equipment_name} removed")
-            self.save()
-            return f"Equipment {equipment_name} removed"
-        except Exception as e:
-            print(f"Error removing equipment: {e}")
-            return f"Error removing equipment: {e}"
+        with self._reconcile_lock:
+            try:
+                equipment = next(
+                    (eq for eq in self.gem_hosts if eq.equipment_name == equipment_name), None)
+                if not equipment:
+                    output("Equipment %s not found", equipment_name)
+                    return f"Equipment {equipment_name} not found"
+                self.retire(equipment, forget_state=True)
+                output("Equipment %s removed", equipment_name)
+                self.save()
+                return f"Equipment {equipment_name} removed"
+            except Exception as e:
+                output("Error removing equipment: %s", e)
+                return f"Error removing equipment: {e}"
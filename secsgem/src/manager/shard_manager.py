@@ -0,0 +1,377 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import TYPE_CHECKING
+
+from config.app_config import (EQUIPMENTS_CONFIG_PATH, HOST_SHARD_REQUEST_TIMEOUT, HOST_SHARD_RESTART_DELAY,
+                               METRICS_ENABLE, RECONNECT_SYNC_CONCURRENCY, SHUTDOWN_TIMEOUT,
+                               VALIDATE_CONFIG_STORE_ENABLE)
+from src.metrics import collectors
+from config.logger.output_sink import output
+from src.manager.host_manager import fetch_equipments
+from src.host.handler.control import SecsControl
+from src.host.handler.lot_management.config_store import ValidateConfigSync
+from src.mqtt.handler.handler_message import HandlerMessage
+
+if TYPE_CHECKING:
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+
+def shard_of(equipment_name: str, shards: int) -> int:
+    """
+    Stable shard index of an equipment
+    """
+    return zlib.crc32(equipment_name.encode("utf-8")) % shards
+
+
+def _shard_worker(index: int, equipments: list[dict], conn, shards: int = 1):
+    """
+    Shard process, owns the HSMS sessions and MQTT client of its equipments
+    and executes requests received from the supervisor
+    :param shards: number of shards, fleet wide limits are divided by it
+    """
+    # pylint: disable=import-outside-toplevel
+    from config.logger.all_logger import AppLogger
+    from config.logger.output_sink import QuietSink, set_sink
+    from src.mqtt.mqtt_client import MqttClient
+    from src.host.reconnect import reconnect_supervisor
+    from src.manager.host_manager import SecsGemHostManager
+    from src.metrics.exporter import start_exporters
+
+    AppLogger(log_dir=f"logs/app/shard{index}")
+    # workers have no terminal of their own, the supervisor prints
+    set_sink(QuietSink())
+    # control topics are routed by the supervisor
+    mqtt_client = MqttClient(subscribe_topics=[])
+    if METRICS_ENABLE:
+        start_exporters(
+            mqtt_client, f"{socket.gethostname()}-shard{index}", index + 1)
+    # RECONNECT_SYNC_CONCURRENCY is for the whole host, shared by the shards
+    reconnect_supervisor.concurrency = max(1, RECONNECT_SYNC_CONCURRENCY // shards)
+    # the supervisor syncs the validate config store, shards read it
+    manager = SecsGemHostManager(
+        mqtt_client, equipments=equipments, persist=False, node=f"{socket.gethostname()}-shard{index}",
+        config_sync=False)
+    send_lock = threading.Lock()
+
+    def reply(request_id: int, result):
+        if not isinstance(result, (str, int, float, bool, list, dict, type(None))):
+            result = str(result)
+        with send_lock:
+            conn.send((request_id, result))
+
+    def handle(request_id: int, target: str, equipment_name: str, method: str, args: list):
+        if target == "manager":
+            if method not in ("list_equipments", "add_equipment", "remove_equipment"):
+                return reply(request_id, f"Unknown command: {method}")
+            try:
+                return reply(request_id, getattr(manager, method)(*args))
+            except Exception as e:
+                return reply(request_id, f"Error executing {method}: {e}")
+
+        gem_host = next(
+            (host for host in manager.gem_hosts if host.equipment_name == equipment_name), None)
+        if not gem_host:
+            return reply(request_id, f"Equipment {equipment_name} not found")
+
+        if target == "secs_control":
+            return reply(request_id, gem_host.secs_control.execute(method, args, SecsControl.COMMANDS))
+        if target == "mqtt_control":
+            return reply(request_id, gem_host.secs_control.execute(method, args))
+
+        if target != "gem_host" or method not in RemoteGemHost.METHODS:
+            return reply(request_id, f"Unknown command: {method}")
+        try:
+            return reply(request_id, getattr(gem_host, method)(*args))
+        except Exception as e:
+            return reply(request_id, f"Error executing {method}: {e}")
+
+    logger.info("Shard %s started with %s equipments", index, len(equipments))
+    while True:
+        try:
+            request_id, target, equipment_name, method, args = conn.recv()
+        except (EOFError, OSError):
+            # supervisor is gone
+            manager.exit()
+            break
+        if target == "exit":
+            manager.exit()
+            reply(request_id, "exit")
+            break
+        threading.Thread(target=handle, args=(
+            request_id, target, equipment_name, method, args), daemon=True).start()
+
+
+class _RemoteTarget:
+    """
+    Forward calls of declared methods to an object in the owning shard
+    """
+
+    def __init__(self, supervisor: 'ShardSupervisor', equipment_name: str, target: str, methods: frozenset):
+        self._supervisor = supervisor
+        self._equipment_name = equipment_name
+        self._target = target
+        self._methods = methods
+
+    def __getattr__(self, method: str):
+        if method not in self._methods:
+            raise AttributeError(f"{self._target} of a shard has no remote method {method}")
+
+        def call(*args):
+            return self._supervisor.route(self._equipment_name, self._target, method, list(args))
+        return call
+
+
+class RemoteGemHost:
+    """
+    Proxy of a SecsGemHost running in a shard process, usable by ControlCli
+    """
+    # SecsGemHost methods called through the proxy
+    METHODS = frozenset({"are_you_there", "set_ec"})
+
+    def __init__(self, supervisor: 'ShardSupervisor', equipment_name: str):
+        self.equipment_name = equipment_name
+        self.secs_control = _RemoteTarget(
+            supervisor, equipment_name, "secs_control", SecsControl.COMMANDS)
+        self._gem_host = _RemoteTarget(supervisor, equipment_name, "gem_host", self.METHODS)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._gem_host, name)
+
+
+class ShardSupervisor:
+    """
+    Split equipments across worker processes, each with its own HSMS sessions and MQTT client.
+    Routes CLI and MQTT commands to the owning shard and restarts failed shards.
+    Provides the SecsGemHostManager interface used by MainCli and ConfigCli.
+    """
+
+    def __init__(self, mqtt_client_instant: 'MqttClient', shards: int, equipments: list[dict] = None):
+        self.mqtt = mqtt_client_instant
+        self.shards = max(1, shards)
+        self._context = multiprocessing.get_context("spawn")
+        self._request_ids = itertools.count()
+        self._pending: dict[int, tuple[int, Future]] = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._workers: list[dict] = [{} for _ in range(self.shards)]
+        # one sync for the store shared by all shards
+        self.config_sync = ValidateConfigSync() if VALIDATE_CONFIG_STORE_ENABLE else None
+
+        if equipments is None:
+            equipments = fetch_equipments()
+        assignments = [[] for _ in range(self.shards)]
+        for equipment in equipments:
+            assignments[shard_of(equipment["equipment_name"],
+                                 self.shards)].append(equipment)
+        for index in range(self.shards):
+            self._start_shard(index, assignments[index])
+
+        self.mqtt.client.message_callback_add(
+            "equipments/control/+/+", self._on_control_message)
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    @property
+    def gem_hosts(self) -> list[RemoteGemHost]:
+        """Proxy of every equipment in every shard"""
+        return [RemoteGemHost(self, equipment["equipment_name"])
+                for worker in self._workers for equipment in worker["equipments"]]
+
+    def _start_shard(self, index: int, equipments: list[dict]):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_shard_worker, args=(index, equipments, child_conn, self.shards),
+            name=f"dejtnf-shard{index}", daemon=True)
+        process.start()
+        child_conn.close()
+        self._workers[index] = {"process": process,
+                                "conn": parent_conn, "equipments": equipments}
+        threading.Thread(target=self._reader, args=(
+            index, parent_conn), daemon=True).start()
+        logger.info("Shard %s started, pid %s, equipments %s", index, process.pid,
+                    [equipment["equipment_name"] for equipment in equipments])
+
+    def _reader(self, index: int, conn):
+        """Resolve pending requests with replies from a shard"""
+        while True:
+            try:
+                request_id, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                _, future = self._pending.pop(request_id, (index, None))
+            if future:
+                future.set_result(result)
+        self._fail_pending(index, f"Shard {index} stopped")
+
+    def _fail_pending(self, index: int, reason: str):
+        with self._lock:
+            failed = [request_id for request_id,
+                      (shard, _) in self._pending.items() if shard == index]
+            futures = [self._pending.pop(request_id)[1]
+                       for request_id in failed]
+        for future in futures:
+            future.set_result(reason)
+
+    def _monitor(self):
+        """Restart shards whose process died"""
+        while not self._stopping:
+            time.sleep(1)
+            for index, worker in enumerate(self._workers):
+                if self._stopping or worker["process"].is_alive():
+                    continue
+                logger.error("Shard %s died with exit code %s, restarting",
+                             index, worker["process"].exitcode)
+                output("Shard %s died, restarting", index)
+                worker["conn"].close()
+                self._fail_pending(index, f"Shard {index} restarted")
+                time.sleep(HOST_SHARD_RESTART_DELAY)
+                if not self._stopping:
+                    self._start_shard(index, worker["equipments"])
+
+    def request(self, index: int, target: str, equipment_name: str, method: str, args: list = None,
+                timeout: float = HOST_SHARD_REQUEST_TIMEOUT):
+        """
+        Send a request to a shard and wait for the result
+        :param timeout: seconds to wait for the reply, an error message is returned then
+        """
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._pending[request_id] = (index, future)
+            try:
+                self._workers[index]["conn"].send(
+                    (request_id, target, equipment_name, method, args or []))
+            except (OSError, ValueError) as e:
+                self._pending.pop(request_id, None)
+                return f"Shard {index} is not available: {e}"
+        collectors.worker_queue_depth.inc(queue=f"shard{index}")
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            logger.error("Shard %s did not reply to %s %s of %s within %s s",
+                         index, target, method, equipment_name, timeout)
+            return f"Shard {index} did not reply within {timeout} s"
+        finally:
+            collectors.worker_queue_depth.dec(queue=f"shard{index}")
+
+    def route(self, equipment_name: str, target: str, method: str, args: list = None):
+        """
+        Execute method on secs_control or gem_host of an equipment in its owning shard
+        """
+        return self.request(shard_of(equipment_name, self.shards), target, equipment_name, method, args)
+
+    def _on_control_message(self, client, userdata, message):
+        """
+        Route equipments/control/<equipment_name>/<command> to the owning shard
+        """
+        _, _, equipment_name, command = message.topic.split("/")
+        args = HandlerMessage.parse_control_args(
+            message.payload.decode("utf-8"))
+
+        def run():
+            result = self.route(equipment_name, "mqtt_control", command, args)
+            self.mqtt.client.publish(
+                f"equipments/response/{equipment_name}/{command}", json.dumps(result, default=str))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _collect_equipments(self) -> list[dict]:
+        equipments = []
+        for index in range(self.shards):
+            result = self.request(index, "manager", "", "list_equipments")
+            try:
+                equipments.extend(json.loads(result).get("equipments", []))
+            except (TypeError, json.JSONDecodeError):
+                logger.error("Shard %s list equipments failed: %s",
+                             index, result)
+        return equipments
+
+    def list_equipments(self):
+        """
+        List equipments of all shards
+        """
+        return json.dumps({"equipments": self._collect_equipments()}, indent=4)
+
+    def save(self):
+        """
+        Save equipments of all shards to file
+        """
+        try:
+            with open(EQUIPMENTS_CONFIG_PATH, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"equipments": self._collect_equipments()}, f, indent=4)
+                return "Equipments saved to file"
+        except Exception as e:
+            output("Error saving equipments: %s", e)
+            return f"Error saving equipments: {e}"
+
+    def add_equipment(self, equipment_name: str, equipment_model: str, enable: bool, address: str, port: int, session_id: int, mode: str):
+        """
+        Add equipment to its owning shard
+        """
+        index = shard_of(equipment_name, self.shards)
+        result = self.request(index, "manager", equipment_name, "add_equipment", [
+                              equipment_name, equipment_model, enable, address, port, session_id, mode])
+        if result == f"Equipment {equipment_name} added":
+            self._workers[index]["equipments"].append({
+                "equipment_name": equipment_name, "equipment_model": equipment_model, "enable": enable,
+                "address": address, "port": port, "session_id": session_id, "mode": mode})
+            self.save()
+        output(result)
+        return result
+
+    def remove_equipment(self, equipment_name: str):
+        """
+        Remove equipment from its owning shard
+        """
+        index = shard_of(equipment_name, self.shards)
+        result = self.request(index, "manager", equipment_name,
+                              "remove_equipment", [equipment_name])
+        if result == f"Equipment {equipment_name} removed":
+            self._workers[index]["equipments"] = [
+                equipment for equipment in self._workers[index]["equipments"] if equipment["equipment_name"] != equipment_name]
+            self.save()
+        output(result)
+        return result
+
+    def exit(self):
+        """
+        Stop all shards
+        """
+        self.save()
+        self._stopping = True
+        if self.config_sync:
+            self.config_sync.stop()
+
+        def stop_shard(index: int):
+            if self.request(index, "exit", "", "", timeout=SHUTDOWN_TIMEOUT + 5) != "exit":
+                logger.error("Shard %s did not exit in time", index)
+
+        # shards shut their equipments down at the same time
+        threads = [threading.Thread(target=stop_shard, args=(index,), daemon=True)
+                   for index in range(self.shards)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for worker in self._workers:
+            worker["process"].join(timeout=10)
+            worker["conn"].close()
+        self.mqtt.client.loop_stop()
+        self.mqtt.client.disconnect()
+
+        logger.info("Exiting application")
+        output("Exiting application")
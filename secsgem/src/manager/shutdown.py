@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+from config.app_config import SHUTDOWN_CONCURRENCY, SHUTDOWN_TIMEOUT
+from config.logger.all_logger import drain_log_queues
+
+if TYPE_CHECKING:
+    from src.host.gemhost import SecsGemHost
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+
+class ShutdownCoordinator:
+    """
+    Disable the equipments of a manager concurrently within one global deadline,
+    then flush pending MQTT publishes and log queues with the time left.
+    Equipments still closing at the deadline are reported and left to the daemon threads.
+    """
+
+    def __init__(self, timeout: float = SHUTDOWN_TIMEOUT, concurrency: int = SHUTDOWN_CONCURRENCY):
+        """
+        :param timeout: seconds for the whole shutdown
+        :param concurrency: equipments disabled at the same time
+        """
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+
+    def _disable(self, gem_host: 'SecsGemHost', slots: threading.Semaphore, results: dict):
+        with slots:
+            start = time.monotonic()
+            try:
+                if gem_host.is_enable:
+                    gem_host.disable()
+                if gem_host.archive:
+                    gem_host.archive.flush()
+                results[gem_host.equipment_name] = ("closed", time.monotonic() - start)
+            except Exception as e:
+                logger.error("Error disabling %s: %s", gem_host.equipment_name, e, exc_info=True)
+                results[gem_host.equipment_name] = (f"error: {e}", time.monotonic() - start)
+
+    def run(self, gem_hosts: list['SecsGemHost'], mqtt_client: 'MqttClient' = None,
+            after_close: Optional[Callable[[], None]] = None) -> dict:
+        """
+        Disable every equipment, flush and disconnect MQTT, drain the log queues
+        :param after_close: called when the equipments are closed or the deadline passed,
+            before MQTT is flushed, e.g. to release cluster leases
+        :return: {"elapsed", "closed", "not_closed": {equipment: reason}, "mqtt_pending", "logs_drained"}
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        slots = threading.Semaphore(self.concurrency)
+        results: dict[str, tuple[str, float]] = {}
+        threads = []
+        for gem_host in gem_hosts:
+            # daemon threads, a host stuck in HSMS separate must not keep the process alive
+            thread = threading.Thread(target=self._disable, args=(gem_host, slots, results),
+                                      name=f"shutdown-{gem_host.equipment_name}", daemon=True)
+            thread.start()
+            threads.append((gem_host.equipment_name, thread))
+        for _, thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        closed = []
+        not_closed = {}
+        for name, thread in threads:
+            outcome, seconds = results.get(name, ("timeout", time.monotonic() - start))
+            if outcome == "closed":
+                closed.append(name)
+            else:
+                not_closed[name] = outcome
+                logger.warning("Equipment %s did not close cleanly: %s after %.1f s", name, outcome, seconds)
+
+        if after_close is not None:
+            try:
+                after_close()
+            except Exception as e:
+                logger.error("Error after closing equipments: %s", e, exc_info=True)
+
+        mqtt_pending = 0
+        if mqtt_client is not None:
+            mqtt_pending = mqtt_client.flush(max(0.0, deadline - time.monotonic()))
+            if mqtt_pending:
+                logger.warning("%s MQTT messages not published before shutdown", mqtt_pending)
+            mqtt_client.client.loop_stop()
+            mqtt_client.client.disconnect()
+
+        report = {
+            "elapsed": round(time.monotonic() - start, 2),
+            "closed": len(closed),
+            "not_closed": not_closed,
+            "mqtt_pending": mqtt_pending,
+        }
+        logger.info("Shutdown of %s equipments in %.2f s: %s closed, %s not closed %s",
+                    len(threads), report["elapsed"], len(closed), len(not_closed), sorted(not_closed))
+        # last, so the records above are written too
+        report["logs_drained"] = drain_log_queues(max(0.5, deadline - time.monotonic()))
+        return report
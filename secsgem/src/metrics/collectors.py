@@ -0,0 +1,98 @@
+import threading
+from typing import Optional
+
+import secsgem.common
+import secsgem.secs
+
+from src.metrics.registry import Registry
+
+# process wide registry, exposed by src.metrics.exporter
+registry = Registry()
+
+secs_messages = registry.counter(
+    "dejtnf_secs_messages_total", "SECS messages by equipment, direction and stream function",
+    ("equipment", "direction", "sf"))
+secs_t3_timeouts = registry.counter(
+    "dejtnf_secs_t3_timeouts_total", "Primary messages without reply within T3",
+    ("equipment", "sf"))
+secs_unanswered = registry.counter(
+    "dejtnf_secs_unanswered_total",
+    "Primary messages without reply by reason: t3, adaptive, link_degraded, send_failed",
+    ("equipment", "reason"))
+secs_send_failures = registry.counter(
+    "dejtnf_secs_send_failures_total", "Primary messages that could not be sent",
+    ("equipment", "sf"))
+secs_round_trip = registry.histogram(
+    "dejtnf_secs_round_trip_seconds", "Seconds from primary message to reply",
+    ("equipment", "sf"))
+secs_transactions_in_flight = registry.gauge(
+    "dejtnf_secs_transactions_in_flight", "Open transactions of the transaction pool",
+    ("equipment",))
+secs_send_wait = registry.histogram(
+    "dejtnf_secs_send_wait_seconds", "Time primary messages waited for a transaction slot",
+    ("equipment", "priority"), (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 45.0))
+events_received = registry.counter(
+    "dejtnf_events_received_total", "Collection events processed by HandlerEvent",
+    ("equipment",))
+events_unhandled = registry.counter(
+    "dejtnf_events_unhandled_total", "Collection events without handler, candidates for disabling",
+    ("equipment", "ceid"))
+alarms_received = registry.counter(
+    "dejtnf_alarms_received_total", "Alarm reports processed by HandlerAlarm",
+    ("equipment", "state"))
+mqtt_published = registry.counter(
+    "dejtnf_mqtt_published_total", "MQTT messages acknowledged by the broker (qos 0 when written)")
+mqtt_publish_backlog = registry.gauge(
+    "dejtnf_mqtt_publish_backlog", "MQTT messages queued or waiting for broker acknowledge")
+http_api_latency = registry.histogram(
+    "dejtnf_http_api_seconds", "Seconds of HTTP API requests", ("api",))
+http_api_errors = registry.counter(
+    "dejtnf_http_api_errors_total", "Failed HTTP API requests", ("api",))
+worker_queue_depth = registry.gauge(
+    "dejtnf_worker_queue_depth", "Pending work items by queue", ("queue",))
+threads_active = registry.gauge(
+    "dejtnf_threads_active", "Running threads of the process")
+threads_active.set_function(threading.active_count)
+
+
+def stream_function_name(item) -> str:
+    """
+    SxFy of a stream function or a received message
+    """
+    if isinstance(item, secsgem.common.Message):
+        return f"S{item.header.stream}F{item.header.function}"
+    if isinstance(item, secsgem.secs.SecsStreamFunction):
+        return f"S{item.stream}F{item.function}"
+    return "unknown"
+
+
+def record_message(equipment: str, direction: str, item):
+    """
+    Count a message sent ("out") to or received ("in") from an equipment
+    """
+    secs_messages.inc(equipment=equipment, direction=direction,
+                      sf=stream_function_name(item))
+
+
+def record_transaction(equipment: str, function: secsgem.secs.SecsStreamFunction, seconds: float,
+                       response: Optional[secsgem.common.Message], timed_out: bool, reason: str = None):
+    """
+    Record round trip of a primary message, or its timeout / send failure
+    """
+    name = stream_function_name(function)
+    if response is not None:
+        secs_round_trip.observe(seconds, equipment=equipment, sf=name)
+        return
+    if timed_out:
+        secs_t3_timeouts.inc(equipment=equipment, sf=name)
+    elif reason != "link_degraded":
+        secs_send_failures.inc(equipment=equipment, sf=name)
+    if reason:
+        secs_unanswered.inc(equipment=equipment, reason=reason)
+
+
+def remove_equipment(equipment: str):
+    """
+    Drop the in flight gauge of a removed equipment, counters are kept
+    """
+    secs_transactions_in_flight.remove(equipment=equipment)
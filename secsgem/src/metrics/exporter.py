@@ -0,0 +1,137 @@
+import json
+import logging
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Optional
+
+from config.app_config import (METRICS_HTTP_ADDRESS, METRICS_HTTP_PORT,
+                               METRICS_MQTT_INTERVAL, METRICS_MQTT_TOPIC)
+from src.metrics.collectors import registry as default_registry
+from src.metrics.registry import Registry
+
+if TYPE_CHECKING:
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+
+class MetricsHttpServer:
+    """
+    Serve the registry in Prometheus text format on GET /metrics
+    """
+
+    def __init__(self, registry: Registry, address: str = "0.0.0.0", port: int = 9100):
+        self.registry = registry
+        self._httpd = ThreadingHTTPServer((address, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Listening port"""
+        return self._httpd.server_address[1]
+
+    def _handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler of MetricsHttpServer"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """GET /metrics (text) and /metrics.json"""
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body = registry.expose().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+    def start(self) -> 'MetricsHttpServer':
+        """Serve in a background thread"""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        logger.info("Metrics endpoint listening on port %s", self.port)
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class MetricsMqttPublisher:
+    """
+    Publish a json snapshot of the registry every interval seconds,
+    for sites where the host cannot be scraped
+    """
+
+    def __init__(self, registry: Registry, mqtt_client: 'MqttClient', topic: str, interval: float = 30):
+        self.registry = registry
+        self.mqtt = mqtt_client
+        self.topic = topic
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self):
+        """Publish one snapshot"""
+        payload = {"timestamp": time.time(), "metrics": self.registry.snapshot()}
+        self.mqtt.client.publish(self.topic, json.dumps(payload), qos=0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error("Error publishing metrics: %s", e, exc_info=True)
+
+    def start(self) -> 'MetricsMqttPublisher':
+        """Publish in a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-mqtt", daemon=True)
+        self._thread.start()
+        logger.info("Publishing metrics to %s every %s s",
+                    self.topic, self.interval)
+        return self
+
+    def stop(self):
+        """Stop publishing"""
+        self._stop.set()
+
+
+def start_exporters(mqtt_client: 'MqttClient', node: str = None, port_offset: int = 0) -> list:
+    """
+    Start the HTTP endpoint (METRICS_HTTP_PORT + port_offset) and the MQTT publisher
+    (METRICS_MQTT_TOPIC/<node>) of the process registry, a zero port or interval disables either
+    :param node: name in the topic, default host name
+    :param port_offset: shard processes listen next to the main process
+    """
+    exporters = []
+    if METRICS_HTTP_PORT:
+        try:
+            exporters.append(MetricsHttpServer(
+                default_registry, METRICS_HTTP_ADDRESS, METRICS_HTTP_PORT + port_offset).start())
+        except OSError as e:
+            logger.error("Metrics endpoint not started: %s", e)
+    if METRICS_MQTT_INTERVAL:
+        exporters.append(MetricsMqttPublisher(
+            default_registry, mqtt_client, f"{METRICS_MQTT_TOPIC}/{node or socket.gethostname()}",
+            METRICS_MQTT_INTERVAL).start())
+    return exporters
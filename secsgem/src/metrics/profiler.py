@@ -0,0 +1,225 @@
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter
+from typing import Optional
+
+from config.app_config import (PROFILE_DIR, PROFILE_MAX_SECONDS,
+                               PROFILE_SAMPLE_INTERVAL, TRACEMALLOC_FRAMES)
+
+logger = logging.getLogger("app_logger")
+
+
+def _report_path(kind: str, extension: str = "txt") -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(PROFILE_DIR, f"{kind}_{timestamp}.{extension}")
+
+
+def _frame_name(key: tuple) -> str:
+    code, lineno = key
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{lineno})"
+
+
+class RuntimeProfiler:
+    """
+    Profiling of the running host without restarting it.
+    The sampler reads the stacks of every thread from a separate thread,
+    HSMS sessions keep running and are only slowed by the sampling itself.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampling: Optional[threading.Thread] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def execute(self, command: str, args: list = None):
+        """
+        Execute a profiler command by name, used for MQTT commands
+        :param command: sample, stop, status, threads, tracemalloc_start, tracemalloc_snapshot, tracemalloc_stop
+        """
+        commands = {
+            "sample": self.sample,
+            "stop": self.stop,
+            "status": self.status,
+            "threads": self.dump_threads,
+            "tracemalloc_start": self.tracemalloc_start,
+            "tracemalloc_snapshot": self.tracemalloc_snapshot,
+            "tracemalloc_stop": self.tracemalloc_stop,
+        }
+        if command not in commands:
+            return f"Unknown command: {command}"
+        try:
+            return commands[command](*(args or []))
+        except Exception as e:
+            logger.error("Error executing profiler %s: %s",
+                         command, e, exc_info=True)
+            return f"Error executing {command}: {e}"
+
+    # sampling profiler
+    def start_sampling(self, seconds: float) -> str:
+        """
+        Sample in the background, the report is written when done or stopped
+        """
+        if self._sampling is not None:
+            return "Sampling already running"
+        thread = threading.Thread(target=self.sample, args=(
+            seconds,), name="profiler-sampler", daemon=True)
+        thread.start()
+        return f"Sampling every {self.interval} s for {seconds} s"
+
+    def sample(self, seconds: float = 10, top: int = 20) -> dict:
+        """
+        Sample the stacks of all threads for seconds, blocks until done
+        :return: report paths and the functions with most samples
+        """
+        seconds = min(float(seconds), PROFILE_MAX_SECONDS)
+        with self._lock:
+            if self._sampling is not None:
+                return {"error": "Sampling already running"}
+            self._sampling = threading.current_thread()
+            self._stop.clear()
+
+        stacks: Counter = Counter()
+        samples = 0
+        me = threading.get_ident()
+        names = {}
+        logger.info("Sampling profiler started for %s s", seconds)
+        started = time.monotonic()
+        try:
+            while time.monotonic() - started < seconds and not self._stop.wait(self.interval):
+                if samples % 100 == 0:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    # names are formatted once for the report, sampling stays cheap
+                    stack = []
+                    while frame is not None:
+                        stack.append((frame.f_code, frame.f_lineno))
+                        frame = frame.f_back
+                    stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+                samples += 1
+        finally:
+            with self._lock:
+                self._sampling = None
+
+        elapsed = time.monotonic() - started
+        own_frames: Counter = Counter()
+        inclusive: Counter = Counter()
+        # collapsed stacks, input of flamegraph.pl / speedscope
+        folded_path = _report_path("sample", "folded")
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for (thread_name, stack), count in stacks.most_common():
+                frames = [_frame_name(key) for key in stack]
+                if frames:
+                    own_frames[frames[0]] += count
+                for name in set(frames):
+                    inclusive[name] += count
+                f.write(";".join([thread_name] + frames[::-1]) + f" {count}\n")
+
+        summary_path = _report_path("sample")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"{samples} samples in {elapsed:.1f} s, interval {self.interval} s\n\n")
+            f.write("Self samples:\n")
+            for name, count in own_frames.most_common(100):
+                f.write(f"{count:>8}  {name}\n")
+            f.write("\nInclusive samples:\n")
+            for name, count in inclusive.most_common(100):
+                f.write(f"{count:>8}  {name}\n")
+
+        logger.info("Sampling profiler done, %s samples, report %s",
+                    samples, summary_path)
+        return {"samples": samples, "seconds": round(elapsed, 1), "report": summary_path,
+                "folded": folded_path,
+                "top": [[name, count] for name, count in own_frames.most_common(int(top))]}
+
+    def stop(self) -> str:
+        """Stop sampling early, the report is still written"""
+        if self._sampling is None:
+            return "Sampling is not running"
+        self._stop.set()
+        return "Sampling stopped"
+
+    def status(self) -> dict:
+        """Running profilers"""
+        return {"sampling": self._sampling is not None,
+                "tracemalloc": tracemalloc.is_tracing(),
+                "threads": threading.active_count()}
+
+    # thread stacks
+    def dump_threads(self) -> str:
+        """
+        Write the current stack of every thread
+        :return: report path
+        """
+        names = {thread.ident: thread for thread in threading.enumerate()}
+        path = _report_path("threads")
+        with open(path, "w", encoding="utf-8") as f:
+            for ident, frame in sys._current_frames().items():
+                thread = names.get(ident)
+                name = thread.name if thread else "unknown"
+                daemon = " daemon" if thread and thread.daemon else ""
+                f.write(f"Thread {name} ({ident}){daemon}:\n")
+                f.write("".join(traceback.format_stack(frame)))
+                f.write("\n")
+        logger.info("Thread stacks written to %s", path)
+        return path
+
+    # memory allocations
+    def tracemalloc_start(self, frames: int = TRACEMALLOC_FRAMES) -> str:
+        """Start tracing allocations, slows allocation heavy code while active"""
+        if tracemalloc.is_tracing():
+            return "Tracemalloc already tracing"
+        tracemalloc.start(int(frames))
+        self._last_snapshot = None
+        return f"Tracemalloc started with {frames} frames"
+
+    def tracemalloc_snapshot(self, top: int = 30) -> dict:
+        """
+        Write the top allocations by line, and the growth since the previous snapshot
+        :return: report path and totals
+        """
+        if not tracemalloc.is_tracing():
+            return {"error": "Tracemalloc is not tracing, run tracemalloc_start first"}
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        path = _report_path("tracemalloc")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n\n")
+            f.write("Top allocations:\n")
+            for stat in snapshot.statistics("lineno")[:int(top)]:
+                f.write(f"{stat}\n")
+            if self._last_snapshot is not None:
+                f.write("\nGrowth since previous snapshot:\n")
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:int(top)]:
+                    f.write(f"{stat}\n")
+            f.write("\nTop allocation tracebacks:\n")
+            for stat in snapshot.statistics("traceback")[:5]:
+                f.write(f"{stat}\n")
+                f.write("\n".join(stat.traceback.format()) + "\n\n")
+        self._last_snapshot = snapshot
+        logger.info("Tracemalloc snapshot written to %s", path)
+        return {"report": path, "current_kib": round(current / 1024, 1), "peak_kib": round(peak / 1024, 1)}
+
+    def tracemalloc_stop(self) -> str:
+        """Stop tracing allocations and free the traces"""
+        if not tracemalloc.is_tracing():
+            return "Tracemalloc is not tracing"
+        tracemalloc.stop()
+        self._last_snapshot = None
+        return "Tracemalloc stopped"
+
+
+# process wide profiler shared by MainCli and MQTT commands
+profiler = RuntimeProfiler()
@@ -0,0 +1,215 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 45.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    Base of labelled metrics, values are kept per label value tuple
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def remove(self, **labels):
+        """Remove a label set, e.g. of a removed equipment"""
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def samples(self) -> list[tuple[str, tuple, float, str]]:
+        """(suffix, label values, value, extra label) of every series"""
+        with self._lock:
+            return [("", key, value, "") for key, value in self._values.items()]
+
+    def expose(self) -> str:
+        """Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.type}"]
+        for suffix, key, value, extra in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+    def snapshot(self) -> list[dict]:
+        """Series as json serializable dicts"""
+        return [{"labels": dict(zip(self.labelnames, key)), "value": value}
+                for _, key, value, _ in self.samples()]
+
+
+class Counter(Metric):
+    """Monotonic counter"""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase counter"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, or is read from a function at collection time
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], dict]] = None
+
+    def set(self, value: float, **labels):
+        """Set value"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase value"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        """Decrease value"""
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], object]):
+        """
+        Read the value at collection time,
+        function returns a number or a dict of label value tuple to number
+        """
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            return super().samples()
+        try:
+            values = self._function()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [("", key if isinstance(key, tuple) else (key,), value, "") for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """Cumulative histogram with sum and count"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        """Add observation"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {
+                    "counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with block"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, series in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), series["counts"]):
+                    cumulative += count
+                    result.append(
+                        ("_bucket", key, cumulative, f'le="{_format_value(bound)}"'))
+                result.append(("_sum", key, series["sum"], ""))
+                result.append(("_count", key, series["count"], ""))
+        return result
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [{"labels": dict(zip(self.labelnames, key)),
+                     "buckets": dict(zip([_format_value(bound) for bound in self.buckets + (math.inf,)],
+                                         series["counts"])),
+                     "sum": round(series["sum"], 6), "count": series["count"]}
+                    for key, series in self._values.items()]
+
+
+class Registry:
+    """
+    Collection of metrics, exposed over HTTP or published to MQTT
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add metric, the same name returns the registered metric"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        """Create or get counter"""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        """Create or get gauge"""
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """Create or get histogram"""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def expose(self) -> str:
+        """All metrics in Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.expose() for metric in metrics) + "\n"
+
+    def snapshot(self) -> dict:
+        """All metrics as json serializable dict"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {"type": metric.type, "series": metric.snapshot()} for metric in metrics}
@@ -0,0 +1,143 @@
+import json
+import logging
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from config.app_config import FLEET_DELTA_INTERVAL, FLEET_SNAPSHOT_INTERVAL, FLEET_STATUS_TOPIC
+
+if TYPE_CHECKING:
+    from src.manager.host_manager import SecsGemHostManager
+    from src.mqtt.mqtt_client import MqttClient
+
+logger = logging.getLogger("app_logger")
+
+# fields of EquipmentState published per equipment
+STATUS_FIELDS = ("is_enable", "communication_state", "control_state",
+                 "process_state", "process_program", "active_lot", "alarms")
+
+
+def _encode(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"), default=str)
+
+
+class FleetStatusPublisher:
+    """
+    Status of every equipment of a manager in one retained snapshot message,
+    <FLEET_STATUS_TOPIC>/snapshot/<node>, with delta messages in between on
+    <FLEET_STATUS_TOPIC>/delta/<node>.
+    A delta carries the seq of the snapshot it applies to and a delta counter,
+    clients that miss a delta wait for the next snapshot. An equipment with "full": true
+    in a delta carries its complete status, it replaces the client's copy instead of merging.
+    The retained snapshot is kept on stop, dashboards show the last known status across restarts.
+    """
+
+    def __init__(self, manager: 'SecsGemHostManager', mqtt_client: 'MqttClient', node: str = None,
+                 snapshot_interval: float = FLEET_SNAPSHOT_INTERVAL, delta_interval: float = FLEET_DELTA_INTERVAL):
+        """
+        :param node: name of this host process in the topics, default host name
+        """
+        self.manager = manager
+        self.mqtt_client = mqtt_client
+        self.node = node or socket.gethostname()
+        self.snapshot_interval = snapshot_interval
+        self.delta_interval = delta_interval
+        self.seq = 0
+        self.delta = 0
+        # equipment name: state version last published
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="fleet-status", daemon=True)
+        self._thread.start()
+
+    @property
+    def snapshot_topic(self) -> str:
+        return f"{FLEET_STATUS_TOPIC}/snapshot/{self.node}"
+
+    @property
+    def delta_topic(self) -> str:
+        return f"{FLEET_STATUS_TOPIC}/delta/{self.node}"
+
+    def _run(self):
+        next_snapshot = 0.0
+        while not self._stop.wait(self.delta_interval):
+            try:
+                if time.monotonic() >= next_snapshot:
+                    next_snapshot = time.monotonic() + self.snapshot_interval
+                    self.publish_snapshot()
+                else:
+                    self.publish_delta()
+            except Exception as e:
+                logger.error("Error publishing fleet status: %s",
+                             e, exc_info=True)
+
+    def snapshot(self) -> dict:
+        """Status of all equipments, the versions become the base of the next deltas"""
+        equipments = {}
+        versions = {}
+        for gem_host in list(self.manager.gem_hosts):
+            state = gem_host.state.snapshot()
+            status = {field: state[field] for field in STATUS_FIELDS}
+            status["v"] = versions[gem_host.equipment_name] = state["version"]
+            equipments[gem_host.equipment_name] = status
+        with self._lock:
+            self.seq += 1
+            self.delta = 0
+            self._versions = versions
+            return {"node": self.node, "seq": self.seq, "ts": round(time.time(), 3),
+                    "equipments": equipments}
+
+    def publish_snapshot(self):
+        """Publish the retained snapshot"""
+        self.mqtt_client.client.publish(
+            self.snapshot_topic, _encode(self.snapshot()), qos=1, retain=True)
+
+    def changes(self) -> dict:
+        """
+        Fields changed since the last snapshot or delta
+        :return: delta message, None if nothing changed
+        """
+        with self._lock:
+            equipments = {}
+            names = set()
+            for gem_host in list(self.manager.gem_hosts):
+                name = gem_host.equipment_name
+                names.add(name)
+                result = gem_host.state.changes_since(
+                    self._versions.get(name, -1))
+                if result["version"] == self._versions.get(name):
+                    continue
+                self._versions[name] = result["version"]
+                changes = {field: value for field, value in result["changes"].items()
+                           if field in STATUS_FIELDS}
+                changes["v"] = result["version"]
+                if result["full"]:
+                    changes["full"] = True
+                equipments[name] = changes
+            removed = [name for name in self._versions if name not in names]
+            for name in removed:
+                del self._versions[name]
+            if not equipments and not removed:
+                return None
+            self.delta += 1
+            message = {"node": self.node, "seq": self.seq, "delta": self.delta,
+                       "ts": round(time.time(), 3), "equipments": equipments}
+            if removed:
+                message["removed"] = removed
+            return message
+
+    def publish_delta(self):
+        """Publish changes since the last message, nothing when unchanged"""
+        message = self.changes()
+        if message is not None:
+            self.mqtt_client.client.publish(
+                self.delta_topic, _encode(message), qos=1)
+
+    def stop(self):
+        """Stop publishing, the last snapshot stays retained"""
+        self._stop.set()
+        self._thread.join(timeout=self.delta_interval + 1)
+        self.publish_snapshot()
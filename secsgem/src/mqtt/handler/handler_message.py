@@ -1,6 +1,10 @@
+import json
 import logging
+import threading
 import paho.mqtt.client as mqtt
 
+from src.metrics.profiler import profiler
+
 logger = logging.getLogger("app_logger")
 
 
@@ -27,6 +31,22 @@ class HandlerMessage:
         # print("Published message: test to topic: test")
         # logger.info("Published message: test to topic: test")
 
+        # dejtnf/control/profile/<command>, payload json list of args
+        if topic.startswith("dejtnf/control/profile/"):
+            self._profile_command(topic.split("/")[3], payload)
+            return
+
+        # dejtnf/control/equipments/reload, apply changes of the equipment list in the API
+        if topic == "dejtnf/control/equipments/reload":
+            self._reload_equipments(userdata)
+            return
+
+        # equipments/control/<equipment_name>/<command>, payload json list of args
+        if len(topic.split("/")) == 4 and topic.split("/")[1] == "control":
+            self._control_command(
+                userdata, topic.split("/")[2], topic.split("/")[3], payload)
+            return
+
         if len(topic.split("/")) >= 5 and topic.split("/")[2] == "alarm":
             equipment_name = topic.split("/")[3]
             alid = topic.split("/")[4]
@@ -57,3 +77,69 @@ class HandlerMessage:
             # # Log ข้อมูลปัจจุบันใน exist_alids
             # logger.info("Current exist_alids: %s", self.exist_alids)
             # print(f"Current exist_alids: {self.exist_alids}")
+
+    def _control_command(self, userdata, equipment_name: str, command: str, payload: str):
+        """
+        Execute SecsControl command on equipment and publish the result to
+        equipments/response/<equipment_name>/<command>
+        """
+        gem_hosts = (userdata or {}).get("gem_hosts", [])
+        gem_host = next(
+            (host for host in gem_hosts if host.equipment_name == equipment_name), None)
+        if not gem_host:
+            return
+
+        args = self.parse_control_args(payload)
+
+        def run():
+            result = gem_host.secs_control.execute(command, args)
+            self.mqtt_client.client.publish(
+                f"equipments/response/{equipment_name}/{command}", json.dumps(result, default=str))
+
+        # SECS transactions must not block the mqtt network loop
+        threading.Thread(target=run, daemon=True).start()
+
+    def _reload_equipments(self, userdata):
+        """
+        Reconcile the equipments of the manager with the API and publish the result to
+        dejtnf/response/equipments/reload
+        """
+        manager = (userdata or {}).get("manager")
+        if manager is None:
+            return
+
+        def run():
+            result = manager.reload_equipments()
+            self.mqtt_client.client.publish(
+                "dejtnf/response/equipments/reload", json.dumps(result, default=str))
+
+        # disabling removed equipments blocks on HSMS separate
+        threading.Thread(target=run, daemon=True).start()
+
+    def _profile_command(self, command: str, payload: str):
+        """
+        Execute RuntimeProfiler command and publish the result to
+        dejtnf/response/profile/<command>
+        """
+        args = self.parse_control_args(payload)
+
+        def run():
+            result = profiler.execute(command, args)
+            self.mqtt_client.client.publish(
+                f"dejtnf/response/profile/{command}", json.dumps(result, default=str))
+
+        # sampling blocks for its duration
+        threading.Thread(target=run, daemon=True).start()
+
+    @staticmethod
+    def parse_control_args(payload: str) -> list:
+        """
+        Parse control command payload, json list of args or a single value
+        """
+        try:
+            args = json.loads(payload) if payload else []
+        except json.JSONDecodeError:
+            args = [payload]
+        if not isinstance(args, list):
+            args = [args]
+        return args
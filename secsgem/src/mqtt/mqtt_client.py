@@ -1,11 +1,14 @@
 import logging
 import os
+import time
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
 from config.app_config import MQTT_ENABLE, MQTT_SUBSCRIBE_TOPIC
 # from mqtt.handler.handler_message import HandlerMessage
 from src.mqtt.handler.handler_message import HandlerMessage
+from src.metrics import collectors
+from config.logger.output_sink import output
 logger = logging.getLogger("app_logger")
 
 
@@ -21,7 +24,12 @@ class MqttClient:
     mqtt_username = os.getenv("MQTT_USERNAME")
     mqtt_password = os.getenv("MQTT_PASSWORD")
 
-    def __init__(self):
+    def __init__(self, subscribe_topics: list[str] = None, connect: bool = MQTT_ENABLE):
+        """
+        :param subscribe_topics: topics subscribed on connect, default MQTT_SUBSCRIBE_TOPIC
+        :param connect: connect to the broker, default MQTT_ENABLE
+        """
+        self.subscribe_topics = MQTT_SUBSCRIBE_TOPIC if subscribe_topics is None else subscribe_topics
         self.client = mqtt.Client()
         self.client.enable_logger(logger)
         self.client.username_pw_set(
@@ -31,8 +39,10 @@ class MqttClient:
         self.handler_message = HandlerMessage(self)
         self.client.on_message = self.handler_message.on_message
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        collectors.mqtt_publish_backlog.set_function(self.publish_backlog)
 
-        if MQTT_ENABLE:
+        if connect:
             self.client.connect(MqttClient.mqtt_broker, 1883, 60)
             self.client.loop_start()
             logger.info("MQTT client started")
@@ -43,16 +53,16 @@ class MqttClient:
         """
         if rc == 0:
             logger.info("Connected to MQTT broker.")
-            print("Connected to MQTT broker.")
+            output("Connected to MQTT broker.")
 
-            for topic in MQTT_SUBSCRIBE_TOPIC:
+            for topic in self.subscribe_topics:
                 self.client.subscribe(topic)
                 logger.info("Subscribed to topic: %s", topic)
-                print(f"Subscribed to topic: {topic}")
+                output("Subscribed to topic: %s", topic)
 
         else:
             logger.error("Connection failed with result code %s", rc)
-            print(f"Connection failed with result code {rc}")
+            output("Connection failed with result code %s", rc)
 
     def on_disconnect(self, client, userdata, rc):
         """
@@ -60,11 +70,34 @@ class MqttClient:
         """
         if rc != 0:
             logger.warning("Unexpected disconnection. Reconnecting...")
-            print("Unexpected disconnection. Reconnecting...")
+            output("Unexpected disconnection. Reconnecting...")
             self.client.reconnect()
         else:
             logger.info("Disconnected from MQTT broker")
-            print("Disconnected from MQTT broker")
+            output("Disconnected from MQTT broker")
+
+    def on_publish(self, client, userdata, mid):
+        """
+        Callback function for when a message was sent (qos 0) or acknowledged by the broker.
+        """
+        collectors.mqtt_published.inc()
+
+    def publish_backlog(self) -> int:
+        """
+        Number of messages not yet written or acknowledged by the broker
+        """
+        # paho has no public accessor, the queues are read without its lock
+        return len(self.client._out_packet) + len(self.client._out_messages)
+
+    def flush(self, timeout: float) -> int:
+        """
+        Wait until queued messages are written or acknowledged by the broker
+        :return: messages still pending after timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        while self.publish_backlog() and self.client.is_connected() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.publish_backlog()
 
     def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False):
         """
@@ -80,14 +113,14 @@ class MqttClient:
                 topic, payload, qos=qos, retain=retain)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 logger.info("Published to %s: %s", topic, payload)
-                print(f"Published to {topic}: {payload}")
+                output("Published to %s: %s", topic, payload)
             else:
                 logger.error(
                     "Failed to publish to %s. Error code: %s", topic, result.rc)
-                print(f"Failed to publish to {topic}. Error code: {result.rc}")
+                output("Failed to publish to %s. Error code: %s", topic, result.rc)
         except Exception as e:
             logger.error("Error publishing to %s: %s", topic, str(e))
-            print(f"Error publishing to {topic}: {str(e)}")
+            output("Error publishing to %s: %s", topic, e)
 
     def subscribe(self, topic: str, qos: int = 0):
         """
@@ -100,11 +133,11 @@ class MqttClient:
             result, mid = self.client.subscribe(topic, qos=qos)
             if result == mqtt.MQTT_ERR_SUCCESS:
                 logger.info("Subscribed to %s with QoS %s", topic, qos)
-                print(f"Subscribed to {topic} with QoS {qos}")
+                output("Subscribed to %s with QoS %s", topic, qos)
             else:
                 logger.error(
                     "Failed to subscribe to %s. Error code: %s", topic, result)
-                print(f"Failed to subscribe to {topic}. Error code: {result}")
+                output("Failed to subscribe to %s. Error code: %s", topic, result)
         except Exception as e:
             logger.error("Error subscribing to %s: %s", topic, str(e))
-            print(f"Error subscribing to {topic}: {str(e)}")
+            output("Error subscribing to %s: %s", topic, e)
@@ -0,0 +1,186 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from config.logger.all_logger import AppLogger
+from src.host.handler.lot_management.config_store import validate_config_store
+from src.host.report_plan import report_plans
+from src.host.state_snapshot import state_snapshots
+from src.manager.host_manager import SecsGemHostManager
+from src.mqtt.mqtt_client import MqttClient
+from src.simulator.equipment import LatencyStats
+from src.simulator.fleet import run_fleet
+
+
+class HostUsage:
+    """
+    CPU and memory of the host process between start and stop
+    """
+
+    def __init__(self):
+        self.process = psutil.Process() if psutil else None
+
+    def start(self):
+        """Start measurement"""
+        self._wall = time.monotonic()
+        self._cpu = time.process_time()
+
+    def stop(self) -> dict:
+        """CPU percent of one core and memory in MB"""
+        wall = time.monotonic() - self._wall
+        cpu = time.process_time() - self._cpu
+        if self.process:
+            rss = self.process.memory_info().rss / 1024 / 1024
+        elif resource:
+            # ru_maxrss is peak usage in KB on Linux
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        else:
+            rss = 0.0
+        return {"cpu_percent": round(cpu / wall * 100, 1) if wall else 0.0, "rss_mb": round(rss, 1),
+                "threads": self.process.num_threads() if self.process else None}
+
+
+def _wait(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.5)
+    return predicate()
+
+
+def run_step(count: int, duration: float, options: dict, settle: float = 5) -> dict:
+    """
+    Connect the host to a fleet of count simulated equipments and measure one run,
+    every step starts with its own MQTT client, manager and empty state directories
+    """
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe()
+    fleet = context.Process(target=run_fleet, args=(
+        child_conn, count, options), daemon=True)
+    fleet.start()
+    equipments = parent_conn.recv()
+
+    # snapshots and report plans of the simulated fleet stay out of data/ and config/
+    work_dir = tempfile.mkdtemp(prefix="benchmark-")
+    state_snapshots.directory = os.path.join(work_dir, "state_snapshots")
+    report_plans.directory = os.path.join(work_dir, "event_report_plans")
+
+    mqtt_client = MqttClient(subscribe_topics=[])
+    manager = SecsGemHostManager(
+        mqtt_client, equipments=equipments, persist=False)
+    try:
+        host_stats = LatencyStats()
+        for gem_host in manager.gem_hosts:
+            gem_host.handler_event.add_listener(
+                lambda event: host_stats.count("host.events"))
+            gem_host.handler_alarm.add_listener(
+                lambda alarm: host_stats.count("host.alarms"))
+
+        def communicating():
+            parent_conn.send("communicating")
+            return parent_conn.recv() == count
+
+        connected = _wait(communicating, 30 + count)
+        # let initial_equipment subscribe reports
+        time.sleep(settle)
+
+        usage = HostUsage()
+        usage.start()
+        parent_conn.send("start")
+        parent_conn.recv()
+        time.sleep(duration)
+        parent_conn.send("stop")
+        equipment_stats = parent_conn.recv()
+        host_usage = usage.stop()
+    finally:
+        # threads of this manager must not run into the next step, disconnects its MQTT client
+        manager.exit()
+        parent_conn.send("exit")
+        parent_conn.recv()
+        fleet.join(timeout=10)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    counters = equipment_stats["counters"]
+    latency = equipment_stats["latency_ms"]
+    return {
+        "equipments": count,
+        "connected": connected,
+        "duration": duration,
+        "host": host_usage,
+        "events_per_second": round(counters.get("event.sent", 0) / duration, 2),
+        "host_events": host_stats.counters.get("host.events", 0),
+        "host_alarms": host_stats.counters.get("host.alarms", 0),
+        "lots_validated_per_second": round((counters.get("lot.accepted", 0) + counters.get("lot.rejected", 0)) / duration, 2),
+        "equipment": equipment_stats,
+        "event_ack_p95_ms": latency.get("event_ack", {}).get("p95"),
+        "lot_validation_p95_ms": latency.get("lot_validation", {}).get("p95"),
+    }
+
+
+def print_report(results: list[dict]):
+    """
+    Print one line per equipment count
+    """
+    print(f"{'eqp':>5} {'cpu%':>7} {'rss MB':>8} {'events/s':>9} {'ack p95':>9} "
+          f"{'lots/s':>7} {'lot p95':>9} {'unanswered':>10} {'timeouts':>8}")
+    for result in results:
+        counters = result["equipment"]["counters"]
+        timeouts = counters.get("event.timeout", 0) + \
+            counters.get("alarm.timeout", 0)
+        print(f"{result['equipments']:>5} {result['host']['cpu_percent']:>7} {result['host']['rss_mb']:>8} "
+              f"{result['events_per_second']:>9} {str(result['event_ack_p95_ms']):>9} "
+              f"{result['lots_validated_per_second']:>7} {str(result['lot_validation_p95_ms']):>9} "
+              f"{counters.get('lot.unanswered', 0):>10} {timeouts:>8}")
+
+
+if __name__ == "__main__":
+    # python -m src.simulator.benchmark --equipments 1,10,50 --duration 60
+    # lot validation uses the API configured in .env, e.g. python -m src.simulator.mock_api
+    parser = argparse.ArgumentParser(
+        description="Host throughput benchmark against simulated equipments")
+    parser.add_argument("--equipments", default="1,5,10",
+                        help="comma separated equipment counts")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--model", default="FCL", choices=["FCL", "FCLX"])
+    parser.add_argument("--base-port", type=int, default=15000)
+    parser.add_argument("--reply-latency", type=float, default=0.0)
+    parser.add_argument("--reply-jitter", type=float, default=0.0)
+    parser.add_argument("--event-rate", type=float, default=1.0)
+    parser.add_argument("--lot-rate", type=float, default=0.2)
+    parser.add_argument("--alarm-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    AppLogger(log_dir="logs/app/benchmark")
+    # opened on first use, kept for all steps
+    validate_config_store.path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "validate_config.db")
+    fleet_options = {"equipment_model": args.model, "base_port": args.base_port,
+                     "reply_latency": args.reply_latency, "reply_jitter": args.reply_jitter,
+                     "event_rate": args.event_rate, "lot_rate": args.lot_rate, "alarm_rate": args.alarm_rate}
+
+    results = []
+    for equipment_count in [int(count) for count in args.equipments.split(",")]:
+        results.append(run_step(equipment_count,
+                       args.duration, fleet_options))
+        print_report(results[-1:])
+
+    print_report(results)
+    os.makedirs("logs/benchmark", exist_ok=True)
+    report_path = f"logs/benchmark/simulator_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"options": vars(args), "results": results}, f, indent=4)
+    print(f"Report saved to {report_path}")
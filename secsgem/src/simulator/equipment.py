@@ -0,0 +1,397 @@
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+import secsgem.common
+import secsgem.gem
+import secsgem.hsms
+import secsgem.secs
+
+from config.status_variable_define import (CONTROL_STATE_VID, PROCESS_STATE_CHANG_EVENT,
+                                           PROCESS_STATE_NAME, SUBSCRIBE_LOT_CONTROL, VID_ALARM_SET, VID_PP_NAME)
+
+logger = logging.getLogger("app_logger")
+
+# report ids of SUBSCRIBE_LOT_CONTROL, same as HandlerEvent
+REPORT_VALIDATE_LOT = 1000
+REPORT_LOT_OPEN = 1001
+REPORT_LOT_CLOSE = 1002
+REPORT_PROGRAM_CHANGE = 1003
+REPORT_STATE_CHANGE = 1004
+
+
+class LatencyStats:
+    """
+    Thread safe counters and latency samples
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self.samples: dict[str, list[float]] = {}
+
+    def count(self, name: str, value: int = 1):
+        """Increase counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add(self, name: str, seconds: float):
+        """Add latency sample"""
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def merge(self, other: 'LatencyStats'):
+        """Add counters and samples of other"""
+        with other._lock:
+            counters = dict(other.counters)
+            samples = {name: list(values)
+                       for name, values in other.samples.items()}
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, values in samples.items():
+                self.samples.setdefault(name, []).extend(values)
+
+    def summary(self) -> dict:
+        """
+        Counters and latency percentiles in milliseconds
+        """
+        with self._lock:
+            result = {"counters": dict(self.counters), "latency_ms": {}}
+            for name, values in self.samples.items():
+                values = sorted(values)
+                result["latency_ms"][name] = {
+                    "count": len(values),
+                    "avg": round(sum(values) / len(values) * 1000, 3),
+                    "p50": round(percentile(values, 50) * 1000, 3),
+                    "p95": round(percentile(values, 95) * 1000, 3),
+                    "p99": round(percentile(values, 99) * 1000, 3),
+                    "max": round(values[-1] * 1000, 3),
+                }
+            return result
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Nearest rank percentile of sorted values
+    """
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1,
+                       int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class SimulatedEquipment(secsgem.gem.GemEquipmentHandler):
+    """
+    FCL/FCLX equipment endpoint for load testing the host.
+    Provides the status variables, collection events and remote commands used by
+    SecsControl and HandlerEvent, generates process/lot/alarm traffic at the
+    configured rates and measures how fast the host answers.
+    """
+
+    def __init__(self, equipment_name: str, equipment_model: str, address: str, port: int, session_id: int, mode: str = "PASSIVE",
+                 reply_latency: float = 0.0, reply_jitter: float = 0.0, event_rate: float = 0.0, lot_rate: float = 0.0, alarm_rate: float = 0.0,
+                 stats: LatencyStats = None):
+        """
+        :param mode: HSMS mode of the equipment, the host uses the opposite mode
+        :param reply_latency: seconds before replying to a host primary message
+        :param reply_jitter: random extra seconds added to reply_latency
+        :param event_rate: process state/program change events per second
+        :param lot_rate: lot validation requests per second
+        :param alarm_rate: alarm set/clear pairs per second
+        """
+        if equipment_model not in SUBSCRIBE_LOT_CONTROL:
+            raise ValueError(f"Unsupported model {equipment_model}")
+
+        settings = secsgem.hsms.HsmsSettings(
+            address=address,
+            port=port,
+            session_id=session_id,
+            connect_mode=secsgem.hsms.HsmsConnectMode.ACTIVE if mode == "ACTIVE" else secsgem.hsms.HsmsConnectMode.PASSIVE,
+            device_type=secsgem.common.DeviceType.EQUIPMENT
+        )
+        super().__init__(settings)
+
+        self.equipment_name = equipment_name
+        self.equipment_model = equipment_model
+        self.reply_latency = reply_latency
+        self.reply_jitter = reply_jitter
+        self.event_rate = event_rate
+        self.lot_rate = lot_rate
+        self.alarm_rate = alarm_rate
+        self.stats = stats or LatencyStats()
+
+        self.recipes: dict[str, bytes] = {"SIM-RECIPE": b"simulated"}
+        self.pending_lots: dict[str, float] = {}
+        self._lot_counter = 0
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        self._define_variables()
+
+        self.register_stream_function(2, 41, self._on_s2f41)
+        self.register_stream_function(6, 19, self._on_s6f19)
+        self.register_stream_function(2, 49, self._on_s2f49)
+        self.register_stream_function(7, 1, self._on_s7f1)
+        self.register_stream_function(7, 3, self._on_s7f3)
+        self.register_stream_function(7, 5, self._on_s7f5)
+        self.register_stream_function(7, 17, self._on_s7f17)
+        self.register_stream_function(7, 19, self._on_s7f19)
+
+    def _define_variables(self):
+        """
+        Status variables and collection events of the model
+        """
+        model = self.equipment_model
+        U1 = secsgem.secs.variables.U1
+        ASCII = secsgem.secs.variables.String
+
+        self.control_state_vid = CONTROL_STATE_VID[model]["VID"]
+        self.process_state_vid = PROCESS_STATE_CHANG_EVENT[model]["VID"]
+        self.pp_vid = VID_PP_NAME[model]
+        self.alarm_set_vid = VID_ALARM_SET[model]
+        self.process_states = list(PROCESS_STATE_NAME[model])
+
+        status_variables = {
+            self.control_state_vid: ("ControlState", U1, 5),
+            self.process_state_vid: ("ProcessState", U1, self.process_states[0]),
+            self.pp_vid: ("PPExecName", ASCII, "SIM-RECIPE"),
+        }
+        for svid, (name, value_type, value) in status_variables.items():
+            status_variable = secsgem.gem.StatusVariable(
+                svid, name, "", value_type, use_callback=False)
+            status_variable.value = value
+            self.status_variables[svid] = status_variable
+        # value built in on_sv_value_request
+        self.status_variables[self.alarm_set_vid] = secsgem.gem.StatusVariable(
+            self.alarm_set_vid, "AlarmsSet", "", secsgem.secs.variables.Array)
+
+        self.report_events: dict[int, int] = {}
+        for subscribe in SUBSCRIBE_LOT_CONTROL[model]:
+            self.report_events[subscribe["REPORT_ID"]] = subscribe["CEID"]
+            for dvid in subscribe["DVS"]:
+                if dvid in self.status_variables or dvid in self.data_values:
+                    continue
+                data_value = secsgem.gem.DataValue(
+                    dvid, f"DV{dvid}", ASCII, use_callback=False)
+                data_value.value = ""
+                self.data_values[dvid] = data_value
+            self.collection_events[subscribe["CEID"]] = secsgem.gem.CollectionEvent(
+                subscribe["CEID"], f"CE{subscribe['CEID']}", subscribe["DVS"])
+
+        self.lot_dvs = {subscribe["REPORT_ID"]: subscribe["DVS"]
+                        for subscribe in SUBSCRIBE_LOT_CONTROL[model]}
+
+        for alid in range(1, 11):
+            self.alarms[alid] = secsgem.gem.Alarm(
+                alid, f"SimAlarm{alid}", f"Simulated alarm {alid}", secsgem.secs.data_items.ALCD.PERSONAL_SAFETY, None, None)
+
+    def on_sv_value_request(self, svid, status_variable):
+        if status_variable.svid == self.alarm_set_vid:
+            return status_variable.value_type(self.settings.data_items.SV, self._get_alarms_set())
+        return super().on_sv_value_request(svid, status_variable)
+
+    # reply latency
+    def _handle_stream_function(self, message: secsgem.common.Message):
+        delay = self.reply_latency + random.uniform(0, self.reply_jitter)
+        if delay > 0:
+            threading.Timer(delay, super()._handle_stream_function,
+                            args=(message,)).start()
+        else:
+            super()._handle_stream_function(message)
+
+    # remote commands
+    def _on_s2f41(self, handler, message: secsgem.common.Message):
+        function = self.settings.streams_functions.decode(message)
+        rcmd = function.RCMD.get()
+        params = {param["CPNAME"]: param["CPVAL"]
+                  for param in function.PARAMS.get()}
+        self.stats.count(f"rcmd.{rcmd}")
+
+        if rcmd in ("LOT_ACCEPT", "LOT_REJECT"):
+            self._lot_answered(params.get("LotID"), rcmd)
+        elif rcmd == "PP-SELECT":
+            self._select_recipe(params.get("PPName"))
+        return self.stream_function(2, 42)({"HCACK": 0, "PARAMS": []})
+
+    def _on_s2f49(self, handler, message: secsgem.common.Message):
+        function = self.settings.streams_functions.decode(message)
+        rcmd = function.RCMD.get()
+        params = {param["CPNAME"]: param["CEPVAL"]
+                  for param in function.PARAMS.get()}
+        self.stats.count(f"rcmd.{rcmd}")
+
+        if rcmd in ("ADD_LOT", "REJECT_LOT"):
+            self._lot_answered(params.get("LotID"), rcmd)
+        return self.stream_function(2, 50)({"HCACK": 0, "PARAMS": []})
+
+    # process programs
+    def _on_s7f1(self, handler, message: secsgem.common.Message):
+        return self.stream_function(7, 2)(0)
+
+    def _on_s7f3(self, handler, message: secsgem.common.Message):
+        function = self.settings.streams_functions.decode(message)
+        self.recipes[function.PPID.get()] = function.PPBODY.get()
+        return self.stream_function(7, 4)(0)
+
+    def _on_s7f5(self, handler, message: secsgem.common.Message):
+        ppid = self.settings.streams_functions.decode(message).get()
+        return self.stream_function(7, 6)({"PPID": ppid, "PPBODY": secsgem.secs.variables.Binary(self.recipes.get(ppid, b""))})
+
+    def _on_s7f17(self, handler, message: secsgem.common.Message):
+        for ppid in self.settings.streams_functions.decode(message).get():
+            self.recipes.pop(ppid, None)
+        return self.stream_function(7, 18)(0)
+
+    def _on_s6f19(self, handler, message: secsgem.common.Message):
+        # values of a defined report, empty list for an unknown RPTID
+        report = self.registered_reports.get(self.settings.streams_functions.decode(message).get())
+        values = []
+        for vid in report.vars if report else []:
+            if vid in self.status_variables:
+                values.append(self._get_sv_value(self.status_variables[vid]))
+            elif vid in self.data_values:
+                values.append(self._get_dv_value(self.data_values[vid]))
+        return self.stream_function(6, 20)(values)
+
+    def _on_s7f19(self, handler, message: secsgem.common.Message):
+        return self.stream_function(7, 20)(list(self.recipes))
+
+    def _select_recipe(self, ppid: Optional[str]):
+        if not ppid:
+            return
+        self.status_variables[self.pp_vid].value = ppid
+        self._set_dvs(REPORT_PROGRAM_CHANGE, [ppid])
+        self._send_event(REPORT_PROGRAM_CHANGE)
+
+    # generated traffic
+    def _set_dvs(self, report_id: int, values: list):
+        for dvid, value in zip(self.lot_dvs[report_id], values):
+            if dvid in self.data_values:
+                self.data_values[dvid].value = value
+
+    def _send_event(self, report_id: int) -> bool:
+        """
+        Send S6F11 if the host linked and enabled the event, measure ack latency
+        """
+        ceid = self.report_events[report_id]
+        link = self.registered_collection_events.get(ceid)
+        if not link or not link.enabled:
+            self.stats.count("event.not_subscribed")
+            return False
+
+        start = time.monotonic()
+        response = self.send_and_waitfor_response(self.stream_function(6, 11)(
+            {"DATAID": 1, "CEID": ceid, "RPT": self._build_collection_event(ceid)}))
+        if response is None:
+            self.stats.count("event.timeout")
+            return False
+        self.stats.add("event_ack", time.monotonic() - start)
+        self.stats.count("event.sent")
+        return True
+
+    def send_process_event(self):
+        """
+        Process state or process program change event
+        """
+        if random.random() < 0.5:
+            state = random.choice(self.process_states)
+            self.status_variables[self.process_state_vid].value = state
+            self._set_dvs(REPORT_STATE_CHANGE, [state])
+            return self._send_event(REPORT_STATE_CHANGE)
+        self._set_dvs(REPORT_PROGRAM_CHANGE, [
+                      self.status_variables[self.pp_vid].value])
+        return self._send_event(REPORT_PROGRAM_CHANGE)
+
+    def request_lot_validation(self) -> Optional[str]:
+        """
+        Send lot validation event, the host answers with accept or reject
+        """
+        with self._lock:
+            self._lot_counter += 1
+            lot_id = f"SIM{self.equipment_name}{self._lot_counter:05d}.1"
+            self.pending_lots[lot_id] = time.monotonic()
+        self._set_dvs(REPORT_VALIDATE_LOT, [
+                      lot_id, self.status_variables[self.pp_vid].value, "", ""])
+        if not self._send_event(REPORT_VALIDATE_LOT):
+            with self._lock:
+                self.pending_lots.pop(lot_id, None)
+            return None
+        self.stats.count("lot.requested")
+        return lot_id
+
+    def _lot_answered(self, lot_id: Optional[str], rcmd: str):
+        with self._lock:
+            start = self.pending_lots.pop(lot_id, None) if lot_id else None
+        if start is None:
+            return
+        self.stats.add("lot_validation", time.monotonic() - start)
+        self.stats.count(
+            "lot.accepted" if rcmd in ("LOT_ACCEPT", "ADD_LOT") else "lot.rejected")
+
+    def send_alarm(self):
+        """
+        Set and clear a random alarm with S5F1
+        """
+        alid = random.choice(list(self.alarms))
+        alarm = self.alarms[alid]
+        for alarm_set in (True, False):
+            alarm.set = alarm_set
+            alcd = alarm.code | secsgem.secs.data_items.ALCD.ALARM_SET if alarm_set else alarm.code
+            start = time.monotonic()
+            response = self.send_and_waitfor_response(self.stream_function(5, 1)(
+                {"ALCD": alcd, "ALID": alid, "ALTX": alarm.text}))
+            if response is None:
+                self.stats.count("alarm.timeout")
+                alarm.set = False
+                return
+            self.stats.add("alarm_ack", time.monotonic() - start)
+        self.stats.count("alarm.sent")
+
+    def _generate(self, rate: float, send):
+        while self._running.is_set():
+            time.sleep(random.expovariate(rate))
+            if not self._running.is_set():
+                break
+            if not self.is_communicating():
+                continue
+            try:
+                send()
+            except Exception as e:
+                self.stats.count("generator.error")
+                logger.error("Simulator %s traffic failed: %s",
+                             self.equipment_name, e)
+
+    def is_communicating(self) -> bool:
+        """Host link established"""
+        return self.communication_state.current.name == "COMMUNICATING"
+
+    def start_traffic(self):
+        """
+        Start event, lot and alarm generators
+        """
+        if self._running.is_set():
+            return
+        self._running.set()
+        self._threads = [threading.Thread(target=self._generate, args=(rate, send), daemon=True)
+                         for rate, send in ((self.event_rate, self.send_process_event),
+                                            (self.lot_rate, self.request_lot_validation),
+                                            (self.alarm_rate, self.send_alarm)) if rate > 0]
+        for thread in self._threads:
+            thread.start()
+
+    def stop_traffic(self):
+        """
+        Stop generators, lots still waiting for the host are counted as unanswered
+        """
+        self._running.clear()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        with self._lock:
+            self.stats.count("lot.unanswered", len(self.pending_lots))
+            self.pending_lots.clear()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import logging
+import threading
+import time
+
+from src.simulator.equipment import LatencyStats, SimulatedEquipment
+
+logger = logging.getLogger("app_logger")
+
+
+class SimulatorFleet:
+    """
+    N simulated equipments on consecutive ports, named SIM-001, SIM-002, ...
+    """
+
+    def __init__(self, count: int, equipment_model: str = "FCL", address: str = "127.0.0.1", base_port: int = 15000,
+                 mode: str = "PASSIVE", **options):
+        """
+        :param options: SimulatedEquipment rates and reply latency
+        """
+        self.equipments = [SimulatedEquipment(
+            equipment_name=f"SIM-{index + 1:03d}",
+            equipment_model=equipment_model,
+            address=address,
+            port=base_port + index,
+            session_id=index + 1,
+            mode=mode,
+            **options) for index in range(count)]
+
+    def host_equipments(self) -> list[dict]:
+        """
+        Equipment list for SecsGemHostManager connecting to this fleet
+        """
+        return [{
+            "equipment_name": equipment.equipment_name,
+            "equipment_model": equipment.equipment_model,
+            "address": equipment.settings.address,
+            "port": equipment.settings.port,
+            "session_id": equipment.settings.session_id,
+            "mode": "ACTIVE" if equipment.settings.connect_mode.name == "PASSIVE" else "PASSIVE",
+            "enable": True
+        } for equipment in self.equipments]
+
+    def enable(self):
+        """Open HSMS endpoints"""
+        for equipment in self.equipments:
+            equipment.enable()
+
+    def disable(self, timeout: float = 5):
+        """Close HSMS endpoints"""
+        # secsgem may never return from disable of a passive endpoint without connection
+        threads = []
+        for equipment in self.equipments:
+            equipment.stop_traffic()
+            thread = threading.Thread(target=equipment.disable, daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(timeout)
+
+    def communicating(self) -> int:
+        """Number of equipments communicating with the host"""
+        return sum(equipment.is_communicating() for equipment in self.equipments)
+
+    def start_traffic(self):
+        """Start generators of all equipments"""
+        for equipment in self.equipments:
+            equipment.start_traffic()
+
+    def stop_traffic(self):
+        """Stop generators of all equipments"""
+        for equipment in self.equipments:
+            equipment.stop_traffic()
+
+    def stats(self) -> dict:
+        """Counters and latency of all equipments"""
+        total = LatencyStats()
+        for equipment in self.equipments:
+            total.merge(equipment.stats)
+        return total.summary()
+
+
+def run_fleet(conn, count: int, options: dict):
+    """
+    Fleet process used by the benchmark, controlled with commands on conn
+    """
+    fleet = SimulatorFleet(count, **options)
+    fleet.enable()
+    conn.send(fleet.host_equipments())
+    while True:
+        command = conn.recv()
+        if command == "communicating":
+            conn.send(fleet.communicating())
+        elif command == "start":
+            fleet.start_traffic()
+            conn.send("started")
+        elif command == "stop":
+            fleet.stop_traffic()
+            conn.send(fleet.stats())
+        elif command == "exit":
+            fleet.disable()
+            conn.send("exit")
+            break
+
+
+if __name__ == "__main__":
+    # python -m src.simulator.fleet --count 10 --lot-rate 0.5
+    parser = argparse.ArgumentParser(
+        description="Run simulated FCL/FCLX equipments")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--model", default="FCL", choices=["FCL", "FCLX"])
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=15000)
+    parser.add_argument("--mode", default="PASSIVE",
+                        choices=["PASSIVE", "ACTIVE"])
+    parser.add_argument("--reply-latency", type=float, default=0.0)
+    parser.add_argument("--reply-jitter", type=float, default=0.0)
+    parser.add_argument("--event-rate", type=float, default=1.0)
+    parser.add_argument("--lot-rate", type=float, default=0.1)
+    parser.add_argument("--alarm-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    simulator = SimulatorFleet(args.count, args.model, args.address, args.base_port, args.mode,
+                               reply_latency=args.reply_latency, reply_jitter=args.reply_jitter,
+                               event_rate=args.event_rate, lot_rate=args.lot_rate, alarm_rate=args.alarm_rate)
+    simulator.enable()
+    print(json.dumps({"equipments": simulator.host_equipments()}, indent=4))
+    simulator.start_traffic()
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(simulator.stats(), indent=4))
+    except KeyboardInterrupt:
+        simulator.disable()
+        print(json.dumps(simulator.stats(), indent=4))
@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+logger = logging.getLogger("app_logger")
+
+
+@dataclass
+class RouteScript:
+    """
+    Scripted behaviour of one route
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+    def delay(self) -> float:
+        """Seconds to wait before answering"""
+        return self.latency + random.uniform(0, self.jitter)
+
+    def fail(self) -> bool:
+        """Answer with HTTP 500"""
+        return random.random() < self.error_rate
+
+
+class MockDataset:
+    """
+    Equipments, validate configs and lots served by MockApiServer.
+    Equipment names and ports match SimulatorFleet so both can run together.
+    """
+
+    def __init__(self, equipments: int = 10, packages: int = 50, lots: int = 1000, hold_rate: float = 0.0,
+                 equipment_model: str = "FCL", base_port: int = 15000, synthesize_lots: bool = True, seed: int = 0):
+        """
+        :param hold_rate: fraction of lots with LOT_STATUS HOLD
+        :param synthesize_lots: answer unknown lot ids with a generated lot instead of Status False
+        """
+        rng = random.Random(seed)
+        self.hold_rate = hold_rate
+        self.synthesize_lots = synthesize_lots
+        # 15 digit package codes, selection code 1100 uses digits 0-7 and 11
+        self.packages = [f"PKG{index:05d}SDG{'ABCDEFGH'[index % 8]}SDM" for index in range(packages)]
+
+        self.equipments = [{
+            "equipment_name": f"SIM-{index + 1:03d}",
+            "equipment_model": equipment_model,
+            "address": "127.0.0.1",
+            "port": base_port + index,
+            "session_id": index + 1,
+            "mode": "ACTIVE",
+            "enable": True
+        } for index in range(equipments)]
+
+        self.configs = {equipment["equipment_name"]: {
+            "equipment_name": equipment["equipment_name"],
+            "config": [self._package_config(package) for package in self.packages]
+        } for equipment in self.equipments}
+
+        self.lots = {}
+        for index in range(lots):
+            lot_id = f"LOT{index:06d}.1"
+            self.lots[lot_id] = self._lot(
+                lot_id, rng.choice(self.packages), rng.random() < hold_rate)
+
+    @staticmethod
+    def _package_config(package: str) -> dict:
+        return {
+            "package8digit": package[:8],
+            "selection_code": "1100",
+            "data_with_selection_code": [{
+                "package_selection_code": package[:8] + package[11],
+                "operation_code": "TNF",
+                "on_operation": "TNF",
+                "validate_type": "recipe",
+                "recipe_name": f"RCP_{package[:8]}",
+                "product_name": f"PRD_{package[:8]}",
+                "options": {"use_operation_code": True, "use_on_operation": True, "use_lot_hold": True},
+                "allow_tool_id": {"position_1": [], "position_2": [], "position_3": [], "position_4": []}
+            }]
+        }
+
+    @staticmethod
+    def _lot(lot_id: str, package: str, hold: bool) -> dict:
+        fields = [("LOT PARAMETERS", lot_id, "Lot ID"),
+                  ("SASSYPACKAGE", package, "Package"),
+                  ("LOT_STATUS", "HOLD" if hold else "RUN", "LOT_STATUS"),
+                  ("ON_OPERATION", "TNF", "On Operation"),
+                  ("OPERATION_CODE", "TNF", "Operation Code"),
+                  ("QTY", "1000", "Lot Qty")]
+        return {"Status": True, "Message": "Success",
+                "OutputLotInfo": [{"FieldName": name, "Value": value, "Description": description}
+                                  for name, value, description in fields]}
+
+    def lot_info(self, lot_id: str) -> dict:
+        """Lot information in the format of the OEE web API"""
+        lot = self.lots.get(lot_id)
+        if lot is None and self.synthesize_lots:
+            digest = zlib.crc32(lot_id.encode("utf-8"))
+            lot = self._lot(lot_id, self.packages[digest % len(self.packages)],
+                            digest % 1000 < self.hold_rate * 1000)
+        return lot or {"Status": False, "Message": f"Lot {lot_id} not found"}
+
+    def recipe_of(self, lot_id: str) -> Optional[str]:
+        """Expected recipe of a lot"""
+        lot = self.lot_info(lot_id)
+        if not lot.get("Status"):
+            return None
+        package = next(field["Value"] for field in lot["OutputLotInfo"]
+                       if field["FieldName"] == "SASSYPACKAGE")
+        return f"RCP_{package[:8]}"
+
+
+class MockApiServer:
+    """
+    Local stand-in of the Node backend (/api/lotinfo, /api/validate/configs, /api/secsgem/equipments)
+    and the OEE web API (/OEEwebAPI/DataForOEE/LotInfo/GetLotInfo) with scripted latency and errors
+    """
+
+    ROUTES = ("lotinfo", "configs", "equipments", "oee")
+    # routes with ETag validators, see backend/app/middleware/db/setListValidators.js
+    VALIDATED_ROUTES = ("configs", "equipments")
+
+    def __init__(self, dataset: MockDataset = None, routes: dict[str, RouteScript] = None,
+                 address: str = "127.0.0.1", port: int = 3000, endpoint: str = "api"):
+        self.dataset = dataset or MockDataset()
+        self.routes = {name: RouteScript() for name in self.ROUTES}
+        self.routes.update(routes or {})
+        self.endpoint = endpoint
+        self.requests: dict[str, int] = {name: 0 for name in self.ROUTES}
+        # requests answered 304 Not Modified by route
+        self.not_modified: dict[str, int] = {name: 0 for name in self.ROUTES}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((address, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Listening port"""
+        return self._httpd.server_address[1]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler of MockApiServer"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """GET routes"""
+                url = urlparse(self.path)
+                # the host requests /api//validate/configs
+                path = re.sub("/+", "/", unquote(url.path))
+                route, body = server.route(path, parse_qs(url.query))
+                if route is None:
+                    return self._send(404, {"errors": {"msg": "NOT_FOUND"}})
+
+                script = server.routes[route]
+                with server._lock:
+                    server.requests[route] += 1
+                time.sleep(script.delay())
+                if script.fail():
+                    return self._send(500, {"errors": {"msg": "SCRIPTED_ERROR"}})
+                if route in server.VALIDATED_ROUTES:
+                    # list controllers of the backend send a weak ETag and answer 304 when it matches
+                    etag = 'W/"%s"' % hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        with server._lock:
+                            server.not_modified[route] += 1
+                        return self._send(304, None, etag)
+                    return self._send(200, body, etag)
+                return self._send(200, body)
+
+            def _send(self, status: int, body, etag: str = None):
+                data = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", "no-cache")
+                if body is not None:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+    def route(self, path: str, query: dict) -> tuple[Optional[str], object]:
+        """
+        Route name and response body of a request path
+        """
+        prefix = f"/{self.endpoint}"
+        if path.startswith(f"{prefix}/lotinfo/"):
+            return "lotinfo", self.dataset.lot_info(path[len(f"{prefix}/lotinfo/"):])
+        if path == f"{prefix}/validate/configs":
+            if "filter" in query:
+                name = query["filter"][0]
+                docs = [self.dataset.configs[name]
+                        ] if name in self.dataset.configs else []
+                return "configs", {"docs": docs, "totalDocs": len(docs), "limit": 10, "page": 1, "totalPages": 1}
+            # every config, paged like mongoose-paginate
+            page = int(query.get("page", ["1"])[0])
+            limit = int(query.get("limit", ["5"])[0])
+            configs = [self.dataset.configs[name] for name in sorted(self.dataset.configs)]
+            docs = configs[(page - 1) * limit:page * limit]
+            return "configs", {"docs": docs, "totalDocs": len(configs), "limit": limit, "page": page,
+                               "hasNextPage": page * limit < len(configs)}
+        if path == f"{prefix}/secsgem/equipments":
+            docs = self.dataset.equipments
+            return "equipments", {"docs": docs, "totalDocs": len(docs), "limit": len(docs), "page": 1, "totalPages": 1}
+        if path.endswith("/DataForOEE/LotInfo/GetLotInfo"):
+            items = json.loads(query.get("busItem", ["[]"])[0])
+            return "oee", [self.dataset.lot_info(item.get("LotID", "")) for item in items]
+        return None, None
+
+    def start(self) -> 'MockApiServer':
+        """Serve in a background thread"""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="mock-api", daemon=True)
+        self._thread.start()
+        logger.info("Mock API listening on port %s", self.port)
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def load_script(path: str) -> tuple[MockDataset, dict[str, RouteScript]]:
+    """
+    Dataset and route scripts from a json file
+    {"dataset": {"equipments": 10, "lots": 1000, ...}, "routes": {"lotinfo": {"latency": 0.05, "error_rate": 0.01}}}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        script = json.load(f)
+    routes = {name: RouteScript(**values)
+              for name, values in script.get("routes", {}).items()}
+    return MockDataset(**script.get("dataset", {})), routes
+
+
+if __name__ == "__main__":
+    # python -m src.simulator.mock_api --port 3000 --latency 0.05 --error-rate 0.01
+    # then API_SERVER=127.0.0.1 API_PORT=3000 API_ENDPOINT=api
+    parser = argparse.ArgumentParser(
+        description="Mock lot information and equipment config API")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--script", help="json file with dataset and routes")
+    parser.add_argument("--equipments", type=int, default=10)
+    parser.add_argument("--lots", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.script:
+        mock_dataset, mock_routes = load_script(args.script)
+    else:
+        mock_dataset = MockDataset(equipments=args.equipments, lots=args.lots)
+        mock_routes = {name: RouteScript(args.latency, args.jitter, args.error_rate)
+                       for name in MockApiServer.ROUTES}
+    mock = MockApiServer(mock_dataset, mock_routes, args.address, args.port)
+    print(f"Mock API listening on {args.address}:{mock.port}")
+    mock.start()
+    try:
+        while True:
+            time.sleep(10)
+    except KeyboardInterrupt:
+        mock.stop()
+        print(json.dumps(mock.requests))
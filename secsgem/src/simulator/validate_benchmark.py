@@ -0,0 +1,152 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.host.handler.lot_management import equipment_config
+from src.host.handler.lot_management.config_store import validate_config_store
+from src.host.handler.lot_management.equipment_config import equipment_config_cache, validate_config_responses
+from src.host.handler.lot_management.lot_infomation import lot_info_cache
+from src.host.handler.lot_management.validate import Result, ValidateLot
+from src.simulator.equipment import LatencyStats
+from src.simulator.mock_api import MockApiServer, MockDataset, RouteScript
+
+
+# where ValidateLot reads the equipment validate config from
+MODES = ("api", "cache", "store")
+
+
+def set_mode(mode: str, ttl: float):
+    """
+    Select the equipment config source, caches and store start empty
+    :param mode: api = every request, cache = lot information and equipment config cached for ttl,
+        store = local validate config store filled by the first request of an equipment
+    """
+    for cache in (lot_info_cache, equipment_config_cache):
+        cache.ttl = ttl if mode == "cache" else 0
+        cache.invalidate()
+        cache.reset_stats()
+    validate_config_responses.invalidate()
+    validate_config_responses.reset_stats()
+    # read by EquipmentConfig on every lookup
+    equipment_config.VALIDATE_CONFIG_STORE_ENABLE = mode == "store"
+    validate_config_store.remove(list(validate_config_store.equipments()))
+
+
+def run_load(dataset: MockDataset, operation: str, qps: float, duration: float, workers: int) -> dict:
+    """
+    Open loop load at qps requests per second, latency counts from the scheduled start
+    so queueing behind slow requests shows in the tail
+    """
+    stats = LatencyStats()
+    lot_ids = list(dataset.lots)
+    equipment_names = [equipment["equipment_name"]
+                       for equipment in dataset.equipments]
+    operations = ["validate", "recipe"] if operation == "both" else [operation]
+
+    def call(scheduled: float, name: str, lot_id: str, kind: str):
+        try:
+            validate_lot = ValidateLot(
+                name, dataset.recipe_of(lot_id) or "", lot_id)
+            if kind == "validate":
+                result = validate_lot.validate()
+                stats.count(f"{kind}.accepted" if isinstance(
+                    result, Result) else f"{kind}.rejected")
+            else:
+                result = validate_lot.get_recipe_by_lotid()
+                stats.count(f"{kind}.found" if isinstance(
+                    result, dict) else f"{kind}.not_found")
+        except Exception:
+            stats.count(f"{kind}.error")
+        stats.add(kind, time.monotonic() - scheduled)
+
+    total = int(qps * duration)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index in range(total):
+            scheduled = start + index / qps
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(call, scheduled, random.choice(equipment_names),
+                            random.choice(lot_ids), operations[index % len(operations)])
+    elapsed = time.monotonic() - start
+
+    summary = stats.summary()
+    summary["target_qps"] = qps
+    summary["achieved_qps"] = round(total / elapsed, 2)
+    summary["cache"] = {"lot_info": lot_info_cache.stats(),
+                        "equipment_config": equipment_config_cache.stats(),
+                        "equipment_config_revalidation": validate_config_responses.stats()}
+    return summary
+
+
+def print_report(results: list[dict]):
+    """
+    Print one line per run and operation
+    """
+    print(f"{'eqp':>5} {'lots':>7} {'mode':>6} {'op':>9} {'qps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7} {'hit lot':>8} {'hit cfg':>8}")
+    for result in results:
+        for kind, latency in result["latency_ms"].items():
+            print(f"{result['equipments']:>5} {result['lots']:>7} {result['mode']:>6} {kind:>9} "
+                  f"{result['achieved_qps']:>8} {latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9} "
+                  f"{result['counters'].get(f'{kind}.error', 0):>7} "
+                  f"{result['cache']['lot_info']['hit_ratio']:>8} {result['cache']['equipment_config']['hit_ratio']:>8}")
+
+
+if __name__ == "__main__":
+    # python -m src.simulator.validate_benchmark --qps 50 --lots 100,10000 --equipments 5,50
+    parser = argparse.ArgumentParser(
+        description="ValidateLot throughput against the mock API, with and without caching or the local config store")
+    parser.add_argument("--qps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--operation", default="both",
+                        choices=["validate", "recipe", "both"])
+    parser.add_argument("--equipments", default="5,50",
+                        help="comma separated equipment counts")
+    parser.add_argument("--lots", default="100,10000",
+                        help="comma separated lot counts")
+    parser.add_argument("--cache-ttl", type=float, default=60,
+                        help="ttl of the cache mode runs")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="mock API latency seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    mock = MockApiServer(routes={name: RouteScript(args.latency, args.jitter, args.error_rate)
+                                 for name in MockApiServer.ROUTES}, port=args.port).start()
+    # read by LotInformation and EquipmentConfig, load_dotenv does not override them
+    os.environ.update({"API_SERVER": "127.0.0.1", "API_PORT": str(
+        mock.port), "API_ENDPOINT": mock.endpoint})
+    # keep the benchmark configs out of the validate config store of the host
+    validate_config_store.path = os.path.join(tempfile.mkdtemp(), "validate_config.db")
+
+    results = []
+    for equipment_count in [int(count) for count in args.equipments.split(",")]:
+        for lot_count in [int(count) for count in args.lots.split(",")]:
+            mock.dataset = MockDataset(
+                equipments=equipment_count, lots=lot_count)
+            for mode in MODES:
+                set_mode(mode, args.cache_ttl)
+                result = run_load(mock.dataset, args.operation,
+                                  args.qps, args.duration, args.workers)
+                result.update({"equipments": equipment_count, "lots": lot_count, "mode": mode,
+                               "cache_ttl": args.cache_ttl if mode == "cache" else 0})
+                results.append(result)
+                print_report(results[-1:])
+
+    print_report(results)
+    mock.stop()
+    os.makedirs("logs/benchmark", exist_ok=True)
+    report_path = f"logs/benchmark/validate_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"options": vars(args), "results": results}, f, indent=4)
+    print(f"Report saved to {report_path}")
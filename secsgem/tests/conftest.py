@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+# read by src.mqtt.mqtt_client at import, no broker is contacted by the tests
+os.environ.setdefault("MQTT_BROKER", "127.0.0.1")
+os.environ.setdefault("MQTT_PORT", "1883")
+
+
+@pytest.fixture(autouse=True)
+def runtime_dirs(tmp_path, monkeypatch):
+    """Snapshots and report plans of the hosts created by a test go to its temporary directory"""
+    from src.host.report_plan import report_plans
+    from src.host.state_snapshot import state_snapshots
+
+    monkeypatch.setattr(state_snapshots, "directory", str(tmp_path / "state_snapshots"))
+    monkeypatch.setattr(report_plans, "directory", str(tmp_path / "event_report_plans"))
@@ -0,0 +1,100 @@
+import pytest
+import requests
+
+from src.host.handler.lot_management import cache
+from src.host.handler.lot_management.cache import ConditionalCache, TtlCache
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error")
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Answers from server["responses"], the request headers are kept in server["requests"]"""
+    state = {"responses": [], "requests": []}
+
+    def get(url, timeout, headers):
+        state["requests"].append(dict(headers))
+        return state["responses"].pop(0)
+
+    monkeypatch.setattr(cache.requests, "get", get)
+    return state
+
+
+def test_not_modified_reuses_parsed_body(server):
+    responses = ConditionalCache("test")
+    server["responses"] = [
+        FakeResponse(200, {"docs": [1]}, {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+        FakeResponse(304)]
+
+    assert responses.get("http://api/configs") == ({"docs": [1]}, True)
+    assert responses.get("http://api/configs") == ({"docs": [1]}, False)
+
+    assert "If-None-Match" not in server["requests"][0]
+    assert server["requests"][1]["If-None-Match"] == '"v1"'
+    assert server["requests"][1]["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert responses.stats()["not_modified"] == 1
+    assert responses.stats()["modified"] == 1
+
+
+def test_changed_response_replaces_cached_body(server):
+    responses = ConditionalCache("test")
+    server["responses"] = [FakeResponse(200, {"v": 1}, {"ETag": '"v1"'}),
+                           FakeResponse(200, {"v": 2}, {"ETag": '"v2"'}),
+                           FakeResponse(304)]
+
+    responses.get("http://api/configs")
+    assert responses.get("http://api/configs") == ({"v": 2}, True)
+    assert responses.get("http://api/configs") == ({"v": 2}, False)
+    assert server["requests"][2]["If-None-Match"] == '"v2"'
+
+
+def test_invalidate_and_unconditional_requests(server):
+    responses = ConditionalCache("test")
+    server["responses"] = [FakeResponse(200, {"v": 1}, {"ETag": '"v1"'}),
+                           FakeResponse(200, {"v": 1}, {"ETag": '"v1"'}),
+                           FakeResponse(200, {"v": 1}, {"ETag": '"v1"'})]
+
+    responses.get("http://api/configs")
+    responses.get("http://api/configs", conditional=False)
+    responses.invalidate()
+    responses.get("http://api/configs")
+
+    assert all("If-None-Match" not in headers for headers in server["requests"])
+
+
+def test_error_status_raises_and_keeps_cache(server):
+    responses = ConditionalCache("test")
+    server["responses"] = [FakeResponse(200, {"v": 1}, {"ETag": '"v1"'}), FakeResponse(500)]
+
+    responses.get("http://api/configs")
+    with pytest.raises(requests.exceptions.HTTPError):
+        responses.get("http://api/configs")
+    assert responses.stats()["size"] == 1
+
+
+def test_ttl_cache_expires_and_counts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    values = TtlCache(ttl=10, max_size=2)
+
+    values.put("a", 1)
+    assert values.get("a") == 1
+    now[0] += 11
+    assert values.get("a") is None
+    values.put("a", 1)
+    values.put("b", 2)
+    values.put("c", 3)
+    assert values.get("a") is None
+    assert values.stats() == {"size": 2, "hits": 1, "misses": 2, "hit_ratio": 0.333}
@@ -0,0 +1,125 @@
+import socket
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from src.host.gemhost import SecsGemHost
+from src.manager.cluster import ClusterNode, FileLeaseStore, rendezvous_owner
+from src.simulator.fleet import SimulatorFleet
+
+
+class FakeMqttClient:
+    """MqttClient without a broker, publishes are dropped"""
+
+    def __init__(self):
+        self.client = mqtt.Client()
+
+    def flush(self, timeout: float) -> int:
+        return 0
+
+
+def free_ports(count: int) -> int:
+    """First of count consecutive free ports"""
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            base = sock.getsockname()[1]
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as sock:
+                    sock.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+def wait_until(condition, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.05)
+
+
+def running(node: ClusterNode) -> set[str]:
+    return {gem_host.equipment_name for gem_host in node.gem_hosts}
+
+
+def communicating(node: ClusterNode, equipment_name: str) -> bool:
+    return any(gem_host.equipment_name == equipment_name and gem_host.is_communicating
+               for gem_host in node.gem_hosts)
+
+
+def test_rendezvous_owner_moves_only_equipments_of_joining_node():
+    names = [f"EQ-{index}" for index in range(200)]
+    before = {name: rendezvous_owner(name, ["A", "B"]) for name in names}
+    after = {name: rendezvous_owner(name, ["A", "B", "C"]) for name in names}
+
+    assert rendezvous_owner("EQ-0", []) is None
+    assert set(before.values()) == {"A", "B"}
+    assert all(after[name] in (before[name], "C") for name in names)
+    assert 0 < sum(owner == "C" for owner in after.values()) < len(names)
+
+
+def test_file_lease_store_claims(tmp_path):
+    store = FileLeaseStore(str(tmp_path / "cluster.json"))
+    store.heartbeat("A", 0.3)
+    store.heartbeat("B", 10)
+
+    assert store.claim("EQ1", "A", 0.3) is True
+    assert store.claim("EQ1", "B", 10) is False
+    assert store.owner("EQ1") == "A"
+    time.sleep(0.4)
+    # node A died, its heartbeat and lease expired
+    assert store.nodes() == ["B"]
+    assert store.owner("EQ1") is None
+    assert store.claim("EQ1", "B", 10) is True
+    store.release("EQ1", "A")
+    assert store.owner("EQ1") == "B"
+    store.release("EQ1", "B")
+    assert store.owner("EQ1") is None
+
+
+@pytest.fixture
+def no_archive(monkeypatch):
+    monkeypatch.setattr(SecsGemHost, "archive_frames", False)
+
+
+def test_equipments_move_between_nodes(tmp_path, no_archive):
+    fleet = SimulatorFleet(4, base_port=free_ports(4))
+    fleet.enable()
+    equipments = fleet.host_equipments()
+    names = {equipment["equipment_name"] for equipment in equipments}
+    owners = {name: rendezvous_owner(name, ["node-a", "node-b"]) for name in names}
+    on_b = {name for name, owner in owners.items() if owner == "node-b"}
+    assert on_b and on_b != names
+
+    store = FileLeaseStore(str(tmp_path / "cluster.json"))
+    node_a = node_b = None
+    try:
+        node_a = ClusterNode(FakeMqttClient(), store, "node-a", [dict(eq) for eq in equipments],
+                             lease_ttl=2, interval=0.2)
+        wait_until(lambda: running(node_a) == names)
+        wait_until(lambda: all(communicating(node_a, name) for name in names))
+
+        # node B joins, only the equipments assigned to it move
+        node_b = ClusterNode(FakeMqttClient(), store, "node-b", [dict(eq) for eq in equipments],
+                             lease_ttl=2, interval=0.2)
+        wait_until(lambda: running(node_b) == on_b and running(node_a) == names - on_b)
+        wait_until(lambda: all(communicating(node_b, name) for name in on_b))
+        assert {name: store.owner(name) for name in names} == owners
+
+        # leaving node releases its leases, the other node takes its equipments
+        node_a.exit()
+        node_a = None
+        assert store.nodes() == ["node-b"]
+        wait_until(lambda: running(node_b) == names)
+        wait_until(lambda: all(communicating(node_b, name) for name in names))
+        assert {store.owner(name) for name in names} == {"node-b"}
+    finally:
+        # passive endpoints are closed while connected, secsgem does not return
+        # from disable while waiting for a connection
+        fleet.disable()
+        for node in (node_a, node_b):
+            if node is not None:
+                node.exit()
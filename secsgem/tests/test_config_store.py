@@ -0,0 +1,66 @@
+import threading
+
+from src.host.handler.lot_management.config_store import ValidateConfigStore
+
+CONFIG = [
+    {"package8digit": "12345678", "options": {"lot_type": "A"}},
+    {"package8digit": "12345678", "options": {"lot_type": "B"}},
+    {"package8digit": "87654321", "options": {"lot_type": "C"}},
+]
+
+
+def test_package_configs_in_api_order(tmp_path):
+    store = ValidateConfigStore(str(tmp_path / "db" / "validate_config.db"))
+    assert store.replace("EQ1", CONFIG) is True
+
+    assert store.package_configs("EQ1", "12345678") == CONFIG[:2]
+    assert store.package_configs("EQ1", "87654321") == CONFIG[2:]
+    # known equipment without a config for the package
+    assert store.package_configs("EQ1", "00000000") == []
+    assert store.package_configs("EQ2", "12345678") is None
+
+
+def test_replace_reports_changes(tmp_path):
+    store = ValidateConfigStore(str(tmp_path / "validate_config.db"))
+    store.replace("EQ1", CONFIG)
+    synced_at = store.equipments()["EQ1"]
+
+    assert store.replace("EQ1", list(CONFIG)) is False
+    assert store.equipments()["EQ1"] >= synced_at
+    assert store.replace("EQ1", CONFIG[2:]) is True
+    assert store.package_configs("EQ1", "12345678") == []
+
+
+def test_remove_and_reopen(tmp_path):
+    path = str(tmp_path / "validate_config.db")
+    store = ValidateConfigStore(path)
+    store.replace("EQ1", CONFIG)
+    store.replace("EQ2", CONFIG[:1])
+    store.remove(["EQ1"])
+
+    reopened = ValidateConfigStore(path)
+    assert list(reopened.equipments()) == ["EQ2"]
+    assert reopened.package_configs("EQ1", "12345678") is None
+    assert reopened.package_configs("EQ2", "12345678") == CONFIG[:1]
+
+
+def test_shared_connection_across_threads(tmp_path):
+    store = ValidateConfigStore(str(tmp_path / "validate_config.db"))
+    errors = []
+
+    def replace(index):
+        try:
+            for round_ in range(20):
+                store.replace(f"EQ{index}", [{"package8digit": str(round_)}])
+                store.package_configs(f"EQ{index}", str(round_))
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    threads = [threading.Thread(target=replace, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(store.equipments()) == ["EQ0", "EQ1", "EQ2", "EQ3"]
@@ -0,0 +1,68 @@
+from src.host.equipment_state import EquipmentState
+
+
+def test_changes_since_returns_latest_value_of_each_field():
+    state = EquipmentState("EQ1")
+    state.set("control_state", "Off-Line")
+    version = state.version
+    state.set("control_state", "On-Line/Remote")
+    state.set("process_program", "PP1")
+    state.set_alarm(7, "door open")
+
+    result = state.changes_since(version, state.epoch)
+
+    assert result["full"] is False
+    assert result["version"] == version + 3
+    assert result["changes"] == {"control_state": "On-Line/Remote",
+                                 "process_program": "PP1", "alarms": {7: "door open"}}
+
+
+def test_unchanged_value_is_not_journaled():
+    state = EquipmentState("EQ1")
+    assert state.set("process_state", "IDLE") is True
+    assert state.set("process_state", "IDLE") is False
+    assert state.changes_since(state.version)["changes"] == {}
+
+
+def test_changes_since_other_epoch_is_full_snapshot():
+    before = EquipmentState("EQ1")
+    before.set("control_state", "On-Line/Remote")
+    # same equipment after a restart, versions count from 0 again
+    after = EquipmentState("EQ1")
+    after.set("process_state", "RUN")
+
+    result = after.changes_since(before.version, before.epoch)
+
+    assert result["full"] is True
+    assert result["epoch"] == after.epoch
+    assert result["changes"]["process_state"] == "RUN"
+    assert result["changes"]["control_state"] is None
+
+
+def test_changes_since_version_ahead_is_full_snapshot():
+    state = EquipmentState("EQ1")
+    state.set("control_state", "On-Line/Remote")
+    assert state.changes_since(state.version + 5)["full"] is True
+    assert state.changes_since(-1)["full"] is True
+
+
+def test_changes_since_beyond_journal_is_full_snapshot():
+    state = EquipmentState("EQ1", journal_size=2)
+    for program in ("PP1", "PP2", "PP3", "PP4"):
+        state.set("process_program", program)
+
+    assert state.changes_since(1)["full"] is True
+    incremental = state.changes_since(2)
+    assert incremental["full"] is False
+    assert incremental["changes"] == {"process_program": "PP4"}
+
+
+def test_restored_fields_are_stale_until_confirmed():
+    state = EquipmentState("EQ1")
+    state.restore({"control_state": "On-Line/Remote", "alarms": {3: "low vacuum"}},
+                  {"control_state": 100.0})
+
+    assert state.stale == {"control_state", "alarms"}
+    state.confirm("alarms")
+    state.set("control_state", "On-Line/Remote")
+    assert state.stale == set()
@@ -0,0 +1,108 @@
+import datetime
+import os
+import time
+
+import secsgem.hsms
+
+from src.archive.frame_archive import (FILE_SUFFIX, INDEX_SUFFIX, FrameArchiveReader,
+                                       FrameArchiveWriter, prune)
+
+
+def message(stream, function, system=1):
+    header = secsgem.hsms.HsmsHeader(system, 1, stream, function, s_type=secsgem.hsms.HsmsSType.DATA_MESSAGE)
+    return secsgem.hsms.HsmsMessage(header, b"")
+
+
+def write(directory, equipment_name, frames, index_every=1):
+    """frames: (timestamp, direction, stream, function)"""
+    writer = FrameArchiveWriter(equipment_name, str(directory), index_every, max_days=0, max_bytes=0)
+    for system, (timestamp, direction, stream, function) in enumerate(frames, 1):
+        writer.write(direction, message(stream, function, system), timestamp)
+    writer.close()
+    return writer
+
+
+def test_reader_filters_by_time_sf_and_direction(tmp_path):
+    now = time.time()
+    write(tmp_path, "EQ1", [(now, "out", 1, 3), (now + 1, "in", 1, 4),
+                            (now + 2, "in", 6, 11), (now + 3, "out", 6, 12)])
+    reader = FrameArchiveReader(str(tmp_path))
+
+    assert [frame.name for frame in reader.read()] == ["S1F3", "S1F4", "S6F11", "S6F12"]
+    assert [frame.name for frame in reader.read(start=now + 1.5)] == ["S6F11", "S6F12"]
+    assert [frame.name for frame in reader.read(end=now + 1.5)] == ["S1F3", "S1F4"]
+    assert [frame.name for frame in reader.read(sf=["s6f11"])] == ["S6F11"]
+    assert [frame.name for frame in reader.read(direction="out")] == ["S1F3", "S6F12"]
+    assert next(reader.read()).message.header.stream == 1
+
+
+def test_reader_seeks_with_index(tmp_path):
+    now = time.time()
+    write(tmp_path, "EQ1", [(now + second, "in", 6, 11) for second in range(10)], index_every=2)
+    path = FrameArchiveReader(str(tmp_path)).files("EQ1")[0]
+
+    assert FrameArchiveReader._seek_offset(path, None) == 4
+    # the index points at records 0, 2, 4, ..., reading starts at the last one before start
+    assert FrameArchiveReader._seek_offset(path, now + 5.5) > FrameArchiveReader._seek_offset(path, now + 2.5)
+    frames = list(FrameArchiveReader(str(tmp_path)).read(start=now + 5.5))
+    assert [round(frame.timestamp - now) for frame in frames] == [6, 7, 8, 9]
+
+
+def test_reader_merges_equipments_in_time_order(tmp_path):
+    now = time.time()
+    write(tmp_path, "EQ1", [(now, "in", 6, 11), (now + 2, "in", 6, 11)])
+    write(tmp_path, "EQ2", [(now + 1, "in", 5, 1), (now + 3, "in", 5, 1)])
+
+    frames = list(FrameArchiveReader(str(tmp_path)).read())
+
+    assert [frame.equipment_name for frame in frames] == ["EQ1", "EQ2", "EQ1", "EQ2"]
+    assert [frame.timestamp for frame in frames] == sorted(frame.timestamp for frame in frames)
+
+
+def test_partial_record_is_truncated_on_reopen(tmp_path):
+    now = time.time()
+    writer = write(tmp_path, "EQ1", [(now, "in", 6, 11), (now + 1, "in", 6, 11)])
+    path = os.path.join(writer.directory, datetime.date.fromtimestamp(now).isoformat() + FILE_SUFFIX)
+    size = os.path.getsize(path)
+    # crash in the middle of a record
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 9)
+
+    write(tmp_path, "EQ1", [(now + 2, "out", 6, 12)])
+
+    frames = list(FrameArchiveReader(str(tmp_path)).read())
+    assert [frame.name for frame in frames] == ["S6F11", "S6F11", "S6F12"]
+    assert os.path.getsize(path) > size
+
+
+def test_index_entries_past_truncation_are_removed(tmp_path):
+    now = time.time()
+    writer = write(tmp_path, "EQ1", [(now + second, "in", 6, 11) for second in range(4)])
+    date = datetime.date.fromtimestamp(now).isoformat()
+    path = os.path.join(writer.directory, date + FILE_SUFFIX)
+    index_path = os.path.join(writer.directory, date + INDEX_SUFFIX)
+    # the last record was lost, its index entry was written
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    writer._recover(path)
+
+    assert os.path.getsize(index_path) == 3 * 16
+    assert len(list(FrameArchiveReader(str(tmp_path)).read())) == 3
+
+
+def test_prune_keeps_max_days_and_max_bytes(tmp_path):
+    today = datetime.date(2024, 3, 31)
+    for days_ago in range(5):
+        day = (today - datetime.timedelta(days=days_ago)).isoformat()
+        (tmp_path / (day + FILE_SUFFIX)).write_bytes(b"x" * 100)
+        (tmp_path / (day + INDEX_SUFFIX)).write_bytes(b"x" * 16)
+    (tmp_path / "notes.txt").write_bytes(b"x" * 1000)
+
+    assert prune(str(tmp_path), today.isoformat(), 3, 0) == ["2024-03-27", "2024-03-28"]
+    assert prune(str(tmp_path), today.isoformat(), 0, 2 * 116) == ["2024-03-29"]
+    assert sorted(os.listdir(tmp_path)) == ["2024-03-30.hsa", "2024-03-30.idx",
+                                           "2024-03-31.hsa", "2024-03-31.idx", "notes.txt"]
+    # the day being written is never deleted
+    assert prune(str(tmp_path), today.isoformat(), 1, 1) == ["2024-03-30"]
+    assert sorted(os.listdir(tmp_path)) == ["2024-03-31.hsa", "2024-03-31.idx", "notes.txt"]
@@ -0,0 +1,42 @@
+from src.host.report_plan import ReportPlanStore, plan_diff, plan_entries, plan_hash
+
+SUBSCRIBE = [
+    {"CEID": 10, "DVS": [1, 2], "REPORT_ID": 1000},
+    {"CEID": 20, "DVS": [3], "REPORT_ID": 2000},
+]
+
+
+def test_plan_entries_by_report_id():
+    assert plan_entries(SUBSCRIBE) == {"1000": {"CEID": 10, "DVS": [1, 2]},
+                                       "2000": {"CEID": 20, "DVS": [3]}}
+
+
+def test_plan_hash_ignores_order():
+    entries = plan_entries(SUBSCRIBE)
+    assert plan_hash(entries) == plan_hash(plan_entries(list(reversed(SUBSCRIBE))))
+    assert plan_hash(entries) != plan_hash({**entries, "2000": {"CEID": 20, "DVS": [4]}})
+
+
+def test_plan_diff():
+    applied = {"1": {"CEID": 10, "DVS": [1]}, "2": {"CEID": 20, "DVS": [2]},
+               "3": {"CEID": 30, "DVS": [3]}}
+    desired = {"1": {"CEID": 10, "DVS": [1]}, "2": {"CEID": 20, "DVS": [2, 5]},
+               "4": {"CEID": 40, "DVS": [4]}}
+
+    remove, add = plan_diff(applied, desired)
+
+    assert sorted(remove) == ["2", "3"]
+    assert sorted(add) == ["2", "4"]
+    assert plan_diff(desired, desired) == ([], [])
+
+
+def test_store_rejects_record_with_wrong_hash(tmp_path):
+    store = ReportPlanStore(str(tmp_path))
+    store.save("EQ1", plan_entries(SUBSCRIBE))
+    assert store.load("EQ1")["reports"] == plan_entries(SUBSCRIBE)
+
+    path = tmp_path / "EQ1.json"
+    path.write_text(path.read_text().replace('"CEID": 10', '"CEID": 11'))
+    assert store.load("EQ1") is None
+    store.clear("EQ1")
+    assert store.load("EQ1") is None
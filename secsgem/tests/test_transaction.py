@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import secsgem.secs
+
+from src.host.transaction import (PRIORITY_BULK, PRIORITY_CRITICAL, PRIORITY_NORMAL,
+                                  SecsTransactionPool)
+
+STREAMS_FUNCTIONS = secsgem.secs.functions.StreamsFunctions()
+
+
+class FakeProtocol:
+    """Protocol internals used by the transaction pool, sent messages are recorded"""
+
+    def __init__(self):
+        self._response_queues = {}
+        self._communication_logger = logging.getLogger("communication")
+        self.sent = []
+        self._counter = 0
+
+    def get_next_system_counter(self):
+        self._counter += 1
+        return self._counter
+
+    def _create_message_for_function(self, function, system_id):
+        return (system_id, function)
+
+    def _get_log_extra(self):
+        return {}
+
+    def send_message(self, message):
+        self.sent.append(message)
+        return True
+
+    def reply(self, system_id, message="reply"):
+        """Deliver a reply the way the HSMS protocol does"""
+        self._response_queues[system_id].put_nowait(message)
+
+
+def make_pool(window=1, t3=5.0):
+    protocol = FakeProtocol()
+    gem_host = SimpleNamespace(protocol=protocol, equipment_name="EQ1",
+                               settings=SimpleNamespace(timeouts=SimpleNamespace(t3=t3)),
+                               record_transaction=lambda *args, **kwargs: None)
+    return SecsTransactionPool(gem_host, window), protocol
+
+
+def s1f3(vid=1):
+    return STREAMS_FUNCTIONS.function(1, 3)([vid])
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_reply_resolves_transaction_and_frees_slot():
+    pool, protocol = make_pool(window=2)
+    first = pool.submit(s1f3(1))
+    second = pool.submit(s1f3(2))
+    assert pool.in_flight == 2
+    assert [system_id for system_id, _ in protocol.sent] == [first.system_id, second.system_id]
+
+    protocol.reply(second.system_id, "second")
+    protocol.reply(first.system_id, "first")
+
+    assert first.wait() == "first"
+    assert second.wait() == "second"
+    assert pool.in_flight == 0
+    assert protocol._response_queues == {}
+
+
+def test_window_full_without_waiting_returns_none():
+    pool, protocol = make_pool(window=1)
+    first = pool.submit(s1f3())
+    assert pool.submit(s1f3(), wait_slot=False) is None
+    assert len(protocol.sent) == 1
+
+    protocol.reply(first.system_id)
+    assert pool.submit(s1f3(), wait_slot=False) is not None
+
+
+def test_waiting_senders_get_the_slot_by_priority():
+    pool, protocol = make_pool(window=1)
+    first = pool.submit(s1f3(), priority=PRIORITY_NORMAL)
+    order = []
+
+    def send(priority):
+        order.append((priority, pool.submit(s1f3(), priority=priority)))
+
+    bulk = threading.Thread(target=send, args=(PRIORITY_BULK,))
+    bulk.start()
+    wait_until(lambda: pool.waiting["bulk"] == 1)
+    critical = threading.Thread(target=send, args=(PRIORITY_CRITICAL,))
+    critical.start()
+    wait_until(lambda: pool.waiting["critical"] == 1)
+
+    protocol.reply(first.system_id)
+    wait_until(lambda: len(order) == 1)
+    assert order[0][0] == PRIORITY_CRITICAL
+
+    protocol.reply(order[0][1].system_id)
+    bulk.join(2)
+    critical.join(2)
+    assert [priority for priority, _ in order] == [PRIORITY_CRITICAL, PRIORITY_BULK]
+
+
+def test_thread_priority_raises_message_priority():
+    pool, _ = make_pool(window=1)
+    with pool.priority(PRIORITY_CRITICAL):
+        with pool.priority(PRIORITY_BULK):
+            assert pool._local.priority == PRIORITY_CRITICAL
+    assert pool._local.priority is None
+
+
+def test_cancel_all_releases_waiting_callers():
+    pool, protocol = make_pool(window=2)
+    transactions = [pool.submit(s1f3()), pool.submit(s1f3())]
+
+    pool.cancel_all()
+
+    assert [transaction.wait() for transaction in transactions] == [None, None]
+    assert {transaction.reason for transaction in transactions} == {"connection_closed"}
+    assert pool.in_flight == 0
+    assert protocol._response_queues == {}
+    # a late reply of a cancelled transaction is ignored
+    transactions[0].put_nowait("late")
+    assert transactions[0].result() is None
+    assert pool.submit(s1f3(), wait_slot=False) is not None
+
+
+def test_unanswered_transaction_times_out():
+    pool, _ = make_pool(window=1, t3=0.05)
+    transaction = pool.submit(s1f3())
+
+    assert transaction.wait() is None
+    assert transaction.reason == "t3"
+    assert pool.in_flight == 0